@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from xpdacq.glbl import glbl
+import xpdacq.analysis as analysis
+from xpdacq.analysis import (_header_cache, _cached_search, _cached_uid_search,
+                             header_cache_stats, clear_header_cache)
+
+def _header(uid, closed=True):
+    header = {'start': {'uid': uid}, 'stop': {'uid': uid + '_stop'} if closed else {}}
+    return header
+
+class HeaderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_size = glbl.header_cache_size
+        self.cache_ttl = glbl.header_cache_ttl
+        clear_header_cache()
+        _header_cache._stats = dict.fromkeys(_header_cache._stats, 0)
+
+    def tearDown(self):
+        glbl.header_cache_size = self.cache_size
+        glbl.header_cache_ttl = self.cache_ttl
+        clear_header_cache()
+
+    def test_lru_and_stats(self):
+        glbl.header_cache_size = 2
+        calls = []
+        def func(key):
+            return lambda: calls.append(key) or key
+        self.assertEqual(_header_cache.get('a', func('a')), 'a')
+        _header_cache.get('b', func('b'))
+        # a is used again, so b is the least recently used
+        _header_cache.get('a', func('a'))
+        _header_cache.get('c', func('c'))
+        _header_cache.get('a', func('a'))
+        _header_cache.get('b', func('b'))
+        self.assertEqual(calls, ['a', 'b', 'c', 'b'])
+        stats = header_cache_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['size'], 2)
+
+    def test_ttl(self):
+        calls = []
+        func = lambda: calls.append(1) or len(calls)
+        self.assertEqual(_header_cache.get('a', func), 1)
+        self.assertEqual(_header_cache.get('a', func), 1)
+        glbl.header_cache_ttl = 0
+        self.assertEqual(_header_cache.get('a', func), 2)
+        self.assertEqual(header_cache_stats()['expired'], 1)
+
+    def test_cached_search(self):
+        results = [_header('old'), _header('open', closed=False)]
+        # every query hands out new header objects
+        db = MagicMock(side_effect=lambda **kwargs: [dict(h) for h in results])
+        with patch.object(analysis, 'db', db):
+            first = _cached_search(group='XPD')
+            # a new run shows up right away, the query is not cached
+            results.append(_header('new'))
+            second = _cached_search(group='XPD')
+            self.assertEqual(db.call_count, 2)
+            self.assertEqual(len(second), 3)
+            # a new list every time, headers of finished runs are shared
+            self.assertIsNot(first, second)
+            self.assertIs(second[0], first[0])
+            # open runs are never cached
+            self.assertIsNot(second[1], first[1])
+        self.assertEqual(header_cache_stats()['size'], 2)
+
+    def test_cached_uid_search(self):
+        results = [_header('dark')]
+        db = MagicMock(side_effect=lambda **kwargs: [dict(h) for h in results])
+        with patch.object(analysis, 'db', db):
+            first = _cached_uid_search('sc_dark_uid', 'abc')
+            second = _cached_uid_search('sc_dark_uid', 'abc')
+            # the dark of a scan is looked up once
+            db.assert_called_once_with(group='XPD', sc_dark_uid='abc')
+            self.assertEqual(second, first)
+            self.assertIsNot(second, first)
+            # nothing found, or a run still open, is queried again
+            results[:] = []
+            _cached_uid_search('sc_dark_uid', 'def')
+            results[:] = [_header('open', closed=False)]
+            _cached_uid_search('sc_dark_uid', 'def')
+            self.assertEqual(len(_cached_uid_search('sc_dark_uid', 'def')), 1)
+            self.assertEqual(db.call_count, 4)
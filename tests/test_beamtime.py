@@ -7,6 +7,10 @@ from xpdacq.beamtime import XPD,Beamtime
 from xpdacq.glbl import glbl
 from xpdacq.beamtime import _clean_name,_clean_md_input,_update_objlist,_get_yaml_list,_get_hidden_list
 from xpdacq.beamtime import *
+from xpdacq.beamtime import _get_acqobj_index, migrate_acqobj_store
+import io
+from contextlib import redirect_stdout
+from unittest.mock import patch
 
 class NewExptTest(unittest.TestCase):
 
@@ -54,9 +58,45 @@ class NewExptTest(unittest.TestCase):
     def test_yaml_path(self):
     	self.fail('need a test for _yaml_path')
 
-    @unittest.expectedFailure
     def test_loadyamls(self):
-        self.fail('need a test for loadyamls')
+        olist = self.bt.loadyamls()
+        self.assertEqual([el.type for el in olist], ['bt','ex','sa']+['sp']*6)
+        self.assertEqual(olist[0].md['bt_uid'], self.bt.md['bt_uid'])
+        self.assertTrue(isinstance(olist[1], Experiment))
+        self.assertEqual(olist[1].bt.md['bt_safN'], self.saf_num)
+        # objects are stored as plain dicts
+        fpath = os.path.join(glbl.yaml_dir, 'sp_ct_5.yml')
+        with open(fpath, 'r') as f:
+            obj_dict = yaml.safe_load(f)
+        self.assertEqual(obj_dict['class'], 'ScanPlan')
+        self.assertEqual(obj_dict['md']['sp_params'], {'exposure':5.0})
+        # files pickled by older versions are not read as is
+        sp = olist[6]
+        # md of older versions was a plain dict
+        sp.md = dict(sp.md)
+        with open(fpath, 'w') as f:
+            yaml.dump(sp, f, Dumper=yaml.Dumper)
+        self.assertRaises(SystemExit, self.bt.loadyamls)
+        # but converted once by the migration
+        trap = os.path.join(glbl.yaml_dir, 'trap')
+        evil = os.path.join(glbl.yaml_dir, 'sp_evil.yml')
+        with open(evil, 'w') as f:
+            f.write("!!python/object/apply:os.mkdir ['{}']\n".format(trap))
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(migrate_acqobj_store(), ['sp_ct_5.yml'])
+        # anything but acquire objects is refused, nothing is run
+        self.assertFalse(os.path.exists(trap))
+        olist2 = self.bt.loadyamls()
+        self.assertTrue(isinstance(olist2[6], ScanPlan))
+        self.assertEqual(olist2[6].md, sp.md)
+        with open(fpath, 'r') as f:
+            obj_dict = yaml.safe_load(f)
+        self.assertEqual(obj_dict['class'], 'ScanPlan')
+        with open(evil, 'w') as f:
+            f.write("!!python/object:xpdacq.glbl.glbl {}\n")
+        with redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(migrate_acqobj_store(), [])
+        self.assertTrue('sp_evil.yml is not converted' in out.getvalue())
 
     def test_yamify(self):
         xpdobj = XPD()
@@ -162,6 +202,32 @@ class NewExptTest(unittest.TestCase):
         newobjlist = _get_yaml_list()
         self.assertEqual(newobjlist,self.stbt_list+['ex_myexp.yml','sa_mysample.yml','sa_yoursample.yml'])
 
+    def test_import_sample_sheet(self):
+        ex = Experiment('myexp',self.bt)
+        sa = Sample('your sample',ex)
+        os.makedirs(glbl.import_dir, exist_ok=True)
+        with open(os.path.join(glbl.import_dir, 'samples.csv'), 'w') as f:
+            f.write('name,composition,position\n'
+                    'Ni std,Ni,1\n'
+                    ' your sample,Ca(OH)2,2\n'
+                    'NaCl,NaCl,\n')
+        samples = import_sample_sheet(ex)
+        self.assertEqual([el.name for el in samples], ['Ni std', 'your sample', 'NaCl'])
+        # existing sample keeps its uid
+        self.assertEqual(samples[1].md['sa_uid'], sa.md['sa_uid'])
+        self.assertEqual(samples[0].md['sa_usermd'], {'composition': 'Ni', 'position': '1'})
+        self.assertEqual(samples[2].md['sa_usermd'], {'composition': 'NaCl'})
+        self.assertEqual(samples[0].md['ex_name'], 'myexp')
+        self.assertEqual(_get_yaml_list(), self.stbt_list+['ex_myexp.yml','sa_yoursample.yml',
+                                                           'sa_Nistd.yml','sa_NaCl.yml'])
+        self.assertEqual(_get_acqobj_index()['sa_NaCl.yml']['uid'], samples[2].md['sa_uid'])
+        self.assertEqual(XPD.get(len(self.stbt_list)+2).md['sa_uid'], samples[0].md['sa_uid'])
+        # a bad row leaves the store untouched
+        with open(os.path.join(glbl.import_dir, 'samples.csv'), 'a') as f:
+            f.write('LaB6,LaB6,3\nbad,nacl,4\n')
+        self.assertRaises(SystemExit, import_sample_sheet, ex, 'samples.csv')
+        self.assertFalse('sa_LaB6.yml' in _get_yaml_list())
+
     def test_make_scanPlan(self):
         self.sp = ScanPlan('ct',{'exposure':0.7})
         self.assertIsInstance(self.sp,ScanPlan)
@@ -211,6 +277,27 @@ class NewExptTest(unittest.TestCase):
         hidden_list3 = _get_hidden_list() 
         self.assertEqual(hidden_list3,[])
 
+    def test_list(self):
+        self.bt.hide(1)
+        self.bt.hide(1)
+        self.assertEqual(_get_hidden_list(), [1])
+        f = io.StringIO()
+        # only the index is read, no object is loaded
+        with patch('xpdacq.beamtime._load_acqobj') as load, redirect_stdout(f):
+            self.bt.list()
+            self.bt.list(type='sp')
+            self.bt.list(hidden=True)
+        self.assertFalse(load.called)
+        out = f.getvalue()
+        self.assertEqual(out.count('ex object l-user'), 1) # hidden in the first listing
+        self.assertEqual(out.count('sp object'), 12)
+        self.assertEqual(out.count('sa object'), 1)
+        # a store without index is indexed on first listing
+        os.remove(os.path.join(glbl.yaml_dir, '_acqobj_index.yml'))
+        with redirect_stdout(io.StringIO()):
+            self.bt.list()
+        self.assertEqual(len(_get_acqobj_index()), len(self.stbt_list))
+
     def test_set_wavelength(self):
         wavelength = .18448
         self.bt = Beamtime('test',123)
@@ -237,6 +324,92 @@ class NewExptTest(unittest.TestCase):
         self.assertRaises(TypeError, lambda: Scan(1, 'ct10s')) # give Beamtime but not Sample
         self.assertRaises(TypeError, lambda: Scan(8, 5)) # give two ScanPlan
 
+    def test_Scan_reference(self):
+        sa = self.bt.get(2)
+        sp = self.bt.get(5)
+        # by name, index and uid, in a mix way
+        sc1 = Scan('l-user', 'ct_1')
+        sc2 = Scan(2, 5)
+        sc3 = Scan(sa.md['sa_uid'], sp.md['sp_uid'])
+        for sc in (sc1, sc2, sc3):
+            self.assertEqual(sc.md['sa_uid'], sa.md['sa_uid'])
+            self.assertEqual(sc.md['sp_uid'], sp.md['sp_uid'])
+        # uid of another type of object is not accepted
+        self.assertRaises(SystemExit, lambda: Scan(sp.md['sp_uid'], 'ct_1'))
+        # repeated references are parsed from memory while the file is
+        # unchanged, but every lookup gets its own object
+        (sp1, sp2) = (Scan('l-user', 'ct_1').sp, Scan(2, 5).sp)
+        self.assertFalse(sp1 is sp2)
+        self.assertEqual(sp1.md['sp_uid'], sp2.md['sp_uid'])
+        sp1.md.update({'sp_params': 'changed'})
+        sp1.name = 'changed'
+        self.assertEqual(self.bt.get(5).name, sp.name)
+        self.assertEqual(self.bt.get(5).md['sp_params'], sp.md['sp_params'])
+        sa2 = Sample('l-user', self.bt.get(1), composition='NaCl')
+        sc4 = Scan('l-user', 'ct_1')
+        self.assertEqual(sc4.md['sa_usermd'], {'composition':'NaCl'})
+        self.assertEqual(sc4.md['sa_uid'], sa.md['sa_uid'])
+
+    def test_interned_ScanPlan(self):
+        sp = ScanPlan('ct_7')
+        fpath = os.path.join(glbl.yaml_dir, 'sp_ct_7.yml')
+        mtime = os.path.getmtime(fpath)
+        f = io.StringIO()
+        with redirect_stdout(f):
+            sp2 = ScanPlan('ct', {'exposure':7}, quiet=True)
+        # nothing printed or written, but an object of its own
+        self.assertFalse(sp2 is sp)
+        self.assertEqual(sp2.md, sp.md)
+        self.assertEqual(sp2.name, sp.name)
+        self.assertEqual(f.getvalue(), '')
+        # changing one doesn't leak into the others
+        sp.md['sp_tag'] = 'mine'
+        sp.sp_params['exposure'] = 70
+        sp2.sp_params['exposure'] = 0.7
+        sp5 = ScanPlan('ct_7', quiet=True)
+        self.assertFalse('sp_tag' in sp2.md or 'sp_tag' in sp5.md)
+        self.assertEqual(sp5.sp_params, {'exposure': 7.0})
+        self.assertEqual(sp5.md['sp_params'], {'exposure': 7.0})
+        self.assertEqual(os.path.getmtime(fpath), mtime)
+        # a different option is a different ScanPlan, writing the same file
+        sp3 = ScanPlan('ct_7', dk_window=5)
+        self.assertFalse(sp3 is sp)
+        self.assertEqual(sp3.md['sp_uid'], sp.md['sp_uid'])
+        # file has changed since, so sp is not handed back anymore
+        sp4 = ScanPlan('ct_7')
+        self.assertFalse(sp4 is sp)
+        self.assertEqual(sp4.md['sp_dk_window'], glbl.dk_window)
+        self.assertEqual(Scan('l-user', 'ct_7').md['sp_dk_window'], glbl.dk_window)
+
+    def test_layered_md(self):
+        ex = Experiment('myexp', self.bt)
+        sa = Sample('mysample', ex)
+        # children don't write into their parents' md
+        self.assertFalse('ex_name' in self.bt.md)
+        self.assertFalse('sa_name' in ex.md)
+        self.assertEqual(sa.md['bt_safN'], self.saf_num)
+        # but see changes made to them
+        self.bt.set_wavelength(0.25)
+        self.assertEqual(sa.md['bt_wavelength'], 0.25)
+        sc = Scan(sa, 'ct_5')
+        snapshot = sc.md.snapshot()
+        self.assertTrue(isinstance(snapshot, dict))
+        self.assertEqual(snapshot['sa_name'], 'mysample')
+        self.assertEqual(snapshot['sp_name'], 'ct_5')
+        self.assertTrue(sc.md.snapshot() is snapshot)
+        # writes to unrelated objects keep it, writes to a parent don't
+        Sample('other', ex).md['sa_tag'] = 1
+        self.assertTrue(sc.md.snapshot() is snapshot)
+        sa.md['sa_tag'] = 2
+        self.assertEqual(sc.md.snapshot()['sa_tag'], 2)
+        snapshot = sc.md.snapshot()
+        sc.md.update({'sc_isprun': True})
+        self.assertFalse('sc_isprun' in sa.md or 'sc_isprun' in sc.sp.md)
+        self.assertTrue(sc.md.snapshot()['sc_isprun'])
+        # stored files still have the full md
+        sa2 = Scan('mysample', 'ct_5').sa
+        self.assertEqual(sa2.md['ex_name'], 'myexp')
+
     def test_auto_naming_ScanPlan(self):
         # wrong ScanPlan type
         self.assertRaises(SystemExit, lambda: ScanPlan('MRI_5_300_200_5'))
@@ -253,6 +426,8 @@ class NewExptTest(unittest.TestCase):
         self.assertRaises(SystemExit, lambda: ScanPlan('Tramp_5_300_200_5_1111')) # extra argument
         self.assertRaises(SystemExit, lambda: ScanPlan('tseries_5_60')) # incomplete arguments
         self.assertRaises(SystemExit, lambda: ScanPlan('tseries_5_60_10_1111')) # extra argument
+        self.assertRaises(SystemExit, lambda: ScanPlan('ftseries_5')) # incomplete arguments
+        self.assertRaises(SystemExit, lambda: ScanPlan('ftseries_5_60_10')) # extra argument
         # additional unit
         self.assertRaises(SystemExit, lambda: ScanPlan('ct_5s'))
         self.assertRaises(SystemExit, lambda: ScanPlan('Tramp_5s_300k_200_5'))
@@ -283,3 +458,39 @@ class NewExptTest(unittest.TestCase):
         self.assertEqual(200, self.sp3.sp_params['endingT'])
         self.assertEqual(300, self.sp3.sp_params['startingT'])
         self.assertEqual(2, self.sp3.sp_params['Tstep'])
+
+    def test_ftseries_ScanPlan(self):
+        sp = ScanPlan('ftseries_0.5_100')
+        self.assertEqual(sp.scanplan, 'ftseries')
+        self.assertEqual(sp.sp_params, {'exposure':0.5, 'num':100})
+        sp2 = ScanPlan('ftseries', {'exposure':0.5, 'num':100})
+        self.assertEqual(sp2.name, 'ftseries_0.5_100')
+        self.assertEqual(sp.md['sp_uid'], sp2.md['sp_uid'])
+        # num needs to be an integer
+        self.assertRaises(SystemExit, lambda: ScanPlan('ftseries', {'exposure':0.5, 'num':10.5}))
+
+    def test_Tcont_ScanPlan(self):
+        sp = ScanPlan('Tcont_2.5_300_100_2')
+        self.assertEqual(sp.scanplan, 'Tcont')
+        self.assertEqual(sp.sp_params, {'exposure':2.5, 'startingT':300,
+                                        'endingT':100, 'ramp_rate':2})
+        sp2 = ScanPlan('Tcont', {'exposure':2.5, 'startingT':300,
+                                 'endingT':100, 'ramp_rate':2})
+        self.assertEqual(sp2.name, 'Tcont_2.5_300_100_2')
+        # ramp_rate is required and needs to be positive
+        self.assertRaises(SystemExit, lambda: ScanPlan('Tcont', {'exposure':2.5, 'startingT':300, 'endingT':100}))
+        self.assertRaises(SystemExit, lambda: ScanPlan('Tcont_2.5_300_100_0'))
+
+    def test_Tadapt_ScanPlan(self):
+        sp = ScanPlan('Tadapt_2.5_300_100_5')
+        self.assertEqual(sp.scanplan, 'Tadapt')
+        self.assertEqual(sp.sp_params, {'exposure':2.5, 'startingT':300,
+                                        'endingT':100, 'Tstep':5})
+        sp2 = ScanPlan('Tadapt_2.5_300_100_5_0.5')
+        self.assertEqual(sp2.sp_params['Tstep_min'], 0.5)
+        sp3 = ScanPlan('Tadapt', {'exposure':2.5, 'startingT':300,
+                                  'endingT':100, 'Tstep':5, 'Tstep_min':0.5})
+        self.assertEqual(sp3.name, 'Tadapt_2.5_300_100_5_0.5')
+        # Tstep_min has to be positive and no larger than Tstep
+        self.assertRaises(SystemExit, lambda: ScanPlan('Tadapt_2.5_300_100_5_10'))
+        self.assertRaises(SystemExit, lambda: ScanPlan('Tadapt_2.5_300_100_5_0'))
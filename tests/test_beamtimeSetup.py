@@ -1,13 +1,18 @@
 import unittest
 import os
 import shutil
+import tarfile
+import threading
+import asyncio
+from unittest.mock import MagicMock
 import yaml
 from time import strftime
 from xpdacq.glbl import glbl
 import xpdacq.beamtimeSetup as bts
 from xpdacq.beamtimeSetup import _make_clean_env,_start_beamtime,_end_beamtime,_execute_start_beamtime,_check_empty_environment,_load_bt, _execute_end_beamtime, _delete_home_dir_tree
 from xpdacq.beamtime import Beamtime,_get_yaml_list
-from xpdacq.utils import export_userScriptsEtc, import_userScriptsEtc
+from xpdacq.utils import export_userScriptsEtc, import_userScriptsEtc, composition_analysis, composition_arrays
+from xpdacq.utils import run_control, _RE_state_wrapper, _check_queue_control, _peek_control, _take_control, _ControlWatcher
 
 class NewBeamtimeTest(unittest.TestCase): 
 
@@ -245,6 +250,54 @@ class NewBeamtimeTest(unittest.TestCase):
         self.assertTrue(os.path.isdir(exception_dir_name))
 
 
+    def test_import_exported_archive(self):
+        os.makedirs(glbl.import_dir, exist_ok = True)
+        os.makedirs(glbl.usrScript_dir, exist_ok = True)
+        os.makedirs(glbl.yaml_dir, exist_ok = True)
+        with open(os.path.join(glbl.usrScript_dir, 'script.py'), 'w') as f:
+            f.write('print(1)')
+        open(os.path.join(glbl.yaml_dir, 'touched.yml'), 'a').close()
+        tar_f_path = export_userScriptsEtc()
+        shutil.move(tar_f_path, glbl.import_dir)
+        # zip archive next to it, both are read without unpacking into Import/
+        zip_base = os.path.join(glbl.home, 'masks')
+        open(os.path.join(glbl.home, 'mask.npy'), 'a').close()
+        shutil.make_archive(zip_base, 'zip', glbl.home, 'mask.npy')
+        shutil.move(zip_base + '.zip', glbl.import_dir)
+        os.remove(os.path.join(glbl.usrScript_dir, 'script.py'))
+        moved_list = import_userScriptsEtc()
+        self.assertTrue(os.path.join(glbl.usrScript_dir, 'script.py') in moved_list)
+        self.assertTrue(os.path.join(glbl.yaml_dir, 'touched.yml') in moved_list)
+        self.assertTrue(os.path.join(glbl.config_base, 'mask.npy') in moved_list)
+        with open(os.path.join(glbl.usrScript_dir, 'script.py')) as f:
+            self.assertEqual(f.read(), 'print(1)')
+        # nothing but the archives in Import/
+        self.assertEqual(sorted(os.listdir(glbl.import_dir)),
+                         sorted([os.path.basename(tar_f_path), 'masks.zip']))
+
+    def test_import_same_named_members(self):
+        os.makedirs(glbl.import_dir, exist_ok = True)
+        src = os.path.join(glbl.home, 'src')
+        for (a_name, dirs) in [('a_first', ['x', 'y']), ('b_second', ['x', 'y'])]:
+            for d in dirs:
+                os.makedirs(os.path.join(src, a_name, d), exist_ok = True)
+                with open(os.path.join(src, a_name, d, 'script.py'), 'w') as f:
+                    f.write('{}/{}'.format(a_name, d))
+            shutil.make_archive(os.path.join(glbl.import_dir, a_name), 'gztar',
+                                os.path.join(src, a_name))
+        for i in range(5):
+            moved_list = import_userScriptsEtc()
+            self.assertEqual(moved_list, [os.path.join(glbl.usrScript_dir, 'script.py')])
+            # last member of the last archive
+            with open(os.path.join(glbl.usrScript_dir, 'script.py')) as f:
+                self.assertEqual(f.read(), 'b_second/y')
+            # no temporary files left behind
+            self.assertEqual(os.listdir(glbl.usrScript_dir), ['script.py'])
+        # not readable by the owner only, as the temporary file was
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(moved_list[0]).st_mode & 0o777, 0o666 & ~umask)
+
     def test_export_userScriptsEtc(self):
         os.makedirs(glbl.usrScript_dir, exist_ok = True)
         os.makedirs(glbl.yaml_dir, exist_ok = True)
@@ -264,3 +317,122 @@ class NewBeamtimeTest(unittest.TestCase):
         # are files in unpacked dirs?
         self.assertTrue('script.py' in os.listdir(os.path.join(glbl.home, userScript_dir_tail)))
         self.assertTrue('touched.yml' in os.listdir(os.path.join(glbl.home, config_base_tail, yaml_dir_tail)))
+
+    def test_composition_analysis(self):
+        self.assertEqual(composition_analysis('La0.5 Ca0.5 Mn O3'),
+                         (['La', 'Ca', 'Mn', 'O'], [0.5, 0.5, 1.0, 3.0]))
+        self.assertEqual(composition_analysis('Mg3(PO4)2'),
+                         (['Mg', 'P', 'O'], [3.0, 2.0, 8.0]))
+        self.assertEqual(composition_analysis('CuSO4*5H2O'),
+                         (['Cu', 'S', 'O', 'H'], [1.0, 1.0, 9.0, 10.0]))
+        for bad in ('nacl', 'Ca(OH', 'CaOH)2'):
+            self.assertRaises(ValueError, composition_analysis, bad)
+        (elements, amounts) = composition_arrays(['NaCl', 'Ca(OH)2', 'NaCl'])
+        self.assertEqual(elements, ['Na', 'Cl', 'Ca', 'O', 'H'])
+        self.assertEqual(amounts.tolist(), [[1, 1, 0, 0, 0], [0, 0, 1, 2, 2],
+                                            [1, 1, 0, 0, 0]])
+
+    def test_incremental_export(self):
+        os.makedirs(glbl.usrScript_dir, exist_ok = True)
+        os.makedirs(glbl.yaml_dir, exist_ok = True)
+        for f_name in ('a.py', 'b.py', 'c.py'):
+            with open(os.path.join(glbl.usrScript_dir, f_name), 'w') as f:
+                f.write(f_name)
+        full_path = export_userScriptsEtc()
+        # nothing changed, nothing to export
+        self.assertEqual(export_userScriptsEtc(incremental=True), None)
+        with open(os.path.join(glbl.usrScript_dir, 'a.py'), 'w') as f:
+            f.write('changed')
+        os.utime(os.path.join(glbl.usrScript_dir, 'b.py')) # touched only
+        os.remove(os.path.join(glbl.usrScript_dir, 'c.py'))
+        open(os.path.join(glbl.usrScript_dir, 'd.py'), 'a').close()
+        delta_path = export_userScriptsEtc(incremental=True, compress=True)
+        self.assertTrue(delta_path.endswith('.tar.gz'))
+        script_tail = os.path.basename(glbl.usrScript_dir)
+        with tarfile.open(delta_path) as tf:
+            self.assertEqual(sorted(tf.getnames()),
+                             [os.path.join(script_tail, 'a.py'),
+                              os.path.join(script_tail, 'd.py'),
+                              'userScriptsEtc_index.yml'])
+            index = yaml.safe_load(tf.extractfile('userScriptsEtc_index.yml'))
+        full_name = os.path.basename(full_path)
+        delta_name = os.path.basename(delta_path)
+        self.assertEqual(index['archives'], [full_name, delta_name])
+        self.assertEqual({k: v['archive'] for (k, v) in index['files'].items()
+                          if k.startswith(script_tail)},
+                         {os.path.join(script_tail, 'a.py'): delta_name,
+                          os.path.join(script_tail, 'b.py'): full_name,
+                          os.path.join(script_tail, 'd.py'): delta_name})
+
+    def test_run_control(self):
+        poll_interval = glbl.control_poll_interval
+        glbl.control_poll_interval = 0.01
+        try:
+            RE = MagicMock()
+            RE.state = 'paused'
+            RE.resume.side_effect = lambda: setattr(RE, 'state', 'idle')
+            run_control('resume')
+            _RE_state_wrapper(RE)
+            RE.resume.assert_called_once_with()
+            self.assertFalse(os.path.isfile(glbl.control_token))
+            # paused scan waits for a command from somewhere else
+            RE.state = 'paused'
+            RE.abort.side_effect = lambda: setattr(RE, 'state', 'idle')
+            threading.Timer(0.1, run_control, ['abort']).start()
+            _RE_state_wrapper(RE)
+            RE.abort.assert_called_once_with()
+            RE.state = 'paused'
+            run_control('abort_all')
+            self.assertRaises(SystemExit, _RE_state_wrapper, RE)
+            # in between scans
+            run_control('pause')
+            threading.Timer(0.1, run_control, ['resume']).start()
+            _check_queue_control()
+            self.assertFalse(os.path.isfile(glbl.control_token))
+            run_control('abort_all')
+            self.assertRaises(SystemExit, _check_queue_control)
+            self.assertRaises(ValueError, run_control, 'halt')
+            # unknown words are discarded, an empty token is left to be written
+            with open(glbl.control_token, 'w') as f:
+                f.write('halt\n')
+            self.assertIsNone(_peek_control())
+            self.assertFalse(os.path.isfile(glbl.control_token))
+            open(glbl.control_token, 'w').close()
+            self.assertIsNone(_peek_control())
+            self.assertIsNone(_take_control())
+            self.assertFalse(os.path.isfile(glbl.control_token))
+            with open(glbl.control_token, 'w') as f:
+                f.write('halt')
+            _check_queue_control()
+            self.assertFalse(os.path.isfile(glbl.control_token))
+        finally:
+            glbl.control_poll_interval = poll_interval
+
+    def test_control_watcher(self):
+        poll_interval = glbl.control_poll_interval
+        glbl.control_poll_interval = 0.01
+        loop = asyncio.new_event_loop()
+        RE = MagicMock()
+        RE.state = 'running'
+        RE.loop = loop
+        threads = []
+        def request_pause():
+            threads.append(threading.current_thread())
+            RE.state = 'paused'
+            loop.stop()
+        RE.request_pause.side_effect = request_pause
+        try:
+            run_control('pause')
+            _ControlWatcher(RE)
+            # give up after a while rather than hang
+            loop.call_later(5, loop.stop)
+            loop.run_forever()
+            # asked from the watcher thread, run on the loop of the run engine
+            self.assertEqual(threads, [threading.current_thread()])
+            # the command is left for _RE_state_wrapper
+            self.assertEqual(_peek_control(), 'pause')
+            _take_control()
+        finally:
+            RE.state = 'idle'
+            loop.close()
+            glbl.control_poll_interval = poll_interval
@@ -0,0 +1,63 @@
+import unittest
+import threading
+import time
+from unittest.mock import patch
+import numpy as np
+from xpdacq.glbl import glbl
+from xpdacq.callbacks import FrameStats, frame_stats
+
+class FrameStatsTest(unittest.TestCase):
+    def test_frame_stats(self):
+        img = np.ones((64, 64))
+        img[:8, :8] = glbl.saturation_count
+        stats = frame_stats(img)
+        # every 4th pixel in each direction: 2x2 of 16x16 are saturated
+        self.assertAlmostEqual(stats['saturation'], 4 / 256)
+        self.assertEqual(stats['max'], glbl.saturation_count)
+        self.assertTrue(stats['saturated'])
+        self.assertFalse(frame_stats(np.ones((64, 64)))['saturated'])
+
+    def test_callback(self):
+        cb = FrameStats()
+        cb('start', {'uid': 'abc'})
+        means = [10., 12., 14., 16.]
+        for (i, m) in enumerate(means):
+            cb('event', {'seq_num': i + 1,
+                         'data': {'pe1_image': np.full((32, 32), m),
+                                  'temperature': 300}})
+        cb('event', {'seq_num': 5, 'data': {'temperature': 300}})
+        cb('stop', {'exit_status': 'success'})
+        cb.join(5)
+        summary = cb.summary()
+        self.assertEqual(summary['num_frames'], 4)
+        self.assertAlmostEqual(summary['mean'], np.mean(means))
+        self.assertAlmostEqual(summary['std'], np.std(means, ddof=1))
+        self.assertEqual(summary['max'], 16.)
+        self.assertEqual(summary['saturated_frames'], [])
+
+    def test_back_to_back_scans(self):
+        cb = FrameStats(maxsize=2)
+        summaries = []
+        # a slow summary, the next scan must not reset the counters under it
+        cb._print_summary = lambda: time.sleep(0.1) or summaries.append(cb.summary())
+        gate = threading.Event()
+        with patch('xpdacq.callbacks._frame',
+                   side_effect=lambda value: gate.wait(5) and value):
+            cb('start', {'uid': 'first'})
+            for i in range(4):
+                cb('event', {'seq_num': i + 1,
+                             'data': {'pe1_image': np.full((8, 8), 10.)}})
+            cb('stop', {'exit_status': 'success'})
+            # the worker is still busy with the first scan when the next starts
+            threading.Timer(0.2, gate.set).start()
+            cb('start', {'uid': 'second'})
+            self.assertEqual(len(summaries), 1)
+            for i in range(3):
+                cb('event', {'seq_num': i + 1,
+                             'data': {'pe1_image': np.full((8, 8), 20.)}})
+            cb('stop', {'exit_status': 'success'})
+            cb.join(5)
+        # every frame is either analyzed or skipped, in its own scan
+        self.assertEqual([s['num_frames'] + s['skipped'] for s in summaries], [4, 3])
+        self.assertEqual([s['mean'] for s in summaries], [10., 20.])
+        self.assertTrue(summaries[0]['skipped'] >= 1)
@@ -12,12 +12,83 @@ import copy
 from xpdacq.glbl import glbl
 from xpdacq.beamtime import Beamtime, Experiment, ScanPlan, Sample, Scan
 from xpdacq.beamtimeSetup import _start_beamtime, _end_beamtime
-from xpdacq.xpdacq import prun, calibration, dark, dryrun, background, _auto_dark_collection, _auto_load_calibration_file
+from xpdacq.xpdacq import prun, calibration, dark, dryrun, background, _auto_dark_collection, _auto_load_calibration_file, _frame_fom, _adapt_Tstep, estimate_queue, _plan_exposure, _det_state
 from xpdacq.control import _open_shutter, _close_shutter
+import xpdacq.xpdacq as xpdacq_mod
 
 from bluesky.plans import Count
 from bluesky.examples import det, motor
 
+def _msg(command, obj=None, *args, **kwargs):
+    return (command, obj, args, kwargs)
+
+class _Clock(object):
+    ''' stands in for time.time, only moves when asked to '''
+    def __init__(self, now=1000.):
+        self.now = now
+    def __call__(self):
+        return self.now
+
+class _Status(object):
+    ''' status handed back for a 'set', done or never completing '''
+    def __init__(self, done):
+        self.done = done
+
+def _run_plan(plan, clock=None, status=None):
+    ''' step through a plan like the run engine, returns (commands, events)
+
+    with a clock, 'sleep' messages move it on instead of sleeping, and
+    'set' messages hand back status
+    '''
+    commands = []
+    events = []
+    reply = None
+    bundling = False
+    with patch.object(xpdacq_mod, 'Msg', _msg):
+        while True:
+            try:
+                (command, obj, args, kwargs) = plan.send(reply)
+            except StopIteration:
+                return (commands, events)
+            commands.append(command)
+            reply = None
+            if command == 'create':
+                events.append({})
+                bundling = True
+            elif command == 'save':
+                bundling = False
+            elif command == 'trigger' and hasattr(obj, 'trigger'):
+                obj.trigger()
+            elif command == 'read':
+                reply = obj.read()
+                # reads outside of an event don't reach the documents
+                if bundling:
+                    events[-1].update(reply)
+            elif command == 'set':
+                reply = status
+            elif command == 'sleep' and clock is not None:
+                clock.now += args[0]
+
+class _ReadDet(object):
+    ''' detector returning the next of a list of readings at every read '''
+    name = 'read_det'
+    def __init__(self, readings):
+        self.readings = list(readings)
+        self.i = -1
+    def read(self):
+        self.i = min(self.i + 1, len(self.readings) - 1)
+        return self.readings[self.i]
+
+class _TimedDet(object):
+    ''' detector whose points take the given times on a _Clock '''
+    name = 'timed_det'
+    def __init__(self, clock, durations):
+        self.clock = clock
+        self.durations = list(durations)
+    def read(self):
+        self.clock.now += self.durations.pop(0)
+        return {'timed_det_image': {'value': 'datum', 'timestamp': self.clock.now}}
+
 class NewScanTest(unittest.TestCase):
     def setUp(self):
         self.base_dir = glbl.base
@@ -245,3 +316,244 @@ class NewScanTest(unittest.TestCase):
         self.assertFalse('sc_calibration_file_name' in glbl.xpdRE.call_args_list[-1][1])
         # is  ScanPlan.md remain unchanged after scan?
         self.assertFalse('sc_iscalibration' in self.sp.md) 
+
+    def test_adaptive_Tstep(self):
+        threshold = 0.05
+        # first point has nothing to compare with
+        self.assertEqual(_adapt_Tstep(1, None, 0.5, 5, threshold), 5)
+        # large change refines the step, but not below Tstep_min
+        self.assertEqual(_adapt_Tstep(4, 0.5, 0.5, 5, threshold), 2)
+        self.assertEqual(_adapt_Tstep(0.5, 0.5, 0.5, 5, threshold), 0.5)
+        # small change coarsens the step, but not above Tstep
+        self.assertEqual(_adapt_Tstep(2, 0.001, 0.5, 5, threshold), 4)
+        self.assertEqual(_adapt_Tstep(4, 0.001, 0.5, 5, threshold), 5)
+        # in between keeps it
+        self.assertEqual(_adapt_Tstep(2, 0.03, 0.5, 5, threshold), 2)
+        frame = np.ones((256, 256))
+        self.assertEqual(_frame_fom(frame, frame), 0)
+        self.assertAlmostEqual(_frame_fom(frame, 1.1*frame), 0.1)
+        self.assertAlmostEqual(_frame_fom(100., 90.), 0.1)
+        self.assertIsNone(_frame_fom(None, frame))
+
+    def test_estimate_queue(self):
+        sp_ct = ScanPlan('ct', {'exposure': 5})
+        sp_ct_nS = ScanPlan('ct', {'exposure': 5}, shutter = False)
+        sp_Tramp = ScanPlan('Tramp', {'exposure': 1, 'startingT': 300,
+                                      'endingT': 360, 'Tstep': 10}, shutter = False)
+        sp_Tadapt = ScanPlan('Tadapt', {'exposure': 1, 'startingT': 360,
+                                        'endingT': 300, 'Tstep': 10}, shutter = False)
+        queue = [(self.sa, sp_ct), (self.sa, sp_ct), (self.sa, sp_Tramp),
+                 (self.sa, sp_Tadapt)]
+        (timeline, total_time) = estimate_queue(queue, start_T = 300, verbose = False)
+        self.assertEqual(len(timeline), 4)
+        # only the first 5s scan needs a dark, second one reuses it
+        self.assertTrue(timeline[0]['dark'] > 0)
+        self.assertEqual(timeline[1]['dark'], 0)
+        self.assertEqual(timeline[0]['shutter'], 2*glbl.shutter_latency)
+        self.assertEqual(timeline[2]['shutter'], 0)
+        # Tramp starts where the queue is, Tadapt starts where Tramp ended
+        self.assertEqual(timeline[2]['temperature'],
+                         60/glbl.est_temp_ramp_rate*60 + 7*glbl.est_temp_settle_time)
+        self.assertEqual(timeline[3]['temperature'], timeline[2]['temperature'])
+        self.assertTrue(timeline[3]['max_duration'] > timeline[3]['duration'])
+        self.assertEqual(timeline[1]['start'], timeline[0]['end'])
+        self.assertAlmostEqual(total_time, sum(el['duration'] for el in timeline))
+        # without auto_dark no darks are planned
+        (timeline, _) = estimate_queue([(self.sa, sp_ct_nS)], auto_dark = False, verbose = False)
+        self.assertEqual(timeline[0]['dark'], 0)
+
+    def test_plan_exposure(self):
+        base = glbl.frame_acq_time
+        max_frame = glbl.max_frame_acq_time
+        try:
+            # only base frames allowed: same as summing frame_acq_time frames
+            glbl.max_frame_acq_time = base
+            (acq_time, num_frame, computed) = _plan_exposure(1.0)
+            self.assertEqual((acq_time, num_frame), (base, 10))
+            self.assertAlmostEqual(computed, 1.0)
+            # never less than a frame
+            self.assertEqual(_plan_exposure(0.01)[1], 1)
+            # longer frames allowed: fewest frames at the best exposure
+            glbl.max_frame_acq_time = 10*base
+            (acq_time, num_frame, computed) = _plan_exposure(5.0)
+            self.assertAlmostEqual(acq_time, 10*base)
+            self.assertEqual(num_frame, 5)
+            self.assertAlmostEqual(computed, 5.0)
+            (acq_time, num_frame, computed) = _plan_exposure(1.25)
+            self.assertAlmostEqual(computed, 1.2)
+            self.assertEqual(num_frame, 2)
+            # frame time read back from the detector is used as is
+            self.assertEqual(_plan_exposure(1.0, 0.3)[1:], (3, 0.3*3))
+        finally:
+            glbl.max_frame_acq_time = max_frame
+        # scans record the plan
+        sp = ScanPlan('ct', {'exposure': 1.0}, shutter = False)
+        prun(self.sa, sp, auto_dark = False)
+        md = glbl.xpdRE.call_args_list[-1][1]
+        self.assertEqual(md['sp_num_frames'], 10)
+        self.assertEqual(md['sp_number_of_sets'], 1)
+
+    def test_detector_state_cache(self):
+        sp = ScanPlan('ct', {'exposure': 1.0}, shutter = False)
+        _det_state.clear()
+        prun(self.sa, sp, auto_dark = False)
+        puts = _det_state.puts
+        self.assertEqual(puts, 3)
+        # same settings again, nothing is put
+        prun(self.sa, sp, auto_dark = False)
+        self.assertEqual(_det_state.puts, puts)
+        self.assertEqual(_det_state.skipped, 3)
+        self.assertEqual(glbl.xpdRE.call_args_list[-1][1]['sp_num_frames'], 10)
+        # a changed setting is put, the others are not
+        sp5 = ScanPlan('ct', {'exposure': 5.0}, shutter = False)
+        prun(self.sa, sp5, auto_dark = False)
+        self.assertEqual(_det_state.puts, puts + 1)
+        # verification puts back what differs from the readbacks
+        verify_interval = glbl.det_verify_interval
+        acq_get = glbl.area_det.cam.acquire_time.get
+        try:
+            glbl.det_verify_interval = 0
+            glbl.area_det.cam.acquire_time.get = MagicMock(return_value=0.2)
+            prun(self.sa, sp5, auto_dark = False)
+            md = glbl.xpdRE.call_args_list[-1][1]
+            self.assertEqual(md['sp_time_per_frame'], 0.2)
+            self.assertEqual(md['sp_num_frames'], 25)
+        finally:
+            glbl.det_verify_interval = verify_interval
+            glbl.area_det.cam.acquire_time.get = acq_get
+            _det_state.clear()
+
+    def test_multi_set_plan(self):
+        # the simulated detector, every set goes through its own trigger and read
+        rate_log = []
+        (commands, events) = _run_plan(xpdacq_mod._multi_set_plan(det, 3, 10, rate_log))
+        self.assertEqual(commands[:2], ['open_run', 'checkpoint'])
+        self.assertEqual(commands[2:-1],
+                         ['create', 'trigger', 'wait', 'read', 'read', 'save']*3)
+        self.assertEqual(commands[-1], 'close_run')
+        self.assertEqual(len(events), 3)
+        self.assertEqual([ev['ftseries_set_index']['value'] for ev in events], [0, 1, 2])
+        set_times = [ev['ftseries_set_time']['value'] for ev in events]
+        self.assertEqual(set_times, sorted(set_times))
+        self.assertEqual(len(rate_log), 1)
+
+    def test_adaptive_Temp_plan(self):
+        T = _ReadDet([{}])
+        frames = [np.full((8, 8), v) for v in (100., 100., 150., 150., 150.)]
+        det = _ReadDet([{'read_det_image': {'value': f, 'timestamp': 0}}
+                        for f in frames])
+        log = []
+        (commands, events) = _run_plan(xpdacq_mod._adaptive_Temp_plan(
+                                det, T, 300, 320, 8, 1, 0.05, log))
+        steps = [el[1] for el in log]
+        # no change keeps Tstep_max, the jump refines the step
+        self.assertEqual(steps[:3], [8, 8, 8])
+        self.assertEqual(steps[3], 4)
+        self.assertEqual(log[-1][0], 320)
+        # no None written into the numeric fom field
+        self.assertTrue(np.isnan(events[0]['Tadapt_fom']['value']))
+        self.assertEqual(events[1]['Tadapt_fom']['value'], 0)
+        # datum ids only and nothing to retrieve them: warn, fixed steps
+        det = _ReadDet([{'read_det_image': {'value': 'datum', 'timestamp': 0}}])
+        log = []
+        with patch.object(xpdacq_mod, '_frame', return_value=None), \
+                patch('builtins.print') as mock_print:
+            (commands, events) = _run_plan(xpdacq_mod._adaptive_Temp_plan(
+                                    det, T, 300, 320, 8, 1, 0.05, log))
+        self.assertTrue(any('WARNING' in str(c) for c in mock_print.call_args_list))
+        self.assertEqual([el[1] for el in log], [8, 8, 8, 8])
+        self.assertTrue(all(np.isnan(ev['Tadapt_fom']['value']) for ev in events))
+        # a named scalar field, eg. a stats plugin total
+        fom_field = glbl.Tadapt_fom_field
+        try:
+            glbl.Tadapt_fom_field = 'read_det_stats1_total'
+            det = _ReadDet([{'read_det_image': {'value': 'datum', 'timestamp': 0},
+                             'read_det_stats1_total': {'value': v, 'timestamp': 0}}
+                            for v in (100., 200., 200.)])
+            log = []
+            _run_plan(xpdacq_mod._adaptive_Temp_plan(det, T, 300, 320, 8, 1, 0.05, log))
+            self.assertEqual(log[1][2], 1.)
+            self.assertEqual(log[2][1], 4)
+        finally:
+            glbl.Tadapt_fom_field = fom_field
+
+
+    def test_continuous_ramp_plan(self):
+        clock = _Clock()
+        det = _TimedDet(clock, [5., 5., 5., 5., 5.])
+        T = MagicMock()
+        T.name = 'T'
+        # ramps at 1K/s on the clock
+        T.read.side_effect = lambda: {'T': {'value': 300 + clock.now - 1000,
+                                            'timestamp': clock.now}}
+        frame_log = []
+        with patch.object(xpdacq_mod.time, 'time', clock), \
+                patch('builtins.print') as mock_print:
+            (commands, events) = _run_plan(xpdacq_mod._continuous_ramp_plan(
+                                    det, T, 300, 310, 60., 4., frame_log),
+                                    clock, _Status(done=False))
+        self.assertEqual(commands[0], 'open_run')
+        # the ramp never reports done, exposures stop at the timeout of 23s
+        # and the controller holds, without waiting on the stuck ramp
+        self.assertEqual(len(events), 5)
+        self.assertEqual(commands[-4:], ['save', 'set', 'wait', 'close_run'])
+        self.assertTrue('did not finish' in str(mock_print.call_args_list))
+        self.assertEqual([el[0] for el in frame_log],
+                         [(300, 305), (305, 310), (310, 315), (315, 320), (320, 325)])
+        self.assertEqual(frame_log[0][1], 1.)
+        self.assertEqual(events[0]['Tcont_T_end']['value'], 305)
+        self.assertEqual(events[0]['T']['value'], 305)
+        # a finished ramp is waited on once
+        det = _TimedDet(clock, [5.])
+        frame_log = []
+        with patch.object(xpdacq_mod.time, 'time', clock):
+            (commands, events) = _run_plan(xpdacq_mod._continuous_ramp_plan(
+                                    det, T, 300, 310, 60., 4., frame_log),
+                                    clock, _Status(done=True))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(commands[-3:], ['save', 'wait', 'close_run'])
+        # a controller without a ramp_rate signal fails before the run opens
+        plan = xpdacq_mod._continuous_ramp_plan(det, _ReadDet([]), 300, 310,
+                                                60., 4., frame_log)
+        self.assertRaises(SystemExit, _run_plan, plan)
+
+    def test_period_tracking_plan(self):
+        clock = _Clock()
+        # 1s exposure, 0.5s overhead, except for a 35s hiccup at the third point
+        det = _TimedDet(clock, [1.5, 1.5, 35, 1.5, 1.5])
+        point_log = []
+        with patch.object(xpdacq_mod.time, 'time', clock):
+            (commands, events) = _run_plan(xpdacq_mod._period_tracking_plan(
+                                    det, 5, 10., 1., point_log), clock)
+        self.assertEqual(commands[0], 'open_run')
+        self.assertEqual(commands[-1], 'close_run')
+        self.assertEqual(commands.count('trigger'), 5)
+        self.assertEqual(len(events), 5)
+        nominal = [el[0] for el in point_log]
+        actual = [el[1] for el in point_log]
+        # points on a 10s grid, the wait takes the overhead out of the delay
+        self.assertEqual(nominal[:3], [1000., 1010., 1020.])
+        self.assertEqual(actual[:3], nominal[:3])
+        self.assertEqual(commands.count('sleep'), 3)
+        self.assertAlmostEqual(point_log[0][2], 0.5)
+        self.assertAlmostEqual(events[0]['tseries_overhead']['value'], 0.5)
+        # more than a period behind, the grid restarts at the late point
+        self.assertEqual(actual[3], 1055.)
+        self.assertEqual(nominal[3], 1055.)
+        self.assertEqual(nominal[4], 1065.)
+
+    def test_overhead_history(self):
+        if os.path.isfile(glbl.oh_yaml):
+            os.remove(glbl.oh_yaml)
+        self.assertEqual(xpdacq_mod._estimate_overhead('tseries'), glbl.est_writeout_ohead)
+        point_log = [(1000., 1000., 0.4), (1010., 1010., 0.6)]
+        with patch('builtins.print') as mock_print:
+            xpdacq_mod._summarize_time_series(point_log, 10.)
+        self.assertTrue('achieved period = 10.000s' in str(mock_print.call_args_list))
+        self.assertAlmostEqual(xpdacq_mod._estimate_overhead('tseries'), 0.5)
+        # only the most recent max_len overheads are kept, per ScanPlan type
+        xpdacq_mod._yamify_overhead('tseries', [1.]*3, max_len=4)
+        xpdacq_mod._yamify_overhead('Tramp', [2.])
+        oh_dict = xpdacq_mod._read_overhead_yaml()
+        self.assertEqual(oh_dict['tseries'], [0.6, 1., 1., 1.])
+        self.assertEqual(oh_dict['Tramp'], [2.])
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import os
 import shutil
 import time
@@ -10,7 +10,9 @@ import copy
 from xpdacq.glbl import glbl
 from xpdacq.beamtime import Beamtime, Experiment, ScanPlan, Sample
 from xpdacq.beamtimeSetup import _start_beamtime, _end_beamtime
-from xpdacq.xpdacq import _validate_dark, _yamify_dark, prun, _read_dark_yaml
+from xpdacq.xpdacq import _validate_dark, _yamify_dark, prun, _read_dark_yaml, _auto_beamdump_suspender
+from xpdacq.control import _beamdump_monitor, _shutter_requested, beamdump_stats
+from xpdacq.control import beamdump_suspender, _beamdump_resume_plan
 
 class findRightDarkTest(unittest.TestCase): 
     def setUp(self):
@@ -123,3 +125,72 @@ class findRightDarkTest(unittest.TestCase):
         self.assertTrue(os.path.isfile(glbl.dk_yaml)) # make sure it exit after _start_beamtime()
         os.remove(glbl.dk_yaml)
         self.assertRaises(SystemExit, lambda: _read_dark_yaml())
+
+    def test_beamdump_invalidates_darks(self):
+        time_now = time.time()
+        old_dark = (str(uuid.uuid1()), 0.1, time_now-600)
+        _yamify_dark(old_dark)
+        _shutter_requested['open'] = False
+        # beam is dumped and comes back
+        _beamdump_monitor(value=glbl.beamdump_floor-1, timestamp=time_now-300)
+        self.assertEqual(_beamdump_monitor.dump_time, time_now-300)
+        _beamdump_monitor.dump_time = None
+        _beamdump_monitor._recover(time_now-300, time_now-100)
+        new_dark = (str(uuid.uuid1()), 0.1, time_now)
+        _yamify_dark(new_dark)
+        self.assertEqual(_read_dark_yaml(), [new_dark])
+        stats = beamdump_stats()
+        self.assertEqual(len(stats['outages']), 1)
+        self.assertEqual(stats['outages'][0]['darks_invalidated'], 1)
+        self.assertEqual(stats['lost_time'], 200+glbl.beamdump_resume_sleep)
+
+    def test_beamdump_suspender(self):
+        current_get = glbl.ring_current.get
+        floor = glbl.beamdump_floor
+        auto = glbl.beamdump_auto
+        try:
+            # floor follows the ring current at the time it is enabled
+            glbl.ring_current.get = MagicMock(return_value=400.)
+            beamdump_suspender()
+            self.assertAlmostEqual(glbl.beamdump_floor, 400.*glbl.beamdump_fraction)
+            (args, kwargs) = glbl.SuspendFloor.call_args
+            self.assertEqual(args[1], glbl.beamdump_floor)
+            self.assertIs(kwargs['post_plan'], _beamdump_resume_plan)
+            glbl.xpdRE.install_suspender.assert_called_with(glbl.beamdump_sus)
+            sus = glbl.beamdump_sus
+            glbl.ring_current.get = MagicMock(return_value=200.)
+            beamdump_suspender()
+            glbl.xpdRE.remove_suspender.assert_called_with(sus)
+            self.assertAlmostEqual(glbl.beamdump_floor, 200.*glbl.beamdump_fraction)
+            beamdump_suspender(False)
+            self.assertIsNone(glbl.beamdump_sus)
+            # switched off by hand, it stays off for the next scans
+            glbl.SuspendFloor.reset_mock()
+            _auto_beamdump_suspender()
+            glbl.SuspendFloor.assert_not_called()
+            # installed before the first scan, once the beam is up
+            glbl.beamdump_auto = True
+            glbl.ring_current.get = MagicMock(return_value=0.)
+            with patch('builtins.print') as mock_print:
+                _auto_beamdump_suspender()
+            self.assertIsNone(glbl.beamdump_sus)
+            self.assertTrue('WARNING' in str(mock_print.call_args_list))
+            glbl.ring_current.get = MagicMock(return_value=400.)
+            _auto_beamdump_suspender()
+            sus = glbl.beamdump_sus
+            self.assertIsNotNone(sus)
+            _auto_beamdump_suspender()
+            self.assertIs(glbl.beamdump_sus, sus)
+            self.assertEqual(glbl.SuspendFloor.call_count, 1)
+        finally:
+            glbl.ring_current.get = current_get
+            glbl.beamdump_floor = floor
+            glbl.beamdump_auto = auto
+        # shutter is not touched when the beam comes back, only on resume
+        _shutter_requested['open'] = True
+        with patch('xpdacq.control._open_shutter') as mock_open:
+            _beamdump_monitor._recover(time.time()-300, time.time()-100)
+            mock_open.assert_not_called()
+        self.assertEqual(len(list(_beamdump_resume_plan())), 3)
+        _shutter_requested['open'] = False
+        self.assertEqual(list(_beamdump_resume_plan()), [])
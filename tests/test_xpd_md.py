@@ -0,0 +1,47 @@
+import unittest
+from unittest.mock import patch
+from xpdacq.xpd_md import Beamtime, Experiment, Sample, Scan, Event
+
+class xpdMdTest(unittest.TestCase):
+    def setUp(self):
+        with patch('builtins.input', return_value='Billinge'):
+            self.bt = Beamtime('123', '2016-06-01', '2016-06-05', ['van der Banerjee'])
+        self.ex = Experiment(self.bt, user_dict={'proposal': 'p300000'})
+        self.sa = Sample(self.ex, 'NaCl', ('NaCl', 1))
+        self.ev = Event(Scan(self.sa, production=False))
+
+    def test_inherited_fields(self):
+        self.assertEqual(self.ev.safN, '123')
+        self.assertEqual(self.ev.proposal, 'p300000')
+        self.assertEqual(self.ev.sample_name, 'NaCl')
+        self.assertEqual(self.ev.scan_tag, 'Test')
+        # closest level wins
+        self.assertEqual(self.ev.modified_time, self.sa.modified_time)
+        self.assertEqual(self.ev.Scan.Sample, self.sa)
+        self.assertRaises(AttributeError, lambda: self.ev.not_a_field)
+        # only own fields are stored
+        self.assertFalse(hasattr(self.ev, '__dict__'))
+        self.assertEqual(self.sa.show_sample()['sample_name'], 'NaCl')
+        self.assertFalse('safN' in self.sa.show_sample())
+
+    def test_to_dict(self):
+        md = self.ev.to_dict()
+        self.assertEqual(md['safN'], '123')
+        self.assertEqual(md['proposal'], 'p300000')
+        self.assertEqual(md['experiment_uid'], self.ex.experiment_uid)
+        self.assertEqual(md['event_tag'], 'Production')
+        self.assertEqual(md['modified_time'], self.sa.modified_time)
+        self.assertFalse('Scan' in md)
+
+    def test_user_fields_override(self):
+        ex = Experiment(self.bt, user_dict={'safN': 'x', 'modified_time': 0})
+        ev = Event(Scan(Sample(ex, 'NaCl', ('NaCl', 1))))
+        # user fields of the Experiment shadow the Beamtime ones, as in to_dict
+        for obj in (ex, ev):
+            self.assertEqual(obj.safN, 'x')
+            self.assertEqual(obj.to_dict()['safN'], 'x')
+        self.assertEqual(ex.modified_time, 0)
+        # and lower levels shadow them
+        self.assertEqual(ev.modified_time, ev.Scan.Sample.modified_time)
+        self.assertEqual(ev.to_dict()['modified_time'], ev.modified_time)
+        self.assertEqual(self.bt.safN, '123')
@@ -0,0 +1,118 @@
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+import multiprocessing
+import yaml
+from xpdacq.yamlstore import YamlStore, safe_load
+
+def _append_entries(fpath, tag, num):
+    store = YamlStore()
+    for i in range(num):
+        store.update(fpath, lambda l: l + ['{}{}'.format(tag, i)])
+
+def _create_entries(fpath, tag, num):
+    store = YamlStore()
+    for i in range(num):
+        store.update(fpath, lambda l: (l or []) + ['{}{}'.format(tag, i)],
+                     missing_ok=True)
+
+class YamlStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.lname = os.path.join(self.test_dir, 'list.yml')
+        self.oname = os.path.join(self.test_dir, 'obj.yml')
+        self.store = YamlStore()
+        self.store.dump([], self.lname)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _read(self, fpath):
+        with open(fpath, 'r') as f:
+            return safe_load(f)
+
+    def test_atomic_write(self):
+        self.store.dump({'a': 1}, self.oname)
+        self.assertEqual(self._read(self.oname), {'a': 1})
+        self.store.update(self.lname, lambda l: l + ['x'])
+        self.assertEqual(self._read(self.lname), ['x'])
+        # no temporary files left behind, only the lock file
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['.lock', 'list.yml', 'obj.yml'])
+        # new files get the default mode, rewritten ones keep theirs
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.oname).st_mode), 0o666 & ~umask)
+        os.chmod(self.lname, 0o664)
+        self.store.update(self.lname, lambda l: l + ['y'])
+        self.assertEqual(stat.S_IMODE(os.stat(self.lname).st_mode), 0o664)
+
+    def test_batch(self):
+        md = {'a': 1}
+        with self.store.batch():
+            self.store.dump(md, self.oname)
+            # content is taken when dumped, not when flushed
+            md.update({'a': 2})
+            self.store.update(self.lname, lambda l: l + ['x'])
+            self.store.update(self.lname, lambda l: l + ['y'])
+            with self.store.batch():
+                self.store.update(self.lname, lambda l: l + ['z'])
+            # nothing written yet, but reads see pending writes
+            self.assertFalse(os.path.isfile(self.oname))
+            self.assertTrue(self.store.exists(self.oname))
+            self.assertEqual(self._read(self.lname), [])
+            self.assertEqual(self.store.load(self.lname), ['x', 'y', 'z'])
+            self.assertEqual(self.store.load(self.oname), {'a': 1})
+        self.assertEqual(self._read(self.oname), {'a': 1})
+        self.assertEqual(self._read(self.lname), ['x', 'y', 'z'])
+
+    def test_versioned_read(self):
+        self.store.update(self.lname, lambda l: l + ['x'])
+        stats = self.store.stats()
+        content = self.store.load(self.lname)
+        content.append('y') # modifying it doesn't touch the cache
+        self.assertEqual(self.store.load(self.lname), ['x'])
+        self.assertEqual(self.store.stats()['cache_hits'], stats['cache_hits'] + 2)
+        # a file changed by somebody else is read again
+        with open(self.lname, 'w') as f:
+            yaml.dump(['x', 'z', 'z'], f)
+        self.assertEqual(self.store.load(self.lname), ['x', 'z', 'z'])
+
+    def test_concurrent_updates(self):
+        procs = [multiprocessing.Process(target=_append_entries,
+                                         args=(self.lname, tag, 20))
+                 for tag in ('a', 'b', 'c')]
+        for p in procs:
+            p.start()
+        with self.store.batch():
+            for i in range(20):
+                self.store.update(self.lname, lambda l: l + ['d'])
+        for p in procs:
+            p.join()
+        # no entry is lost
+        self.assertEqual(len(self._read(self.lname)), 80)
+        self.assertTrue(self.store.stats()['lock_acquisitions'] > 0)
+
+
+    def test_update_missing_ok(self):
+        self.assertRaises(FileNotFoundError, self.store.update, self.oname,
+                          lambda d: d)
+        self.store.update(self.oname, lambda d: (d or {}), missing_ok=True)
+        self.assertEqual(self._read(self.oname), {})
+        nname = os.path.join(self.test_dir, 'new.yml')
+        with self.store.batch():
+            self.store.update(nname, lambda l: (l or []) + ['x'], missing_ok=True)
+            self.store.update(nname, lambda l: l + ['y'])
+            self.assertEqual(self.store.load(nname), ['x', 'y'])
+        self.assertEqual(self._read(nname), ['x', 'y'])
+        # processes creating the same file don't wipe each other's entries
+        cname = os.path.join(self.test_dir, 'created.yml')
+        procs = [multiprocessing.Process(target=_create_entries,
+                                         args=(cname, tag, 10))
+                 for tag in ('a', 'b', 'c')]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        self.assertEqual(len(self._read(cname)), 30)
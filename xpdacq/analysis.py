@@ -18,8 +18,11 @@
 #from metadatastore.commands import find_run_starts
 
 import os
+import time
 import datetime
+import threading
 from time import strftime
+from collections import OrderedDict
 import numpy as np
 import tifffile as tif
 import matplotlib as plt
@@ -35,6 +38,113 @@ _fname_field = ['sa_name','sp_name']
 w_dir = os.path.join(glbl.home, 'tiff_base')
 W_DIR = w_dir # in case of crashes in old codes
 
+class _HeaderCache(object):
+    ''' databroker metadata of this session, keyed by run uid
+
+    Holds at most glbl.header_cache_size entries, least recently used
+    ones are dropped first, and an entry older than glbl.header_cache_ttl
+    seconds is queried again.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (time stored, value)
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key, func, keep=None):
+        ''' cached value of key, from func() if missing or expired
+
+        A value for which keep(value) is False is returned but not cached.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() - entry[0] < glbl.header_cache_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+        value = func()
+        if keep is not None and not keep(value):
+            return value
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(glbl.header_cache_size, 0):
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        return stats
+
+_header_cache = _HeaderCache()
+
+def header_cache_stats():
+    """ statistics of the cache of run headers used by analysis helpers
+
+    Returns
+    -------
+    stats : dict
+        hits, misses, evictions, expired entries and current size
+    """
+    return _header_cache.stats()
+
+def clear_header_cache():
+    """ forget cached run headers, eg. after fixing metadata of a run """
+    _header_cache.clear()
+
+def _is_closed(header):
+    ''' True once the run has its stop document, and will not change anymore '''
+    try:
+        return bool(header['stop'])
+    except (KeyError, TypeError):
+        return False
+
+def _cached_header(header):
+    ''' the cached header of the same run, header itself if the run is still open '''
+    if not _is_closed(header):
+        return header
+    return _header_cache.get(('header', header['start']['uid']), lambda: header)
+
+def _cached_search(**kwargs):
+    ''' db(**kwargs), with the headers of finished runs taken from the cache
+
+    The query always runs, so new runs show up right away. Only headers
+    (and what is derived from them, like their descriptors) are reused,
+    and a new list is returned every time.
+    '''
+    return [_cached_header(h) for h in db(**kwargs)]
+
+def _cached_uid_search(field, uid):
+    ''' headers of the XPD runs whose start document has field == uid
+
+    Such a lookup, eg. the dark run of a scan by sc_dark_uid, always
+    finds the same runs, so the query result is cached once all of them
+    are closed. Otherwise the query runs again next time. A new list is
+    returned every time.
+    '''
+    def search():
+        return [_cached_header(h) for h in db(**{'group': 'XPD', field: uid})]
+    def all_closed(headers):
+        return bool(headers) and all(_is_closed(h) for h in headers)
+    return list(_header_cache.get(('search', field, uid), search, keep=all_closed))
+
+def _cached_descriptors(header):
+    ''' descriptors of a header, from the cache for finished runs '''
+    if not _is_closed(header):
+        return list(header.descriptors)
+    return _header_cache.get(('descriptors', header['start']['uid']),
+                             lambda: list(header.descriptors))
+
 def bt_uid():
     """ function to obtain uid of current beamtime
     
@@ -136,6 +246,7 @@ def save_tiff(headers, dark_subtraction=True, *, max_count=None):
     else:
         header_list = headers
 
+    dark_imgs = {}
     for header in header_list:
         print('Saving your image(s) now....')
         # information at header level
@@ -151,12 +262,12 @@ def save_tiff(headers, dark_subtraction=True, *, max_count=None):
             dark_uid_appended = header.start['sc_dk_field_uid']
             try:
                 # bluesky only looks for uid it defines
-                dark_search = {'group': 'XPD',
-                               'sc_dark_uid': dark_uid_appended} # the one we need to look up data
-
-                dark_header = db(**dark_search)
-                dark_img = np.asarray(get_images(dark_header,
-                                                 img_field)).squeeze()
+                dark_header = _cached_uid_search('sc_dark_uid', dark_uid_appended)
+                # headers of a run usually share their dark
+                if dark_uid_appended not in dark_imgs:
+                    dark_imgs[dark_uid_appended] = np.asarray(
+                        get_images(dark_header, img_field)).squeeze()
+                dark_img = dark_imgs[dark_uid_appended]
             except ValueError:
                 print(e)  # protection. Should not happen
                 warnings.warn("Requested to do dark correction, but "
@@ -233,7 +344,8 @@ def _identify_image_field(header):
     ''' small function to identify image filed key words in header
     '''
     try:
-        img_field =[el for el in header.descriptors[0]['data_keys'] if el.endswith('_image')][0]
+        img_field = [el for el in _cached_descriptors(header)[0]['data_keys']
+                     if el.endswith('_image')][0]
         print('Images are pulling out from %s' % img_field)
         return img_field
     except IndexError:
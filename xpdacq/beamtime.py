@@ -16,34 +16,270 @@
 import uuid
 import yaml
 import os
+import csv
+import time
 import shutil
 import datetime
 from time import strftime
 import sys
-from collections import OrderedDict
+from collections import OrderedDict, ChainMap
 import copy
 from xpdacq.glbl import glbl
-from xpdacq.utils import _graceful_exit
+from xpdacq.utils import _graceful_exit, composition_analysis
+from xpdacq.yamlstore import yaml_store, safe_dump
 
 from bluesky.plans import Plan
 
 home_dir = glbl.home
 yaml_dir = glbl.yaml_dir
 
+class _MDLayer(dict):
+    ''' own md of an acquire object, counting the writes made to it '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generation = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.generation += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.generation += 1
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.generation += 1
+
+    def pop(self, *args):
+        self.generation += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.generation += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.generation += 1
+        return super().setdefault(key, default)
+
+    def clear(self):
+        super().clear()
+        self.generation += 1
+
+class _LayeredMD(ChainMap):
+    ''' metadata of an acquire object, layered on top of its parents' md
+
+    Writes only go to the object's own (first) layer, so eg. a Sample never
+    changes the md of its Experiment or Beamtime, while changes made to a
+    parent are still seen by its children. ``snapshot()`` gives the
+    flattened dict, cached until one of its own layers is written again.
+    '''
+    def __init__(self, *maps):
+        super().__init__(*maps)
+        if not isinstance(self.maps[0], _MDLayer):
+            self.maps[0] = _MDLayer(self.maps[0])
+        self._snapshot = (None, None)
+
+    def update(self, *args, **kwargs):
+        # one dict update instead of a __setitem__ per key
+        self.maps[0].update(*args, **kwargs)
+
+    def _generation(self):
+        ''' write counters of all layers, None if a layer doesn't count them '''
+        if not all(isinstance(layer, _MDLayer) for layer in self.maps):
+            return None
+        return tuple((id(layer), layer.generation) for layer in self.maps)
+
+    def snapshot(self):
+        ''' flattened md as a plain dict, eg. for the RunEngine. Don't modify it '''
+        generation = self._generation()
+        if generation is None or self._snapshot[0] != generation:
+            flat = {}
+            for layer in reversed(self.maps):
+                flat.update(layer)
+            self._snapshot = (generation, flat)
+        return self._snapshot[1]
+
+def _md_layers(md):
+    ''' layers of md, to stack another md on top of it '''
+    if isinstance(md, ChainMap):
+        return md.maps
+    return [md]
+
 def _get_yaml_list():
     yaml_dir = glbl.yaml_dir
     lname = os.path.join(yaml_dir,'_acqobj_list.yml')
-    with open(lname, 'r') as fout:
-        yaml_list = yaml.load(fout) 
+    yaml_list = yaml_store.load(lname)
     return list(yaml_list)
 
 def _get_hidden_list():
     yaml_dir = glbl.yaml_dir
     lname = os.path.join(yaml_dir,'_hidden_objects_list.yml')
-    with open(lname, 'r') as fout:
-        hidden_list = yaml.load(fout) 
+    hidden_list = yaml_store.load(lname)
     return list(hidden_list)
 
+def _get_acqobj_index():
+    ''' dict of object file name -> {'name': name, 'type': type, 'uid': uid}
+
+    kept next to the object list so objects can be listed without
+    loading them. Empty if it doesn't exist yet (store of an older version)
+    '''
+    iname = os.path.join(glbl.yaml_dir, '_acqobj_index.yml')
+    if not yaml_store.exists(iname):
+        return {}
+    return yaml_store.load(iname) or {}
+
+def _update_acqobj_index(entries):
+    ''' add {fname: {'name': name, 'type': type, 'uid': uid}} entries to the index '''
+    iname = os.path.join(glbl.yaml_dir, '_acqobj_index.yml')
+    def _add(index):
+        index = index or {}
+        index.update(entries)
+        return index
+    yaml_store.update(iname, _add, missing_ok=True)
+
+# (version of the index, object file names, uid -> object file name),
+# rebuilt when the index changes
+_ref_map_cache = (None, set(), {})
+# version of the acquire object file format, see migrate_acqobj_store
+_ACQOBJ_SCHEMA = 1
+# object file path -> (version of the file, dict the object is built from)
+_acqobj_cache = {}
+
+def _get_ref_maps():
+    ''' indexed object file names and uid -> object file name map '''
+    global _ref_map_cache
+    iname = os.path.join(glbl.yaml_dir, '_acqobj_index.yml')
+    version = yaml_store.version(iname)
+    if version is not None and _ref_map_cache[0] == version:
+        return _ref_map_cache[1:]
+    index = _get_acqobj_index()
+    uid_map = {entry['uid']: fname for (fname, entry) in index.items()
+               if entry.get('uid')}
+    if version is not None:
+        _ref_map_cache = (version, set(index), uid_map)
+    return (set(index), uid_map)
+
+def _resolve_acqobj_fname(ref, expect_yml_type):
+    ''' object file name for a name or uid reference, None if there is none '''
+    (fnames, uid_map) = _get_ref_maps()
+    fname = '{}_{}.yml'.format(expect_yml_type, ref)
+    if fname in fnames:
+        return fname
+    uid_fname = uid_map.get(ref)
+    if uid_fname is not None and uid_fname.split('_', maxsplit=1)[0] == expect_yml_type:
+        return uid_fname
+    # objects not indexed yet are still in the object list
+    if fname in _get_yaml_list():
+        return fname
+    return None
+
+def _load_acqobj_cached(fpath):
+    ''' _load_acqobj, parsed from memory while the file is unchanged
+
+    only the dict of the object is kept, every call builds a new object,
+    so changes to one never show up in the next lookup
+    '''
+    version = yaml_store.version(fpath)
+    cached = _acqobj_cache.get(fpath)
+    if version is not None and cached is not None and cached[0] == version:
+        obj_dict = cached[1]
+    else:
+        obj_dict = _load_acqobj_dict(fpath)
+        # a legacy file has been rewritten by now, take version again
+        version = yaml_store.version(fpath)
+        if version is not None:
+            _acqobj_cache[fpath] = (version, obj_dict)
+    return _acqobj_from_dict(copy.deepcopy(obj_dict))
+
+def _acqobj_from_dict(obj_dict):
+    ''' rebuild an acquire object from the dict written by XPD._to_dict '''
+    acqobj_classes = {cls.__name__: cls for cls in [XPD] + XPD.__subclasses__()}
+    try:
+        cls = acqobj_classes[obj_dict['class']]
+    except (KeyError, TypeError):
+        sys.exit(_graceful_exit('''{} is not an acquire object.
+Please contact beamline scientist'''.format(obj_dict)))
+    obj = cls.__new__(cls)
+    for k, v in obj_dict['attrs'].items():
+        if isinstance(v, dict) and 'class' in v and 'attrs' in v:
+            v = _acqobj_from_dict(v)
+        setattr(obj, k, v)
+    obj.name = obj_dict['name']
+    obj.type = obj_dict['type']
+    obj.md = _LayeredMD(obj_dict['md'])
+    return obj
+
+def _load_acqobj_dict(fpath):
+    ''' load the dict of the acquire object stored in fpath '''
+    try:
+        return yaml_store.load(fpath)
+    except yaml.constructor.ConstructorError:
+        sys.exit(_graceful_exit('''{} is not a plain acquire object file, it was
+probably written by an older version of xpdAcq. Please run migrate_acqobj_store()
+once to convert the acquire objects, or contact beamline scientist'''.format(fpath)))
+
+def _legacy_classes():
+    ''' classes pickled in acquire object files of older versions '''
+    return [XPD] + XPD.__subclasses__()
+
+def migrate_acqobj_store():
+    ''' convert acquire object files of older versions to the plain dict schema
+
+    Older versions stored acquire objects as pickled python objects. They
+    are read once, building only xpdacq acquire objects, and written back
+    as plain dicts. Files with any other python object in them are left
+    alone and reported. Runs when a beamtime is loaded for the first time
+    with this version; run it again after importing files of an older
+    version.
+
+    Returns
+    -------
+    converted : list
+        names of the converted files
+    '''
+    converted = []
+    fnames = [f for f in os.listdir(glbl.yaml_dir) if f.endswith('.yml')]
+    for fname in sorted(fnames):
+        fpath = os.path.join(glbl.yaml_dir, fname)
+        try:
+            yaml_store.load(fpath)
+            continue
+        except yaml.constructor.ConstructorError:
+            pass
+        try:
+            obj = yaml_store.load_legacy(fpath, _legacy_classes())
+        except yaml.constructor.ConstructorError as err:
+            print('WARNING: {} is not converted, it holds something else than '
+                  'acquire objects: {}'.format(fname, err.problem))
+            continue
+        if not isinstance(obj, XPD):
+            print('WARNING: {} is not converted, it is not an acquire object'.format(fname))
+            continue
+        yaml_store.dump(obj._to_dict(), fpath)
+        converted.append(fname)
+    if converted:
+        print('INFO: {} acquire object file(s) converted to the current format'
+              .format(len(converted)))
+    _mark_acqobj_store_current()
+    return converted
+
+def _schema_fpath():
+    return os.path.join(glbl.yaml_dir, '_acqobj_schema.yml')
+
+def _mark_acqobj_store_current():
+    yaml_store.dump({'schema': _ACQOBJ_SCHEMA}, _schema_fpath())
+
+def _acqobj_store_is_current():
+    fpath = _schema_fpath()
+    return yaml_store.exists(fpath) and \
+            (yaml_store.load(fpath) or {}).get('schema') == _ACQOBJ_SCHEMA
+
+def _load_acqobj(fpath):
+    ''' load the acquire object stored in fpath '''
+    return _acqobj_from_dict(_load_acqobj_dict(fpath))
+
 def _update_objlist(objlist,name):
     # check whether this obj exists already if yes, don't add it again.
     if name not in objlist:
@@ -59,6 +295,10 @@ class XPD:
         return self.md
 
     def _get_obj_uid(self,name,otype):
+        # uid is in the object index, no need to load objects
+        entry = _get_acqobj_index().get(self._name_for_obj_yaml_file(name,otype))
+        if entry and entry.get('uid'):
+            return entry['uid']
         yamls = self.loadyamls()
         uidid = "_".join([otype,'uid'])
         for i in yamls:
@@ -67,6 +307,22 @@ class XPD:
                     ouid = i.md[str(uidid)]
         return ouid
 
+    def _to_dict(self):
+        ''' plain dict schema this object is stored as
+
+        {'class': class name, 'name': name, 'type': type, 'md': md,
+         'attrs': other attributes, acquire objects in there as nested dicts}
+        '''
+        attrs = {}
+        for k, v in self.__dict__.items():
+            if k in ('name', 'type', 'md'):
+                continue
+            if isinstance(v, XPD):
+                v = v._to_dict()
+            attrs[k] = v
+        return {'class': type(self).__name__, 'name': self.name,
+                'type': self.type, 'md': dict(getattr(self, 'md', {})), 'attrs': attrs}
+
     def _yaml_path(self):
         os.makedirs(yaml_dir, exist_ok = True)
         return yaml_dir
@@ -85,16 +341,14 @@ class XPD:
         ftype = self.type
         fname = self._name_for_obj_yaml_file(oname,ftype)
         fpath = os.path.join(self._yaml_path(), fname)
-        objlist = _get_yaml_list()
-        objlist = _update_objlist(objlist, fname)
-        with open(lname, 'w') as fout:
-            yaml.dump(objlist, fout)
+        yaml_store.update(lname, lambda objlist: _update_objlist(list(objlist), fname))
+        ouid = getattr(self, 'md', {}).get('_'.join([ftype, 'uid']))
+        _update_acqobj_index({fname: {'name': oname, 'type': ftype, 'uid': ouid}})
 
         if isinstance(fpath, str):
-            with open(fpath, 'w') as fout:
-                yaml.dump(self, fout)
+            yaml_store.dump(self._to_dict(), fpath)
         else:
-            yaml.dump(self, fpath)
+            safe_dump(self._to_dict(), fpath)
         return fpath
 
     def loadyamls(self):
@@ -103,58 +357,65 @@ class XPD:
         olist = []
         for f in yaml_list:
             fname = os.path.join(yaml_dir,f)
-            with open(fname, 'r') as fout:
-                olist.append(yaml.load(fout))
+            olist.append(_load_acqobj(fname))
         return olist
 
     @classmethod
-    def list(cls, type=None):
-        olist = cls.loadyamls(cls)
-        hlist = _get_hidden_list()
-        if type is None:
-            iter = 0
-            for i in olist:
-                iter += 1
-                #myuid = i._get_obj_uid(i.name,i.type)
-                if iter-1 not in hlist:
-                    print(i.type+' object '+str(i.name)+' has list index ', iter-1)#'and uid',myuid[:6])
-        else:
-            iter = 0
-            for i in olist:
-                iter += 1
-                if i.type == type:
-                    if iter-1 not in hlist:
-                        print(i.type+' object '+str(i.name)+' has list index ', iter-1)
+    def list(cls, type=None, hidden=False):
+        ''' list acquire objects with their index
+
+        Only names and types from the object index are read, object
+        files are loaded only if they are missing from the index.
+
+        Parameters
+        ----------
+        type : str
+            optional. only list objects of this type, eg. 'sa' or 'sp'
+        hidden : bool
+            optional. list hidden objects instead of visible ones. Default is False
+        '''
+        yaml_list = _get_yaml_list()
+        hset = set(_get_hidden_list())
+        index = _get_acqobj_index()
+        missing = [f for f in yaml_list if f not in index]
+        if missing:
+            # written by an older version or imported, index them once
+            new_entries = {}
+            for f in missing:
+                obj = _load_acqobj(os.path.join(glbl.yaml_dir, f))
+                new_entries[f] = {'name': obj.name, 'type': obj.type,
+                                  'uid': obj.md.get('_'.join([obj.type, 'uid']))}
+            _update_acqobj_index(new_entries)
+            index.update(new_entries)
+        for (i, f) in enumerate(yaml_list):
+            entry = index[f]
+            if type is not None and entry['type'] != type:
+                continue
+            if (i in hset) == hidden:
+                print(entry['type']+' object '+str(entry['name'])+' has list index ', i)
         print('Use bt.get(index) to get the one you want')
 
     def hide(self,index):
-        hidden_list = _get_hidden_list()
-        hidden_list.append(index)
         yaml_dir = glbl.yaml_dir
         hname = os.path.join(yaml_dir,'_hidden_objects_list.yml')
-        fo = open(hname, 'w')
-        yaml.dump(hidden_list, fo)
-        return hidden_list
+        # stored as a sorted list, used as a set
+        yaml_store.update(hname, lambda hidden_list: sorted(set(hidden_list) | {index}))
+        return _get_hidden_list()
 
     def unhide(self,index):
-        hidden_list = _get_hidden_list()
-        while index in hidden_list: 
-            hidden_list.remove(index)
         yaml_dir = glbl.yaml_dir
         hname = os.path.join(yaml_dir,'_hidden_objects_list.yml')
-        fo = open(hname, 'w')
-        yaml.dump(hidden_list, fo)
-        return hidden_list
+        yaml_store.update(hname, lambda hidden_list: sorted(set(hidden_list) - {index}))
+        return _get_hidden_list()
 
     def _init_dark_scan_list(self):
         dark_scan_list = []
-        with open(glbl.dk_yaml,'w') as f:
-            yaml.dump(dark_scan_list, f)
+        yaml_store.dump(dark_scan_list, glbl.dk_yaml)
 
     @classmethod
     def get(cls, index):
-        list = cls.loadyamls(cls)
-        return list[index]
+        fname = _get_yaml_list()[index]
+        return _load_acqobj_cached(os.path.join(glbl.yaml_dir, fname))
     
     def set_wavelength(self,wavelength):
         self.md.update({'bt_wavelength': _clean_md_input(wavelength)})
@@ -183,8 +444,8 @@ class Beamtime(XPD):
     def __init__(self, pi_last, safn, wavelength=None, experimenters=[], **kwargs):
         self.name = 'bt'
         self.type = 'bt'
-        self.md = {'bt_piLast': _clean_md_input(pi_last), 'bt_safN': _clean_md_input(safn), 
-                    'bt_usermd':_clean_md_input(kwargs)}
+        self.md = _LayeredMD({'bt_piLast': _clean_md_input(pi_last), 'bt_safN': _clean_md_input(safn), 
+                    'bt_usermd':_clean_md_input(kwargs)})
         self.md.update({'bt_wavelength': _clean_md_input(wavelength)})
         self.md.update({'bt_experimenters': _clean_md_input(experimenters)})
 
@@ -193,18 +454,15 @@ class Beamtime(XPD):
         lname = os.path.join(yaml_dir,'_acqobj_list.yml')
         hname = os.path.join(yaml_dir,'_hidden_objects_list.yml')
         dname = os.path.join(yaml_dir,'_dk_objects_list.yml')
-        if not os.path.isfile(lname):
+        if not yaml_store.exists(lname):
             objlist = []
-            fo = open(lname, 'w')
-            yaml.dump(objlist, fo)
-        if not os.path.isfile(hname):
+            yaml_store.dump(objlist, lname)
+        if not yaml_store.exists(hname):
             hidlist = []
-            fo = open(hname, 'w')
-            yaml.dump(hidlist, fo)
-        if not os.path.isfile(dname):
+            yaml_store.dump(hidlist, hname)
+        if not yaml_store.exists(dname):
             dklist = []
-            fo = open(dname, 'w')
-            yaml.dump(dklist, fo)
+            yaml_store.dump(dklist, dname)
    
         fname = self._name_for_obj_yaml_file(self.name,self.type)
         objlist = _get_yaml_list()
@@ -234,7 +492,7 @@ class Experiment(XPD):
         self.bt = beamtime
         self.name = _clean_md_input(expname)
         self.type = 'ex'
-        self.md = self.bt.md
+        self.md = _LayeredMD({}, *_md_layers(self.bt.md))
         self.md.update({'ex_name': self.name})
         self.md.update({'ex_uid': self._getuid()})
         self.md.update({'ex_usermd':_clean_md_input(kwargs)})
@@ -263,23 +521,24 @@ class Sample(XPD):
         optional. a dictionary for user-supplied information.
     '''
     def __init__(self, samname, experiment, **kwargs):
-        self.name = _clean_md_input(samname)
-        self.type = 'sa'
-        self.ex = experiment
-        self.md = self.ex.md
-        self.md.update({'sa_name': self.name})
-        self.md.update({'sa_uid': self._getuid()})
-        self.md.update({'sa_usermd': _clean_md_input(kwargs)})
+        self._setup(samname, experiment, kwargs)
         fname = self._name_for_obj_yaml_file(self.name,self.type)
         objlist = _get_yaml_list()
         # get objlist from yaml file
         if fname in objlist:
             olduid = self._get_obj_uid(self.name,self.type)
             self.md.update({'sa_uid': olduid})
-        else:
-            self.md.update({'sa_uid': self._getuid()})
         self._yamify()
 
+    def _setup(self, samname, experiment, kwargs, uid=None):
+        self.name = _clean_md_input(samname)
+        self.type = 'sa'
+        self.ex = experiment
+        self.md = _LayeredMD({}, *_md_layers(self.ex.md))
+        self.md.update({'sa_name': self.name})
+        self.md.update({'sa_uid': uid or self._getuid()})
+        self.md.update({'sa_usermd': _clean_md_input(kwargs)})
+
 class ScanPlan(XPD):
     '''ScanPlan class  that defines scan plan to run.
 
@@ -303,6 +562,19 @@ class ScanPlan(XPD):
             and run for 5 scans with 60s delay between them.
             If you don't want any delay, give it an 0.
 
+          4. 'ftseries_0.5_100' means fast time series of 100 back-to-back
+            exposures of 0.5s each, without waiting in between.
+
+          5. 'Tcont_10_300_100_2' means continuous temperature ramp from
+            300k to 100k at 2k/min, taking 10s exposures back-to-back
+            while the temperature is changing.
+
+          6. 'Tadapt_10_300_100_5' means temperature scan from 300k to
+            100k with adaptive steps of at most 5k, refined down to 5/8k
+            where the frames change, and 10s exposure time each. An
+            optional fifth number sets the smallest step,
+            e.g. 'Tadapt_10_300_100_5_0.5'.
+
         *. If you wish to specify parameters explicitly.
           This field will be "ScanPlan type". Currently allowed types are:
 
@@ -315,7 +587,22 @@ class ScanPlan(XPD):
           exposure time, starting temperature, ending temperature and
           temperature step specified.
 
-          4. 'bluesky' : which means an arbitrary bluesky plan defined by user
+          4. 'ftseries' : which means a fast time series scanplan with
+          exposure time and number of scans specified. All scans are
+          acquired back-to-back, without waiting in between.
+
+          5. 'Tcont' : which means a continuous temperature ramp scanplan
+          with exposure time, starting temperature, ending temperature and
+          ramp rate (in K/min) specified. Temperature read at start and end
+          of every exposure is saved with the event.
+
+          6. 'Tadapt' : which means a temperature scanplan with adaptive
+          step size. exposure time, starting temperature, ending temperature
+          and largest temperature step are required, the smallest step
+          'Tstep_min' is optional (default is Tstep/8). Steps are refined
+          where frames change and coarsened where they don't.
+
+          7. 'bluesky' : which means an arbitrary bluesky plan defined by user
           For more information please go to : https://nsls-ii.github.io/bluesky/plans.html
           for complete guide on how to define a plan. Note: bluesky type
           of plan doesn't work with auto-naming, you must specify
@@ -339,19 +626,33 @@ class ScanPlan(XPD):
         argument reserved for auto_dark collection functionality.
         Ususally user doesn't have to specify
 
+    quiet : bool
+        optional. Default is False. If True, the summary of the ScanPlan is not printed,
+        useful when ScanPlans are created in a loop
+
+    An identical ScanPlan (same type, parameters, shutter and dk_window) that
+    was already created in this session is returned as it is, without
+    writing it again, as long as its yaml file hasn't changed since.
+
     Examples
     --------
     Here are examples of instantiating ScanPlan objects with explicit form.
 
     >>> ScanPlan('ct', {'exposure': 2.5}
     >>> ScanPlan('tseries', {'exposure': 2.5, 'delay': 60,'num':5})
+    >>> ScanPlan('ftseries', {'exposure': 0.5, 'num':100})
     >>> ScanPlan('Tramp', {'exposure': 2.5, 'sartingT': 300, 'endinT':200, 'Tstep':5})
+    >>> ScanPlan('Tcont', {'exposure': 2.5, 'startingT': 300, 'endingT':100, 'ramp_rate':2})
+    >>> ScanPlan('Tadapt', {'exposure': 2.5, 'startingT': 300, 'endingT':100, 'Tstep':5, 'Tstep_min':0.5})
 
     Here are examples of instantiating ScanPlan objects with auto naming scheme.
 
     >>> ScanPlan('ct_2.5')
     >>> ScanPlan('tseries_2.5_60_5')
+    >>> ScanPlan('ftseries_0.5_100')
     >>> ScanPlan('Tramp_2.5_300_200_5')
+    >>> ScanPlan('Tcont_2.5_300_100_2')
+    >>> ScanPlan('Tadapt_2.5_300_100_5_0.5')
 
     ScanPlan objects from two sets of examples are equivalent.
 
@@ -362,13 +663,68 @@ class ScanPlan(XPD):
     >>> myscan = AbsScanPlan([pe1c, em], tth_cal, -1, 1, 20)
     >>> ScanPlan('bluesky', {'bluesky_plan': myscan})
     '''
+    # interned ScanPlans: normalized key -> (attributes, yaml file, version of it)
+    _interned = {}
+    # auto-name -> parsed (type, parameters)
+    _parsed_names = {}
+
+    def __new__(cls, scanplan_meta = None, scanplan_params = {},
+            dk_window = None, shutter=True, *, auto_dark_plan = False, quiet = False, **kwargs):
+        if scanplan_meta is None:
+            # unpickling or loading from yaml
+            return super().__new__(cls)
+        key = cls._intern_key(scanplan_meta, scanplan_params, dk_window,
+                              shutter, auto_dark_plan, kwargs)
+        cached = cls._interned.get(key) if key is not None else None
+        obj = super().__new__(cls)
+        if cached is not None and yaml_store.version(cached[1]) == cached[2]:
+            # a new object every time, so changing one doesn't change the others
+            obj.__dict__.update(copy.deepcopy(cached[0]))
+        return obj
+
+    @classmethod
+    def _parse_name(cls, sp_name):
+        ''' memoized _scanplan_name_parser '''
+        if sp_name not in cls._parsed_names:
+            cls._parsed_names[sp_name] = cls._scanplan_name_parser(cls, sp_name)
+        (scanplan_type, scanplan_params) = cls._parsed_names[sp_name]
+        return (scanplan_type, dict(scanplan_params))
+
+    @classmethod
+    def _intern_key(cls, scanplan_meta, scanplan_params, dk_window, shutter,
+                    auto_dark_plan, kwargs):
+        ''' normalized (type, params, shutter, dk_window, ...) key, None if it can't be interned '''
+        _sp_input = scanplan_meta.strip()
+        if scanplan_params:
+            (scanplan_type, scanplan_params) = (_sp_input, scanplan_params)
+        else:
+            (scanplan_type, scanplan_params) = cls._parse_name(_sp_input)
+        if not isinstance(scanplan_params, dict) or 'bluesky_plan' in scanplan_params:
+            return None
+        if not dk_window:
+            dk_window = glbl.dk_window
+        key = (scanplan_type, tuple(sorted(scanplan_params.items())), bool(shutter),
+               dk_window, auto_dark_plan, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
     def __init__(self, scanplan_meta, scanplan_params = {},
-            dk_window = None, shutter=True, *, auto_dark_plan = False, **kwargs):
+            dk_window = None, shutter=True, *, auto_dark_plan = False, quiet = False, **kwargs):
+        if 'md' in self.__dict__:
+            # copy of an interned ScanPlan made by __new__, nothing to do
+            if not quiet:
+                self._print_summary()
+            return
+        key = self._intern_key(scanplan_meta, scanplan_params, dk_window,
+                               shutter, auto_dark_plan, kwargs)
         _sp_input = scanplan_meta.strip()
         _std_param_list = self._std_param_list_gen()
         # auto naming, parsed parameters
         if not scanplan_params:
-            (scanplan_type, scanplan_params) = self._scanplan_name_parser(_sp_input)
+            (scanplan_type, scanplan_params) = self._parse_name(_sp_input)
             _sp_name = _sp_input
             self.scanplan = _clean_md_input(scanplan_type)
         # long-form, generate name
@@ -385,7 +741,7 @@ class ScanPlan(XPD):
         self._is_bs = False # priviate attribute
         self._plan_validator()
         self.shutter = shutter
-        self.md = {}
+        self.md = _LayeredMD()
         self.md.update({'sp_params': scanplan_params})
         if 'bluesky_plan' in self.sp_params:
             self._is_bs = True
@@ -416,6 +772,25 @@ class ScanPlan(XPD):
         self.name = sp_name
         self.md.update({'sp_name': _clean_md_input(self.name)})
         # summary of scanplan created
+        if not quiet:
+            self._print_summary()
+        # yamify ScanPlan
+        fname = self._name_for_obj_yaml_file(self.name,self.type)
+        objlist = _get_yaml_list()
+        if fname in objlist:
+            olduid = self._get_obj_uid(self.name,self.type)
+            self.md.update({'sp_uid': olduid})
+        else:
+            self.md.update({'sp_uid': self._getuid()})
+
+        fpath = self._yamify()
+        version = yaml_store.version(fpath)
+        # not flushed yet (inside a batch) means there is nothing to check against
+        if key is not None and version is not None:
+            ScanPlan._interned[key] = (copy.deepcopy(self.__dict__), fpath, version)
+
+    def _print_summary(self):
+        _std_param_list = self._std_param_list_gen()
         print('You have created a "{}" type ScanPlan with name = "{}"'.format(self.scanplan, self.name))
         print('Corresponding scan parameters are:')
         for i in range(len(_std_param_list)):
@@ -428,25 +803,28 @@ class ScanPlan(XPD):
                 # TypeError is for bluesky plan object id
                 pass
         print('with fast-shutter control = {}'.format(self.shutter))
-        # yamify ScanPlan
-        fname = self._name_for_obj_yaml_file(self.name,self.type)
-        objlist = _get_yaml_list()
-        if fname in objlist:
-            olduid = self._get_obj_uid(self.name,self.type)
-            self.md.update({'sp_uid': olduid})
-        else:
-            self.md.update({'sp_uid': self._getuid()})
 
-        self._yamify()
+    def _to_dict(self):
+        obj_dict = super()._to_dict()
+        if self._is_bs:
+            # can't yamify bluesky plans, keep the id as in md
+            obj_dict['attrs']['sp_params'] = self.md['sp_params']
+        return obj_dict
 
     def _std_param_list_gen(self):
         _ct_required_params = ['exposure']
         _tseries_required_params = ['exposure', 'delay', 'num']
+        _ftseries_required_params = ['exposure', 'num']
         _Tramp_required_params = ['exposure', 'startingT', 'endingT', 'Tstep']
+        _Tcont_required_params = ['exposure', 'startingT', 'endingT', 'ramp_rate']
+        _Tadapt_params = ['exposure', 'startingT', 'endingT', 'Tstep', 'Tstep_min']
         # extra efforts to keep print statement in order later
         _ordered_sp_params = _ct_required_params.copy()
         _ordered_sp_params.extend(_tseries_required_params)
+        _ordered_sp_params.extend(_ftseries_required_params)
         _ordered_sp_params.extend(_Tramp_required_params)
+        _ordered_sp_params.extend(_Tcont_required_params)
+        _ordered_sp_params.extend(_Tadapt_params)
         _std_params_list = list(OrderedDict.fromkeys(_ordered_sp_params))
         return _std_params_list
 
@@ -471,6 +849,11 @@ class ScanPlan(XPD):
         2) 'Tramp_10_300_200_5' means temperature ramp from 300k to 200k with 5k step and 10s exposure time each
         3) 'tseries_10_60_5' means time series scan of 10s exposure time each scan 
             and run for 5 scans with 60s delay between them.
+        4) 'ftseries_0.5_100' means fast time series of 100 back-to-back scans of 0.5s exposure time each
+        5) 'Tcont_10_300_100_2' means continuous temperature ramp from 300k to 100k at 2k/min
+            with 10s exposures taken back-to-back during the ramp
+        6) 'Tadapt_10_300_100_5' means temperature scan from 300k to 100k with adaptive steps of
+            at most 5k and 10s exposure time each. 'Tadapt_10_300_100_5_0.5' also sets the smallest step to 0.5k
         '''
         _ct_required_params = ['exposure']
         _tseries_required_params = ['exposure', 'delay', 'num']
@@ -506,9 +889,20 @@ class ScanPlan(XPD):
         elif scanplan_type == 'Tramp' and len(_sp_params) == 4: # exposure, startingT, endingT, Tstep
             sp_params.update({'startingT': _sp_params[1], 'endingT': _sp_params[2], 'Tstep': _sp_params[3]})
             return (scanplan_type, sp_params)
+        elif scanplan_type == 'Tcont' and len(_sp_params) == 4: # exposure, startingT, endingT, ramp_rate
+            sp_params.update({'startingT': _sp_params[1], 'endingT': _sp_params[2], 'ramp_rate': _sp_params[3]})
+            return (scanplan_type, sp_params)
+        elif scanplan_type == 'Tadapt' and len(_sp_params) in (4, 5): # exposure, startingT, endingT, Tstep, [Tstep_min]
+            sp_params.update({'startingT': _sp_params[1], 'endingT': _sp_params[2], 'Tstep': _sp_params[3]})
+            if len(_sp_params) == 5:
+                sp_params.update({'Tstep_min': _sp_params[4]})
+            return (scanplan_type, sp_params)
         elif scanplan_type == 'tseries' and len(_sp_params) == 3: # exposure, delay, num
             sp_params.update({'delay': _sp_params[1], 'num': int(_sp_params[2])})
             return (scanplan_type, sp_params)
+        elif scanplan_type == 'ftseries' and len(_sp_params) == 2: # exposure, num
+            sp_params.update({'num': int(_sp_params[1])})
+            return (scanplan_type, sp_params)
         elif scanplan_type == 'bluesky':
             # leave a hook for future bluesky plan autonaming
             pass
@@ -527,11 +921,14 @@ class ScanPlan(XPD):
         # based on structures in xpdacq.xpdacq.py
         _Tramp_required_params = ['startingT', 'endingT', 'Tstep', 'exposure']
         _Tramp_optional_params = ['det', 'subs_dict']
+        _Tcont_required_params = ['startingT', 'endingT', 'ramp_rate', 'exposure']
+        _Tadapt_required_params = ['startingT', 'endingT', 'Tstep', 'exposure']
 
         _ct_required_params = ['exposure']
         _ct_optional_params = ['det','subs_dict']
 
         _tseries_required_params = ['exposure', 'delay', 'num']
+        _ftseries_required_params = ['exposure', 'num']
 
         if self.scanplan == 'ct':
             # check missed keys
@@ -549,9 +946,15 @@ class ScanPlan(XPD):
                 {}
                 Please go to http://xpdacq.github.io for more information\n'''.
                 format(self.scanplan, wrong_type_dict)))
-        elif self.scanplan == 'Tramp':
+        elif self.scanplan in ('Tramp', 'Tcont', 'Tadapt'):
+            if self.scanplan == 'Tramp':
+                _required_params = _Tramp_required_params
+            elif self.scanplan == 'Tcont':
+                _required_params = _Tcont_required_params
+            else:
+                _required_params = _Tadapt_required_params
             # check missed keys
-            missed_keys = [ el for el in _Tramp_required_params if el not in self.sp_params]
+            missed_keys = [ el for el in _required_params if el not in self.sp_params]
             if missed_keys:
                 sys.exit(_graceful_exit('''You are using a "{}" ScanPlan but you missed required parameters:
                 {}'''.format(self.scanplan, missed_keys)))
@@ -565,9 +968,19 @@ class ScanPlan(XPD):
                 {}
                 Please go to http://xpdacq.github.io for more information\n'''.
                 format(self.scanplan, wrong_type_dict)))
-        elif self.scanplan == 'tseries':
+            if self.scanplan == 'Tcont' and not self.sp_params['ramp_rate'] > 0:
+                sys.exit(_graceful_exit('''You are using a "{}" ScanPlan but ramp_rate = {} is not a positive number'''
+                .format(self.scanplan, self.sp_params['ramp_rate'])))
+            if self.scanplan == 'Tadapt' and not 0 < self.sp_params.get('Tstep_min', self.sp_params['Tstep']) <= self.sp_params['Tstep']:
+                sys.exit(_graceful_exit('''You are using a "{}" ScanPlan but Tstep_min = {} is not between 0 and Tstep = {}'''
+                .format(self.scanplan, self.sp_params.get('Tstep_min'), self.sp_params['Tstep'])))
+        elif self.scanplan in ('tseries', 'ftseries'):
+            if self.scanplan == 'tseries':
+                _required_params = _tseries_required_params
+            else:
+                _required_params = _ftseries_required_params
             # check missed keys
-            missed_keys = [ el for el in _tseries_required_params if el not in self.sp_params]
+            missed_keys = [ el for el in _required_params if el not in self.sp_params]
             if missed_keys:
                 sys.exit(_graceful_exit('''You are using a "{}" ScanPlan but you missed required parameters:
                 {}'''.format(self.scanplan, missed_keys)))
@@ -600,8 +1013,7 @@ class _Union(XPD):
         self.type = 'cmdo'
         self.sc = scan
         self.sa = sample
-        self.md = self.sc.md
-        self.md.update(self.sa.md)
+        self.md = _LayeredMD({}, *_md_layers(self.sa.md), *_md_layers(self.sc.md))
  #       self._yamify()    # no need to yamify this
 
 class Scan(XPD):
@@ -611,6 +1023,7 @@ class Scan(XPD):
     1) bt.get(<object_index>), eg. Scan(bt.get(2), bt.get(5))
     2) name of acquire object, eg. Scan('my_experiment', 'ct1s')
     3) index to acquire object, eg. Scan(2,5)
+    4) uid of acquire object, eg. Scan(sa.md['sa_uid'], sp.md['sp_uid'])
     All of above assigning methods can be used in a mix way.
 
     Parameters:
@@ -626,15 +1039,14 @@ class Scan(XPD):
         self.type = 'sc'
         _sa = self._execute_obj_validator(sample, 'sa', Sample)
         self.sa = _sa
-        self.md = dict(self.sa.md)
         _sp = self._execute_obj_validator(scanplan, 'sp', ScanPlan)
         self.sp = _sp
         try:
             sp_md = self.sp.md
         except:
             sp_md = {}
-        # create a new dict copy.
-        self.md.update(sp_md)
+        # scan md goes on top, ScanPlan md over Sample md, nothing is copied
+        self.md = _LayeredMD({}, *_md_layers(sp_md), *_md_layers(self.sa.md))
 
     def _execute_obj_validator(self, input_obj, expect_yml_type, expect_class):
         parsed_obj = self._object_parser(input_obj, expect_yml_type)
@@ -644,17 +1056,13 @@ class Scan(XPD):
     def _object_parser(self, input_obj, expect_yml_type):
         '''a priviate parser for arbitrary object input
         '''
-        FEXT = '.yml'
         e_msg_str_type = '''Can't find your "{} object {}". Please do bt.list() to make sure you type right name'''.format(expect_yml_type, input_obj)
         e_msg_ind_type = '''Can't find object with index {}. Please do bt.list() to make sure you type correct index'''.format(input_obj)
         if isinstance(input_obj, str):
-            yml_list = _get_yaml_list()
-            # note: el.split('_', maxsplit=1) = (yml_type, yml_name)
-            yml_name_found = [el for el in yml_list if el.split('_', maxsplit=1)[0] == expect_yml_type
-                            and el.split('_', maxsplit=1)[1] == input_obj+FEXT]
-            if yml_name_found:
-                with open(os.path.join(glbl.yaml_dir, yml_name_found[-1]), 'r') as f_out:
-                    output_obj = yaml.load(f_out)
+            # name or uid of the object
+            fname = _resolve_acqobj_fname(input_obj, expect_yml_type)
+            if fname:
+                output_obj = _load_acqobj_cached(os.path.join(glbl.yaml_dir, fname))
                 return output_obj
             else:
                 # if still can't find it after going over entire list
@@ -681,6 +1089,111 @@ class Scan(XPD):
 Remember xpdAcq like to think "run this Sample(sa) with this ScanPlan(sp)"
 Please do bt.list() to make sure you are handing correct object type'''.format(expect_class))
 
+def _yamify_many(objs):
+    ''' write acquire objects with one update of object list and index '''
+    lname = os.path.join(glbl.yaml_dir,'_acqobj_list.yml')
+    entries = OrderedDict()
+    with yaml_store.batch():
+        for obj in objs:
+            fname = obj._name_for_obj_yaml_file(obj.name, obj.type)
+            yaml_store.dump(obj._to_dict(), os.path.join(obj._yaml_path(), fname))
+            entries[fname] = {'name': obj.name, 'type': obj.type,
+                              'uid': obj.md.get('_'.join([obj.type, 'uid']))}
+        def _add(objlist):
+            listed = set(objlist)
+            return list(objlist) + [f for f in entries if f not in listed]
+        yaml_store.update(lname, _add)
+        _update_acqobj_index(dict(entries))
+
+def _read_sample_sheet(fpath):
+    ''' rows of a .csv or .xlsx sample sheet as a list of dicts '''
+    ext = os.path.splitext(fpath)[1].lower()
+    if ext == '.csv':
+        with open(fpath, newline='') as f:
+            return list(csv.DictReader(f))
+    elif ext in ('.xlsx', '.xls'):
+        try:
+            import pandas as pd
+            df = pd.read_excel(fpath, dtype=str)
+        except ImportError as err:
+            sys.exit(_graceful_exit('''Reading {} needs pandas with excel support ({}).
+Please save it as a .csv file and try again'''.format(fpath, err)))
+        return df.where(df.notnull(), None).to_dict('records')
+    else:
+        sys.exit(_graceful_exit('{} is not a .csv or .xlsx sample sheet'.format(fpath)))
+
+def import_sample_sheet(experiment, f_name=None):
+    ''' create Sample objects for every row of a sample sheet in xpdUser/Import
+
+    The sheet is a .csv or .xlsx file with a header row. The 'name' column
+    is required, a 'composition' column is checked to be a valid chemical
+    formula and every other column is stored as user supplied information,
+    as with ``Sample(name, experiment, **kwargs)``. All rows are checked
+    before anything is written; samples are then written in one go.
+
+    Parameters
+    ----------
+    experiment : xpdAcq.beamtime.Experiment object
+        experiment the samples belong to
+    f_name : str
+        optional. name of the sheet in xpdUser/Import. If not given, the
+        only .csv or .xlsx file in there is used
+
+    Returns
+    -------
+    samples : list
+        list of Sample objects, in order of the sheet
+    '''
+    src_dir = glbl.import_dir
+    if f_name is None:
+        sheets = [f for f in sorted(os.listdir(src_dir))
+                  if os.path.splitext(f)[1].lower() in ('.csv', '.xlsx', '.xls')]
+        if len(sheets) != 1:
+            sys.exit(_graceful_exit('''Found {} sample sheets in {}.
+Please give the file name, eg. import_sample_sheet(ex, 'samples.csv')'''.format(len(sheets), src_dir)))
+        f_name = sheets[0]
+    t0 = time.time()
+    rows = _read_sample_sheet(os.path.join(src_dir, f_name))
+    # validate every row first, so a bad row leaves the store untouched
+    valid = OrderedDict()
+    failures = []
+    for (i, row) in enumerate(rows, start=2): # row 1 is the header
+        kwargs = {k.strip(): v for (k, v) in row.items()
+                  if k and k.strip() and v not in (None, '')}
+        samname = kwargs.pop('name', None)
+        try:
+            if samname is None:
+                raise ValueError('name is missing')
+            try:
+                cleaned = _clean_name(samname)
+            except SystemExit:
+                # _clean_name has told why already
+                raise ValueError('invalid name {}'.format(samname))
+            if cleaned in valid:
+                raise ValueError('{} is also used in row {}'.format(samname, valid[cleaned][0]))
+            if 'composition' in kwargs:
+                composition_analysis(kwargs['composition'])
+        except ValueError as err:
+            failures.append('row {}: {}'.format(i, err))
+            continue
+        valid[cleaned] = (i, samname, kwargs)
+    if failures:
+        sys.exit(_graceful_exit('''Nothing imported from {}, please fix:
+{}'''.format(f_name, '\n'.join(failures))))
+    # samples that exist already keep their uid
+    index = _get_acqobj_index()
+    samples = []
+    for (cleaned, (i, samname, kwargs)) in valid.items():
+        entry = index.get('sa_{}.yml'.format(cleaned), {})
+        sa = Sample.__new__(Sample)
+        sa._setup(samname, experiment, kwargs, entry.get('uid'))
+        samples.append(sa)
+    _yamify_many(samples)
+    elapsed = time.time() - t0
+    print('INFO: imported {} samples from {} in {:.2f}s ({:.0f} rows/s)'
+          .format(len(samples), f_name, elapsed, len(samples) / max(elapsed, 1e-6)))
+    return samples
+
 def _clean_name(name,max_length=25):
     '''strips a string, but also removes internal whitespace
     '''
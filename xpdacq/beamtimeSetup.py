@@ -21,8 +21,10 @@ import yaml
 from time import strftime
 from xpdacq.utils import _graceful_exit
 from xpdacq.beamtime import Beamtime, XPD, Experiment, Sample, ScanPlan
-from xpdacq.beamtime import _clean_md_input, _get_hidden_list
+from xpdacq.beamtime import _clean_md_input, _get_hidden_list, _load_acqobj
+from xpdacq.beamtime import migrate_acqobj_store, _acqobj_store_is_current, _mark_acqobj_store_current
 from xpdacq.glbl import glbl
+from xpdacq.yamlstore import yaml_store, safe_load
 from shutil import ReadError
 
 home_dir = glbl.home
@@ -93,11 +95,13 @@ def _end_beamtime(base_dir=None,archive_dir=None,bto=None, usr_confirm = 'y'):
 
 def _load_bt(bt_yaml_path):
     btoname = os.path.join(glbl.yaml_dir,'bt_bt.yml')
-    if not os.path.isfile(btoname):
+    if not yaml_store.exists(btoname):
         sys.exit(_graceful_exit('''{} does not exist in {}. User might have deleted it accidentally.
 Please create it based on user information or contect user'''.format(os.path.basename(btoname), glbl.yaml_dir)))
-    with open(btoname, 'r') as fi:
-        bto = yaml.load(fi)
+    if not _acqobj_store_is_current():
+        # files of an older version, converted once
+        migrate_acqobj_store()
+    bto = _load_acqobj(btoname)
     return bto
     
 def _tar_user_data(archive_name, root_dir = None, archive_format ='tar'):
@@ -171,8 +175,7 @@ def _check_empty_environment(base_dir=None):
 
 def _init_dark_yaml():
     dark_scan_list = []
-    with open(glbl.dk_yaml, 'w') as f:
-        yaml.dump(dark_scan_list, f)
+    yaml_store.dump(dark_scan_list, glbl.dk_yaml)
 
 def _start_beamtime(safn,home_dir=None):
     ''' priviate function for beamline scientist
@@ -198,7 +201,7 @@ def _start_beamtime(safn,home_dir=None):
     configfile = os.path.join(glbl.xpdconfig,'saf{}.yml'.format(str(safn)))
     if os.path.isfile(configfile):
         with open(configfile, 'r') as fin:
-            setup_dict = yaml.load(fin)
+            setup_dict = safe_load(fin)
     else:
         sys.exit(_graceful_exit('the saf config file {} appears to be missing'.format(configfile)))
     try:
@@ -217,17 +220,20 @@ def _execute_start_beamtime(piname,safn,explist,wavelength=None,home_dir=None):
     saf_num = safn
     _make_clean_env()
     os.chdir(home_dir)
-    bt = Beamtime(PI_name,saf_num,experimenters=explist)
+    # all objects are written to disk once, when the batch exits
+    with yaml_store.batch():
+        bt = Beamtime(PI_name,saf_num,experimenters=explist)
 
-    # now populate the database with some lazy-user objects
-    ex = Experiment('l-user',bt)
-    sa = Sample('l-user',ex)
-    sc01 = ScanPlan('ct',{'exposure':0.1})
-    sc05 = ScanPlan('ct',{'exposure':0.5})
-    sc1 = ScanPlan('ct',{'exposure':1.0})
-    sc5 = ScanPlan('ct',{'exposure':5.0})
-    sc10 = ScanPlan('ct',{'exposure':10.0})
-    sc30 = ScanPlan('ct',{'exposure':30.0})
+        # now populate the database with some lazy-user objects
+        ex = Experiment('l-user',bt)
+        sa = Sample('l-user',ex)
+        sc01 = ScanPlan('ct',{'exposure':0.1})
+        sc05 = ScanPlan('ct',{'exposure':0.5})
+        sc1 = ScanPlan('ct',{'exposure':1.0})
+        sc5 = ScanPlan('ct',{'exposure':5.0})
+        sc10 = ScanPlan('ct',{'exposure':10.0})
+        sc30 = ScanPlan('ct',{'exposure':30.0})
+        _mark_acqobj_store_current()
     return bt
 
 #FIXME this function should be revisited later
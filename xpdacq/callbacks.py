@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# xpdacq            by Billinge Group
+#                   Simon J. L. Billinge sb2896@columbia.edu
+#                   (c) 2016 trustees of Columbia University in the City of
+#                        New York.
+#                   All rights reserved
+#
+# File coded by:    Timothy Liu, Simon Billinge
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+'''Callbacks subscribed to xpdRE during collection
+
+Callbacks are plain callables taking (name, doc), so they can be put in
+the subs dict handed to the run engine directly.
+'''
+import queue
+import threading
+import numpy as np
+from xpdacq.glbl import glbl
+
+class FrameStats(object):
+    ''' per-frame statistics of area detector images, for live QA
+
+    Mean, max and fraction of saturated pixels are computed on a
+    decimated view (every glbl.frame_stats_decimation-th pixel in each
+    direction) of every image, and running mean and standard deviation
+    of the frame means over the scan are kept with Welford's algorithm.
+    A frame with more than glbl.saturation_fraction of its pixels at or
+    above glbl.saturation_count is reported right away.
+
+    Images are handed to a worker thread, so the run engine never waits
+    on the statistics; if the worker falls behind by more than `maxsize`
+    frames, new frames are skipped rather than queued. The worker prints
+    the summary of its scan once it has processed the last frame, and the
+    next scan waits for it before starting over.
+
+    Parameters
+    ----------
+    maxsize : int
+        optional. frames waiting for the worker before new ones are skipped
+    '''
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.frames = []
+        self.skipped = 0
+        self._queue = None
+        self._worker = None
+        # counters are updated by both the run engine and the worker
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        with self._lock:
+            self.frames = []
+            self.skipped = 0
+            self.n = 0
+            self.mean = 0.
+            self._m2 = 0.
+
+    def __call__(self, name, doc):
+        getattr(self, name, lambda doc: None)(doc)
+
+    def start(self, doc):
+        # the previous scan, including its summary, is done first
+        self.join()
+        self._reset()
+        # unbounded, so the end of scan sentinel always fits in
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._work, args=(self._queue,),
+                                        daemon=True)
+        self._worker.start()
+
+    def event(self, doc):
+        if self._queue is None:
+            return
+        img_fields = [k for k in doc['data'] if k.endswith('_image')]
+        if not img_fields:
+            return
+        if self._queue.qsize() >= self.maxsize:
+            self._skip()
+            return
+        self._queue.put_nowait((doc['seq_num'], doc['data'][img_fields[0]]))
+
+    def stop(self, doc):
+        if self._queue is not None:
+            # the worker finishes the frames queued so far, then summarizes
+            self._queue.put_nowait(None)
+            self._queue = None
+
+    def join(self, timeout=None):
+        ''' wait for the statistics of the current scan to be complete '''
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def _work(self, frame_queue):
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                self._print_summary()
+                return
+            (seq_num, value) = item
+            img = _frame(value)
+            if img is None:
+                self._skip()
+                continue
+            stats = frame_stats(img)
+            stats['seq_num'] = seq_num
+            self._add(stats)
+
+    def _add(self, stats):
+        with self._lock:
+            self.frames.append(stats)
+            # Welford's running mean and variance of the frame means
+            self.n += 1
+            delta = stats['mean'] - self.mean
+            self.mean += delta / self.n
+            self._m2 += delta * (stats['mean'] - self.mean)
+        if stats['saturated']:
+            print('WARNING: frame {} has {:.2%} saturated pixels'
+                  .format(stats['seq_num'], stats['saturation']))
+
+    @property
+    def std(self):
+        ''' standard deviation of the frame means so far '''
+        return np.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else 0.
+
+    def summary(self):
+        ''' scan level statistics of the frames processed so far '''
+        with self._lock:
+            return {'num_frames': self.n, 'mean': self.mean, 'std': self.std,
+                    'max': max([f['max'] for f in self.frames], default=None),
+                    'saturated_frames': [f['seq_num'] for f in self.frames
+                                         if f['saturated']],
+                    'skipped': self.skipped}
+
+    def _print_summary(self):
+        summary = self.summary()
+        print('INFO: frame statistics of {} frame(s): mean = {:.4g} +/- {:.4g}, max = {}'
+              .format(summary['num_frames'], summary['mean'], summary['std'],
+                      summary['max']))
+        if summary['saturated_frames']:
+            print('WARNING: saturated frame(s): {}'.format(summary['saturated_frames']))
+        if summary['skipped']:
+            print('INFO: {} frame(s) were not analyzed'.format(summary['skipped']))
+
+
+def frame_stats(img):
+    ''' mean, max and saturated fraction of a decimated view of img
+
+    Parameters
+    ----------
+    img : ndarray
+        area detector image
+
+    Returns
+    -------
+    stats : dict
+        'mean', 'max', 'saturation' (fraction of pixels at or above
+        glbl.saturation_count) and 'saturated' (saturation above
+        glbl.saturation_fraction)
+    '''
+    step = max(int(glbl.frame_stats_decimation), 1)
+    view = np.asarray(img)
+    # a strided view, nothing is copied
+    view = view[(slice(None, None, step),) * view.ndim]
+    saturation = np.count_nonzero(view >= glbl.saturation_count) / view.size
+    return {'mean': float(view.mean()), 'max': view.max().item(),
+            'saturation': saturation,
+            'saturated': saturation > glbl.saturation_fraction}
+
+def _frame(value):
+    ''' image of an event, read from filestore when only referenced '''
+    if isinstance(value, np.ndarray):
+        return value
+    try:
+        from filestore.api import retrieve
+    except ImportError:
+        return None
+    try:
+        return np.asarray(retrieve(value))
+    except Exception:
+        # not written yet or unreadable, statistics are best effort
+        return None
@@ -15,24 +15,147 @@
 #from xpdacq.glbl import SHUTTER as shutter
 from xpdacq.glbl import glbl
 import time
+import threading
+from xpdacq.yamlstore import yaml_store
 
 shutter = glbl.shutter
+# state the shutter was last asked for, restored after a beam dump
+_shutter_requested = {'open': False}
 
 
 def _open_shutter():
+    _shutter_requested['open'] = True
     shutter.put(1)
     while True:
         if shutter.get():
             break
         time.sleep(0.5)
-    time.sleep(2.5) # this hasn't been solved as of 03/11/2016
+    time.sleep(glbl.shutter_latency) # this hasn't been solved as of 03/11/2016
     return 
            
 def _close_shutter():
+    _shutter_requested['open'] = False
     shutter.put(0)
     while True:
         if not shutter.get():
             break
         time.sleep(0.5)
-    time.sleep(2.5) # this hasn't been solved as of 03/11/2016
+    time.sleep(glbl.shutter_latency) # this hasn't been solved as of 03/11/2016
     return        
+
+
+class _BeamDumpMonitor(object):
+    ''' follows the ring current next to the beam dump suspender
+
+    The suspender pauses and resumes the run engine. This keeps track of
+    outages and, once the beam is back, drops darks taken before the
+    outage from the dark list (so the next scans collect fresh ones) and
+    records the time lost in glbl.beamdump_yaml. The shutter is opened
+    again by the suspender itself, right before the scan resumes (see
+    _beamdump_resume_plan).
+    '''
+    def __init__(self):
+        self.dump_time = None
+
+    def __call__(self, value=None, timestamp=None, **kwargs):
+        # ophyd subscription callback, called from the channel access thread
+        now = timestamp or time.time()
+        if value < glbl.beamdump_floor:
+            if self.dump_time is None:
+                self.dump_time = now
+                print('INFO: beam dump detected, current scan is suspended '
+                      'until the beam is back')
+        elif self.dump_time is not None:
+            (dump_time, self.dump_time) = (self.dump_time, None)
+            # don't keep the channel access thread busy with the yaml files
+            threading.Thread(target=self._recover, args=(dump_time, now),
+                             daemon=True).start()
+
+    def _recover(self, dump_time, recover_time):
+        n_dark = _invalidate_darks(recover_time)
+        # the run engine waits resume_sleep more before going on
+        lost_time = recover_time - dump_time + glbl.beamdump_resume_sleep
+        outage = {'dump_time': dump_time, 'recover_time': recover_time,
+                  'lost_time': lost_time, 'darks_invalidated': n_dark}
+        yaml_store.update(glbl.beamdump_yaml,
+                          lambda outages: (outages or []) + [outage], missing_ok=True)
+        print('INFO: beam is back after {:.0f}s, {} dark(s) invalidated; '
+              'scan resumes in {:.0f}s'.format(recover_time - dump_time, n_dark,
+                                               glbl.beamdump_resume_sleep))
+
+_beamdump_monitor = _BeamDumpMonitor()
+
+def _beamdump_resume_plan():
+    ''' run by the suspender after the resume sleep, reopens the shutter if a scan had it open '''
+    if _shutter_requested['open']:
+        yield glbl.Msg('set', shutter, 1, block_group='shutter')
+        yield glbl.Msg('wait', None, 'shutter')
+        yield glbl.Msg('sleep', None, glbl.shutter_latency)
+
+def _invalidate_darks(before):
+    ''' drop darks collected before this time from the dark list, return how many '''
+    if not yaml_store.exists(glbl.dk_yaml):
+        return 0
+    n_dark = len(yaml_store.load(glbl.dk_yaml))
+    yaml_store.update(glbl.dk_yaml,
+                      lambda dark_list: [el for el in dark_list if el[2] >= before])
+    return n_dark - len(yaml_store.load(glbl.dk_yaml))
+
+def beamdump_suspender(enable=True):
+    ''' install or remove the beam dump suspender of xpdRE
+
+    The suspender is installed before the first scan of the session
+    (unless glbl.beamdump_auto is False); call this to set it up again
+    from the present ring current, or with False to remove it for the
+    rest of the session.
+
+    The floor, glbl.beamdump_floor, is glbl.beamdump_fraction of the
+    ring current at the time the suspender is enabled, so enable it only
+    while the beam is up at its usual current. While installed, a scan is
+    suspended when the ring current drops below the floor and resumed
+    glbl.beamdump_resume_sleep seconds after it is back, so a queue
+    survives a beam dump. Once the beam is back, darks older than the
+    outage are dropped and the outage is recorded (see beamdump_stats);
+    the shutter is opened again, if it was open, only when the scan
+    resumes.
+
+    Parameters
+    ----------
+    enable : bool
+        optional. True to install, False to remove. Default is True
+    '''
+    # removed by hand, it is not installed again before the next scan
+    glbl.beamdump_auto = enable
+    if glbl.beamdump_sus is not None:
+        glbl.xpdRE.remove_suspender(glbl.beamdump_sus)
+        glbl.ring_current.clear_sub(_beamdump_monitor)
+        glbl.beamdump_sus = None
+        _beamdump_monitor.dump_time = None
+    if enable:
+        current = glbl.ring_current.get()
+        glbl.beamdump_floor = current*glbl.beamdump_fraction
+        glbl.beamdump_sus = glbl.SuspendFloor(glbl.ring_current,
+                glbl.beamdump_floor, resume_thresh=glbl.beamdump_floor,
+                sleep=glbl.beamdump_resume_sleep,
+                post_plan=_beamdump_resume_plan)
+        glbl.xpdRE.install_suspender(glbl.beamdump_sus)
+        glbl.ring_current.subscribe(_beamdump_monitor)
+        print('INFO: beam dump suspender is installed, scans are suspended '
+              'below a ring current of {:.4g}'.format(glbl.beamdump_floor))
+    else:
+        print('INFO: beam dump suspender is removed')
+
+def beamdump_stats():
+    ''' beam dumps of this beamtime and total time lost to them
+
+    Returns
+    -------
+    stats : dict
+        'outages', list of dicts with dump_time, recover_time, lost_time
+        (in s) and darks_invalidated, and 'lost_time', their sum in s
+    '''
+    outages = []
+    if yaml_store.exists(glbl.beamdump_yaml):
+        outages = yaml_store.load(glbl.beamdump_yaml)
+    return {'outages': outages,
+            'lost_time': sum(el['lost_time'] for el in outages)}
@@ -14,6 +14,24 @@ ARCHIVE_BASE_DIR_NAME = 'pe2_data/.userBeamtimeArchive'
 USER_BACKUP_DIR_NAME = strftime('%Y')
 DARK_WINDOW = 3000 # default value, in terms of minute
 FRAME_ACQUIRE_TIME = 0.1 # pe1 frame acq time
+MAX_FRAME_ACQUIRE_TIME = FRAME_ACQUIRE_TIME # longest frame the exposure planner may use, in s
+EST_WRITEOUT_OVERHEAD = 2 # default per-point overhead in s, until one is measured
+TADAPT_FOM_THRESHOLD = 0.05 # relative change between frames that refines Tadapt steps
+TADAPT_FOM_FIELD = None # detector field used as Tadapt figure of merit, eg. a stats plugin total. None uses the image
+SHUTTER_LATENCY = 2.5 # extra wait after shutter reports open/closed, in s
+EST_TEMP_RAMP_RATE = 6 # typical temperature controller ramp rate in K/min, for estimates
+EST_TEMP_SETTLE_TIME = 10 # typical settle time at a temperature setpoint in s, for estimates
+YAML_FLUSH_INTERVAL = 5 # longest time batched yaml writes are kept in memory, in s
+HEADER_CACHE_SIZE = 512 # databroker query results kept in memory by analysis helpers
+HEADER_CACHE_TTL = 600 # time a cached databroker query result is used, in s
+FRAME_STATS_DECIMATION = 4 # frame statistics use every 4th pixel in each direction
+SATURATION_COUNT = 65535 # pixel value of a saturated pe1 pixel
+SATURATION_FRACTION = 0.001 # fraction of saturated pixels that flags a frame
+BEAMDUMP_FRACTION = 0.9 # ring current below this fraction of its value at startup is a beam dump
+BEAMDUMP_RESUME_SLEEP = 1200 # wait after the beam is back before resuming, in s
+BEAMDUMP_AUTO = True # install the beam dump suspender before the first scan
+CONTROL_POLL_INTERVAL = 1 # how often the run control token is checked, in s
+DET_VERIFY_INTERVAL = 300 # how often cached detector settings are checked against readbacks, in s
 OWNER = 'xf28id1'
 BEAMLINE_ID = 'xpd'
 GROUP = 'XPD'
@@ -35,11 +53,14 @@ BLCONFIG_DIR = os.path.join(BASE_DIR, BLCONFIG_DIR_NAME)
 ARCHIVE_BASE_DIR = os.path.join(BASE_DIR,ARCHIVE_BASE_DIR_NAME)
 YAML_DIR = os.path.join(HOME_DIR, 'config_base', 'yml')
 DARK_YAML_NAME = os.path.join(YAML_DIR, '_dark_scan_list.yaml')
+OVERHEAD_YAML_NAME = os.path.join(YAML_DIR, '_overhead_list.yaml')
+BEAMDUMP_YAML_NAME = os.path.join(YAML_DIR, '_beamdump_list.yaml')
 CONFIG_BASE = os.path.join(HOME_DIR, 'config_base')
+CONTROL_TOKEN_NAME = os.path.join(CONFIG_BASE, '.run_control')
 IMPORT_DIR = os.path.join(HOME_DIR, 'Import')
 USERSCRIPT_DIR = os.path.join(HOME_DIR, 'userScripts')
 TIFF_BASE = os.path.join(HOME_DIR, 'tiff_base')
-ALLOWED_SCANPLAN_TYPE =['ct', 'Tramp', 'tseries']
+ALLOWED_SCANPLAN_TYPE =['ct', 'Tramp', 'tseries', 'ftseries', 'Tcont', 'Tadapt']
 
 USER_BACKUP_DIR = os.path.join(ARCHIVE_BASE_DIR, USER_BACKUP_DIR_NAME)
 ALL_FOLDERS = [
@@ -82,7 +103,29 @@ class glbl():
     dk_yaml = DARK_YAML_NAME
     dk_window = DARK_WINDOW
     frame_acq_time = FRAME_ACQUIRE_TIME
+    max_frame_acq_time = MAX_FRAME_ACQUIRE_TIME
+    oh_yaml = OVERHEAD_YAML_NAME
+    beamdump_yaml = BEAMDUMP_YAML_NAME
+    beamdump_fraction = BEAMDUMP_FRACTION
+    beamdump_resume_sleep = BEAMDUMP_RESUME_SLEEP
+    beamdump_auto = BEAMDUMP_AUTO
+    control_token = CONTROL_TOKEN_NAME
+    control_poll_interval = CONTROL_POLL_INTERVAL
+    det_verify_interval = DET_VERIFY_INTERVAL
+    est_writeout_ohead = EST_WRITEOUT_OVERHEAD
+    Tadapt_fom_threshold = TADAPT_FOM_THRESHOLD
+    Tadapt_fom_field = TADAPT_FOM_FIELD
+    shutter_latency = SHUTTER_LATENCY
+    est_temp_ramp_rate = EST_TEMP_RAMP_RATE
+    est_temp_settle_time = EST_TEMP_SETTLE_TIME
+    yaml_flush_interval = YAML_FLUSH_INTERVAL
+    header_cache_size = HEADER_CACHE_SIZE
+    header_cache_ttl = HEADER_CACHE_TTL
+    frame_stats_decimation = FRAME_STATS_DECIMATION
+    saturation_count = SATURATION_COUNT
+    saturation_fraction = SATURATION_FRACTION
     auto_dark = True
+    frame_stats = False
     owner = OWNER
     beamline_id = BEAMLINE_ID
     group = GROUP
@@ -102,16 +145,17 @@ class glbl():
         from bluesky.callbacks import LiveTable as livetable
         from bluesky.callbacks.broker import verify_files_saved as verifyFiles
         from ophyd import EpicsSignalRO, EpicsSignal
-        from bluesky.suspenders import SuspendFloor
+        from bluesky.suspenders import SuspendFloor as suspendFloor
         ring_current = EpicsSignalRO('SR:OPS-BI{DCCT:1}I:Real-I', name='ring_current')
         xpdRE = RunEngine()
         xpdRE.md['owner'] = owner
         xpdRE.md['beamline_id'] = beamline_id
         xpdRE.md['group'] = group
         register_mds(xpdRE)
-        beamdump_sus = SuspendFloor(ring_current, ring_current.get()*0.9,
-                resume_thresh = ring_current.get()*0.9, sleep = 1200)
-        #xpdRE.install_suspender(beamdump_sus) # don't enable it untill beam is back
+        # floor is taken from the ring current when the suspender is
+        # installed, before the first scan, see control.beamdump_suspender
+        beamdump_floor = None
+        beamdump_sus = None
         # real imports
         Msg = msg
         Count = count
@@ -121,6 +165,7 @@ class glbl():
         get_images = getImages
         AbsScanPlan = absScanPlan 
         verify_files_saved = verifyFiles
+        SuspendFloor = suspendFloor
         # real collection objects
         area_det = None
         temp_controller = None
@@ -139,6 +184,11 @@ class glbl():
         LiveTable = mock_livetable
         verify_files_saved = MagicMock()
         # mock collection objects
+        SuspendFloor = MagicMock()
+        ring_current = MagicMock()
+        ring_current.get = MagicMock(return_value=400.)
+        beamdump_floor = 0.
+        beamdump_sus = None
         xpdRE = MagicMock()
         temp_controller = MagicMock()
         shutter = mock_shutter()
@@ -162,7 +162,11 @@ def set_event():
     return
 
 def show_obj(obj):
-    full_info = obj.__dict__
+    if hasattr(obj, '_own_md'):
+        # slot based xpd_md objects have no __dict__
+        full_info = obj._own_md()
+    else:
+        full_info = obj.__dict__
     real_info = {}
     
     for k in full_info.keys():
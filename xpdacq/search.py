@@ -7,11 +7,14 @@ import datetime
 from tifffile import *
 import matplotlib.pyplot as plt
 import json
+import itertools
+from collections import OrderedDict
 
 from xpdacq.config import datapath
 from xpdacq.utils import composition_analysis
 from xpdacq.control import _get_obj
 from xpdacq.analysis import *
+from xpdacq.analysis import _cached_search, _header_cache, _feature_gen
 
 pd.set_option('max_colwidth',40)
 pd.set_option('colheader_justify','left')
@@ -25,56 +28,59 @@ get_events = _get_obj('get_events')
 ##### common functions #####
 
 
-def table_gen(headers):
+# start document fields tabulated by table_gen, next to the file name feature
+_table_fields = ['uid', 'sa_name', 'sp_name', 'sp_type', 'time']
+
+def table_gen(headers, fields=None, use_cache=True):
     ''' Takes in a header list generated by search functions and return a table
     with metadata information
 
+    Fields are pulled out of the start documents column by column in one
+    pass and the table is built from those columns, so thousands of
+    headers are tabulated quickly. uid is shortened to 5 characters and
+    time is shown as a date.
+
     Argument:
     headers - list - a list of bluesky header objects
-
+    fields - list - optional. start document fields to tabulate. Default is
+             uid, sa_name, sp_name, sp_type and time
+    use_cache - bool - optional. reuse the table of the same headers and
+                fields made earlier in this session. Default is True
     '''
-    plt_list = list()
-    feature_list = list()
-    uid_list = list()
-
     if type(list(headers)[0]) == str:
         header_list = []
         header_list.append(headers)
     else:
-        header_list = headers
-
-    for header in header_list:
-        f_name =_feature_gen(header)
-        feature_list.append(f_name)
-        try:
-            uid_list.append(header.start['uid'][:5])
-        except KeyError:
-            # jsut in case, it should never happen
-            print('Some of your data do not even have a uid, it is very dangerous, please contact beamline scientist immediately')
-    plt_list = [feature_list, comment_list] # u_id for ultimate search
-    inter_tab = pd.DataFrame(plt_list)
-    tab = inter_tab.transpose()
-    tab.columns=['Features', 'Comments' ]
-
-    return tab
-
-
-def time_search(startTime,stopTime=False,exp_day1=False,exp_day2=False):
-    '''return list of experiments run in the interval startTime to stopTime
-
-    this function will return a set of events from dataBroker that happened
-    between startTime and stopTime on exp_day
-
-    arguments:
-    startTime - datetime time object or string or integer - time a the beginning of the
-                period that you want to pull data from.  The format could be an integer
-                between 0 and 24 to set it at a  whole hour, or a datetime object to do
-                it more precisely, e.g., datetime.datetime(13,17,53) for 53 seconds after
-                1:17 pm, or a string in the time form, e.g., '13:17:53' in the example above
-    stopTime -  datetime object or string or integer - as starTime but the latest time
-                that you want to pull data from
-    exp_day - str or datetime.date object - the day of the experiment.
-    '''
+        header_list = list(headers)
+    if fields is None:
+        fields = _table_fields
+    fields = list(fields)
+
+    def _build():
+        starts = [header['start'] for header in header_list]
+        columns = OrderedDict()
+        columns['Features'] = [_feature_gen(header) for header in header_list]
+        for field in fields:
+            columns[field] = [start.get(field) for start in starts]
+        if 'uid' in columns:
+            if None in columns['uid']:
+                # jsut in case, it should never happen
+                print('Some of your data do not even have a uid, it is very dangerous, please contact beamline scientist immediately')
+            columns['uid'] = [uid[:5] if uid else uid for uid in columns['uid']]
+        tab = pd.DataFrame(columns, columns=list(columns))
+        if 'time' in tab:
+            tab['time'] = pd.to_datetime(tab['time'], unit='s')
+        return tab
+
+    if not use_cache:
+        return _build()
+    uids = tuple(header['start']['uid'] for header in header_list)
+    # a copy, so changes to the table returned leave the cached one alone
+    return _header_cache.get(('table', uids, tuple(fields)), _build).copy()
+
+
+def _time_range(startTime, stopTime=False, exp_day1=False, exp_day2=False):
+    ''' start and stop of a time search as strings databroker understands '''
     # date part
     if exp_day1:
         if exp_day2:
@@ -105,18 +111,82 @@ def time_search(startTime,stopTime=False,exp_day1=False,exp_day2=False):
 
     timeHead = str(d0)+' '+str(t0)
     timeTail = str(d1)+' '+str(t1)
+    return timeHead, timeTail
+
+def time_search(startTime,stopTime=False,exp_day1=False,exp_day2=False):
+    '''return list of experiments run in the interval startTime to stopTime
 
-    header_time=db(start_time=timeHead,
-                   stop_time=timeTail)
+    this function will return a set of headers from dataBroker that happened
+    between startTime and stopTime on exp_day. Events are not read; use
+    time_search_summary to go through a long period run by run.
 
-    event_time = get_events(header_time, fill=False)
-    event_time = list(event_time)
+    arguments:
+    startTime - datetime time object or string or integer - time a the beginning of the
+                period that you want to pull data from.  The format could be an integer
+                between 0 and 24 to set it at a  whole hour, or a datetime object to do
+                it more precisely, e.g., datetime.datetime(13,17,53) for 53 seconds after
+                1:17 pm, or a string in the time form, e.g., '13:17:53' in the example above
+    stopTime -  datetime object or string or integer - as starTime but the latest time
+                that you want to pull data from
+    exp_day - str or datetime.date object - the day of the experiment.
+    '''
+    (timeHead, timeTail) = _time_range(startTime, stopTime, exp_day1, exp_day2)
+    header_time=_cached_search(start_time=timeHead,
+                               stop_time=timeTail)
 
     print('||You assign a time search in the period:\n'+str(timeHead)+' and '+str(timeTail)+'||' )
     print('||Your search gives out '+str(len(header_time))+' results||')
 
     return header_time
 
+def _header_summary(header):
+    ''' summary of a run from its start and stop documents only '''
+    start = header['start']
+    stop = header.get('stop') or {}
+    num_events = stop.get('num_events')
+    if isinstance(num_events, dict):
+        # counted per event stream
+        num_events = sum(num_events.values())
+    return {'uid': start['uid'],
+            'sa_name': start.get('sa_name'),
+            'sp_name': start.get('sp_name'),
+            'start_time': start.get('time'),
+            'stop_time': stop.get('time'),
+            'exit_status': stop.get('exit_status'),
+            'num_events': num_events}
+
+def time_search_summary(startTime, stopTime=False, exp_day1=False,
+                        exp_day2=False, page_size=None, page=0):
+    '''summaries of runs in the interval startTime to stopTime, as a generator
+
+    Arguments are the ones of time_search. Each run is summarized as a dict
+    with uid, sa_name, sp_name, start_time, stop_time, exit_status and
+    num_events, taken from its start and stop documents, so no event is
+    read and runs are only fetched as the generator is consumed.
+
+    arguments:
+    page_size - int - optional. yield lists of at most page_size summaries
+                instead of one summary at a time
+    page - int - optional. number of pages (or runs, without page_size) to skip
+
+    example:
+    for summary in time_search_summary(8, 20):
+        print(summary['sa_name'], summary['num_events'])
+    first_page = next(time_search_summary(8, 20, page_size=50))
+    '''
+    (timeHead, timeTail) = _time_range(startTime, stopTime, exp_day1, exp_day2)
+    headers = db(start_time=timeHead, stop_time=timeTail)
+    summaries = (_header_summary(h) for h in headers)
+    if not page_size:
+        yield from itertools.islice(summaries, page, None)
+        return
+    summaries = itertools.islice(summaries, page * page_size, None)
+    while True:
+        chunk = list(itertools.islice(summaries, page_size))
+        if not chunk:
+            return
+        yield chunk
+
 # FIXME - Refactor search function !!!!!!
 #### block of search functions ####
 def _list_keys( d, container):
@@ -276,17 +346,17 @@ def search(desired_value, *args, **kwargs):
             dummy_search_dict = {}
             dummy_search_dict[keychain_list[i]] = desired_value
             dummy_search_dict['group'] = 'XPD' # create an anchor as mongoDB and_search needs at least 2 key-value pairs
-            search_header = db(**dummy_search_dict)
+            search_header = _cached_search(**dummy_search_dict)
             search_header_list.append(search_header)
             print('Your %ith search "%s=%s" yields %i headers' % (i,
                 keychain_list[i], desired_value, len(search_header)))
             return search_header_list
-    elif not desired_value and kwars:
+    elif not desired_value and kwargs:
         if len(kwargs)>1:
-            search_header = db(**kwargs)
+            search_header = _cached_search(**kwargs)
         elif len(kwargs) == 1:
             kwargs['group'] = 'XPD'
-            search_header = db(**kwargs)
+            search_header = _cached_search(**kwargs)
         else:
             print('You gave empty search criteria. Please try again')
             return
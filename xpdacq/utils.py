@@ -1,11 +1,25 @@
 import os
+import re
 import sys
+import errno
 import shutil
-from shutil import ReadError
+import io
+import gzip
+import time
+import zipfile
+import hashlib
+import tempfile
+import asyncio
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import tarfile as tar
 from time import strftime
+import numpy as np
 
 from xpdacq.glbl import glbl
+from xpdacq.yamlstore import yaml_store, safe_dump, _match_mode
 def _graceful_exit(error_message):
     try:
         raise RuntimeError(error_message)
@@ -14,94 +28,465 @@ def _graceful_exit(error_message):
         sys.stderr.write('WHOOPS: {}'.format(str(err)))
         return 1
 
+# blanks, the hydrate separator and the tokens of a formula, compiled once
+_BLANK_RE = re.compile(r'\s')
+_HYDRATE_RE = re.compile(r'[\u00b7*]')
+_COEFF_RE = re.compile(r'(\d+(?:\.\d*)?|\.\d+)?(.*)$')
+# atom symbol with optional charge specification, brackets, counts
+_TOKEN_RE = re.compile(r'([A-Z][a-z]?(?:[1-8]?[+-])?)|([(\[])|([)\]])'
+                       r'|(\d+(?:\.\d*)?|\.\d+)|(.)')
+
 def composition_analysis(compstring):
     """Pulls out elements and their ratios from the config file.
 
     compstring   -- chemical composition of the sample, e.g.,
-                    "NaCl", "H2SO4", "La0.5 Ca0.5 Mn O3".  Blank
-                    characters are ignored, unit counts can be omitted.
+                    "NaCl", "H2SO4", "La0.5 Ca0.5 Mn O3", "Ca(OH)2" or
+                    "CuSO4*5H2O".  Blank characters are ignored, unit
+                    counts can be omitted. Groups in brackets are
+                    multiplied by the count that follows them and parts
+                    of a hydrate, separated by "*" or a middle dot, by
+                    their leading coefficient.
                     It is critical to use proper upper-lower case for atom
                     symbols as this is used to delimit them in the formula.
 
     Returns a list of atom symbols and a corresponding list of their counts.
+    Atoms showing up more than once are summed up, in order of first
+    appearance.
     """
-    import re
+    (names, fractions) = _parse_formula(compstring)
+    return list(names), list(fractions)
+
+@lru_cache(maxsize=1024)
+def _parse_formula(compstring):
     # remove all blanks
-    compbare = re.sub('\s', '', compstring)
+    compbare = _BLANK_RE.sub('', compstring)
     # reusable error message
+    emsg = 'invalid chemical composition "%s"' % compstring
     # make sure there is at least one uppercase character in the compstring
     upcasechars = any(str.isupper(c) for c in compbare)
     if not upcasechars and compbare:
-        emsg = 'invalid chemical composition "%s"' % compstring
         raise ValueError(emsg)
-    # split at every upper-case letter, possibly followed by a lower case
-    # one and charge specification
-    namefracs = re.split('([A-Z][a-z]?(?:[1-8]?[+-])?)', compbare)[1:]
-    names = namefracs[0::2]
-    # use unit count when empty, convert to float otherwise
-    getfraction = lambda s: (s == '' and 1.0 or float(s))
-    fractions = [getfraction(w) for w in namefracs[1::2]]
-    return names, fractions
+    counts = OrderedDict()
+    for part in _HYDRATE_RE.split(compbare) if compbare else []:
+        (coeff, formula) = _COEFF_RE.match(part).groups()
+        if not formula:
+            raise ValueError(emsg)
+        for (name, count) in _parse_group(formula, emsg).items():
+            counts[name] = counts.get(name, 0.) + count * float(coeff or 1.)
+    return tuple(counts.keys()), tuple(counts.values())
+
+def _parse_group(formula, emsg):
+    # stack of counts for every open bracket
+    stack = [OrderedDict()]
+    tokens = list(_TOKEN_RE.findall(formula))
+    i = 0
+    while i < len(tokens):
+        (name, opening, closing, number, other) = tokens[i]
+        i += 1
+        if opening:
+            stack.append(OrderedDict())
+            continue
+        if not (name or closing) or (closing and len(stack) == 1):
+            raise ValueError(emsg)
+        # use unit count when empty, convert to float otherwise
+        mult = 1.0
+        if i < len(tokens) and tokens[i][3]:
+            mult = float(tokens[i][3])
+            i += 1
+        if name:
+            group = {name: mult}
+        else:
+            group = stack.pop()
+            for k in group:
+                group[k] *= mult
+        for (k, v) in group.items():
+            stack[-1][k] = stack[-1].get(k, 0.) + v
+    if len(stack) != 1:
+        raise ValueError(emsg)
+    return stack[0]
+
+def composition_arrays(compstrings):
+    """Element/amount arrays of a whole sample library in one call.
+
+    Parameters
+    ----------
+    compstrings : list
+        chemical compositions, in any form taken by `composition_analysis`
+
+    Returns
+    -------
+    elements : list
+        every atom symbol found, in order of first appearance
+    amounts : ndarray
+        shape (len(compstrings), len(elements)), count of each element in
+        each composition, zero where absent
+    """
+    parsed = [_parse_formula(el) for el in compstrings]
+    elements = list(OrderedDict.fromkeys(n for (names, _) in parsed
+                                         for n in names))
+    col = {el: i for (i, el) in enumerate(elements)}
+    rows = np.repeat(np.arange(len(parsed)),
+                     [len(names) for (names, _) in parsed])
+    cols = np.array([col[n] for (names, _) in parsed for n in names],
+                    dtype=int)
+    amounts = np.zeros((len(parsed), len(elements)))
+    amounts[rows, cols] = [f for (_, fractions) in parsed for f in fractions]
+    return elements, amounts
+
+_CONTROL_COMMANDS = ('pause', 'resume', 'stop', 'abort', 'abort_all')
+
+def run_control(command):
+    ''' control the current scan and the remaining scans from anywhere
+
+    Writes `command` to the control token file (glbl.control_token), which
+    the session running scans picks up within glbl.control_poll_interval
+    seconds. It can be called from another ipython session or a script,
+    or the word can be written to the file by any other means, eg.
+    ``echo pause > ~/xpdUser/config_base/.run_control``.
+
+    Parameters
+    ----------
+    command : str
+        'pause' : pause the current scan, or hold before the next one
+        'resume' : resume a paused scan
+        'stop' : stop the current scan (marked as success), go on with the next one
+        'abort' : abort the current scan, go on with the next one
+        'abort_all' : abort the current scan and all successive ones
+    '''
+    if command not in _CONTROL_COMMANDS:
+        raise ValueError('command must be one of {}'.format(_CONTROL_COMMANDS))
+    fdir = os.path.dirname(glbl.control_token)
+    os.makedirs(fdir, exist_ok=True)
+    (fd, tmp_path) = tempfile.mkstemp(dir=fdir, prefix='.', suffix='.tmp')
+    # readable by the session running scans, even if it runs as another user
+    _match_mode(tmp_path, glbl.control_token)
+    with os.fdopen(fd, 'w') as f:
+        f.write(command)
+    os.replace(tmp_path, glbl.control_token)
+
+def _read_control():
+    try:
+        with open(glbl.control_token, 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _remove_control():
+    try:
+        os.remove(glbl.control_token)
+    except FileNotFoundError:
+        pass
+
+def _peek_control():
+    ''' command waiting in the control token, None if there is none '''
+    command = _read_control()
+    if not command:
+        # no token, or one still being written
+        return None
+    if command not in _CONTROL_COMMANDS:
+        print('WARNING: ignoring unknown command "{}" in {}'.format(command, glbl.control_token))
+        _remove_control()
+        return None
+    return command
+
+def _take_control():
+    ''' consume the command waiting in the control token '''
+    command = _read_control()
+    _remove_control()
+    return command if command in _CONTROL_COMMANDS else None
+
+def _RE_loop(RE_obj):
+    ''' event loop RE_obj runs its plans on '''
+    loop = getattr(RE_obj, 'loop', None)
+    if loop is None:
+        loop = getattr(RE_obj, '_loop', None)
+    if loop is None:
+        # what the run engine picks when it isn't given one
+        loop = asyncio.get_event_loop()
+    return loop
+
+class _ControlWatcher(object):
+    ''' asks a running scan to pause when a command is waiting
+
+    The command itself is left in the token, _RE_state_wrapper handles it
+    once the run engine is paused. Only checks the token file every
+    glbl.control_poll_interval seconds. The token is watched from a
+    thread of its own, but the pause is requested on the event loop of
+    the run engine, which is where it expects it.
+    '''
+    def __init__(self, RE_obj):
+        self.RE_obj = RE_obj
+        self._loop = _RE_loop(RE_obj)
+        self._pending = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(glbl.control_poll_interval)
+            if self.RE_obj.state != 'running' or self._pending.is_set():
+                continue
+            command = _peek_control()
+            if command in ('pause', 'stop', 'abort', 'abort_all'):
+                self._pending.set()
+                try:
+                    self._loop.call_soon_threadsafe(self._request_pause)
+                except RuntimeError:
+                    # loop is closed, nothing is running on it anymore
+                    self._pending.clear()
+
+    def _request_pause(self):
+        # on the run engine's loop
+        self._pending.clear()
+        if self.RE_obj.state == 'running':
+            self.RE_obj.request_pause()
+
+_control_watcher = None
+
+def _start_control_watcher(RE_obj):
+    global _control_watcher
+    if _control_watcher is None or _control_watcher.RE_obj is not RE_obj:
+        _control_watcher = _ControlWatcher(RE_obj)
+
+def _wait_for_control(wanted):
+    ''' sleep until one of the wanted commands shows up in the token, and take it '''
+    while True:
+        command = _peek_control()
+        if command in wanted:
+            return _take_control()
+        if command is not None:
+            print('INFO: "{}" can not be applied now, waiting for one of {}'
+                  .format(command, wanted))
+            _take_control()
+        time.sleep(glbl.control_poll_interval)
+
+def _check_queue_control():
+    ''' before a scan: hold while paused, leave if the remaining scans are aborted '''
+    command = _peek_control()
+    if command == 'abort_all':
+        _take_control()
+        sys.exit(_graceful_exit('''INFO: All successive scans are aborted'''))
+    elif command == 'pause':
+        _take_control()
+        print('INFO: paused before the next scan. Use run_control("resume") '
+              'or run_control("abort_all")')
+        if _wait_for_control(('resume', 'abort_all')) == 'abort_all':
+            sys.exit(_graceful_exit('''INFO: All successive scans are aborted'''))
+    elif command in ('resume', 'stop', 'abort'):
+        # nothing running to apply it to
+        _take_control()
 
 def _RE_state_wrapper(RE_obj):
     ''' a wrapper to check state of bluesky runengine object after pausing
 
-        it provides control to stop/abort/resume runengine under current package structure
+        it provides control to stop/abort/resume runengine under current package structure.
+        Commands come from the control token (see run_control), so paused
+        scans can be handled from another session or a script. Ctrl-C gives
+        the prompt back with the run engine still paused.
     '''
-    usr_input = input('')
-    # while loop gives chance to iteratively confirm user's input
     while RE_obj.state == 'paused':
-        if usr_input in ('resume()'):
+        command = _peek_control()
+        if command is None or command == 'pause':
+            _take_control()
+            print('INFO: scan is paused. Use run_control() with "resume", '
+                  '"stop", "abort" or "abort_all" (eg. from another session), '
+                  'or write one of them to {}'.format(glbl.control_token))
+            try:
+                command = _wait_for_control(('resume', 'stop', 'abort', 'abort_all'))
+            except KeyboardInterrupt:
+                print('INFO: run engine is still paused, use xpdRE.resume(), '
+                      'xpdRE.stop() or xpdRE.abort()')
+                return
+        else:
+            _take_control()
+        if command == 'resume':
             RE_obj.resume()
-        elif usr_input in ('abort()'):
-            abort_all = input('''current scan will be aborted. Do you want to abort all successive scans (if you are running a script)? y/[n]  ''')
-            while True:
-                if abort_all in ('y', 'yes'):
-                    sys.exit(_graceful_exit('''INFO: All successive scans are aborted'''))
-                elif abort_all in ('n', 'no'):
-                    print('''INFO: Current scan is aborted and successive ones are kept''')
-                    RE_obj.abort()
-                else:
-                    print('please reenter your input')
-        elif usr_input in ('stop()'):
+        elif command == 'stop':
             RE_obj.stop()
-        else:
-            print('please renter your input')
+        elif command == 'abort':
+            print('''INFO: Current scan is aborted and successive ones are kept''')
+            RE_obj.abort()
+        elif command == 'abort_all':
+            RE_obj.abort()
+            sys.exit(_graceful_exit('''INFO: All successive scans are aborted'''))
 
-def export_userScriptsEtc():
+def export_userScriptsEtc(incremental=False, compress=False):
     """ function that exports user defined objects/scripts stored under config_base and userScript
         
-        it will create a uncompressed tarball inside xpdUser/Export
+        it will create a tarball inside xpdUser/Export
+
+        Size, mtime and sha256 of every exported file are kept in a
+        manifest. With ``incremental=True`` only files changed since the
+        last export go into a delta tarball. Every tarball carries an index
+        (userScriptsEtc_index.yml) listing the full set of files and the
+        tarball holding the current version of each, so the full set is
+        restored by unpacking the listed tarballs in order.
+
+    Parameters
+    ----------
+        incremental : bool
+        optional. only export files changed since the last export. Default is False
+        compress : bool
+        optional. gzip the tarball, compressing chunks of it in parallel. Default is False
 
     Return
     ------
         archive_path : str
-        path to archive file just created
+        path to archive file just created, None if incremental and nothing changed
     """
-    F_EXT = '.tar'
+    F_EXT = '.tar.gz' if compress else '.tar'
     root_dir = glbl.home
     os.chdir(root_dir)
-    f_name = strftime('userScriptsEtc_%Y-%m-%dT%H%M') + F_EXT
+    tag = '_delta' if incremental else ''
+    f_name = strftime('userScriptsEtc_%Y-%m-%dT%H%M') + tag + F_EXT
+    # indexes refer to tarballs by name, never overwrite one
+    i = 1
+    while os.path.exists(os.path.join(glbl.home, f_name)):
+        f_name = strftime('userScriptsEtc_%Y-%m-%dT%H%M') + tag + '_{}'.format(i) + F_EXT
+        i += 1
     # extra work to avoid comple directory structure in tarball
     tar_f_name = os.path.join(glbl.home, f_name)
     export_dir_list = list(map(lambda x: os.path.basename(x), glbl._export_tar_dir))
-    with tar.open(tar_f_name, 'w') as f:
-        for el in export_dir_list:
-            f.add(el)
+    manifest_path = os.path.join(glbl.home, _EXPORT_MANIFEST)
+    manifest = {'archives': [], 'files': {}}
+    if os.path.isfile(manifest_path):
+        manifest = yaml_store.load(manifest_path)
+    elif incremental:
+        print('INFO: no previous export found, exporting all files')
+    old_files = manifest['files']
+    (dir_list, files) = _scan_export_dirs(export_dir_list, old_files)
+    changed = [arcname for (arcname, entry) in files.items()
+               if arcname not in old_files
+               or old_files[arcname]['sha256'] != entry['sha256']]
+    if incremental and old_files:
+        if not changed and set(files) == set(old_files):
+            print('INFO: nothing changed since last export {}'.format(manifest['archives'][-1]))
+            return
+        for (arcname, entry) in files.items():
+            # unchanged files stay in the tarball they were exported with
+            entry['archive'] = (f_name if arcname in changed
+                                else old_files[arcname]['archive'])
+        archives = manifest['archives'] + [f_name]
+        to_add = changed
+    else:
+        for entry in files.values():
+            entry['archive'] = f_name
+        archives = [f_name]
+        to_add = sorted(files)
+        # a full export keeps empty directories too
+        to_add = dir_list + to_add
+    # only tarballs still holding current files are needed to restore
+    needed = set(entry['archive'] for entry in files.values())
+    index = {'archive': f_name, 'archives': [a for a in archives if a in needed],
+             'files': files}
+    tmp_tar = tar_f_name + '.tmp'
+    try:
+        with tar.open(tmp_tar, 'w') as f:
+            for el in to_add:
+                f.add(el, recursive=False)
+            index_bytes = safe_dump(index).encode()
+            info = tar.TarInfo(_EXPORT_INDEX)
+            info.size = len(index_bytes)
+            info.mtime = time.time()
+            f.addfile(info, io.BytesIO(index_bytes))
+        if compress:
+            _parallel_gzip(tmp_tar, tar_f_name)
+            os.remove(tmp_tar)
+        else:
+            os.replace(tmp_tar, tar_f_name)
+    finally:
+        if os.path.exists(tmp_tar):
+            os.remove(tmp_tar)
     archive_path = os.path.join(glbl.home, f_name)
     if os.path.isfile(archive_path):
+        manifest = {'archives': index['archives'], 'files': files}
+        yaml_store.dump(manifest, manifest_path)
+        print('INFO: exported {} of {} files to {}'.format(
+            len(changed) if incremental and old_files else len(files),
+            len(files), archive_path))
         return archive_path
     else:
         _graceful_exit('Did you accidentally change write privilege to {}'.format(glbl.home))
         print('Please check your setting and try `export_userScriptsEtc()` again at command prompt')
         return
 
+# kept in xpdUser, what the last export has seen
+_EXPORT_MANIFEST = '.userScriptsEtc_manifest.yml'
+# stored in every exported tarball, ignored on import
+_EXPORT_INDEX = 'userScriptsEtc_index.yml'
+# size of the chunks compressed in parallel by _parallel_gzip
+_GZIP_CHUNK_SIZE = 4 * 1024 * 1024
+
+def _scan_export_dirs(export_dir_list, old_files):
+    """ walk the export dirs, relative to cwd
+
+    Files are hashed only if size or mtime differ from old_files.
+    Hidden files (lock and temporary files) are left out.
+
+    Returns
+    -------
+        (dir_list, files) : tuple
+        directories found, and dict of file path -> size, mtime and sha256
+    """
+    dir_list = []
+    files = {}
+    for el in export_dir_list:
+        for (root, dirs, f_names) in os.walk(el):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            dir_list.append(root)
+            for f_name in sorted(f_names):
+                if f_name.startswith('.'):
+                    continue
+                arcname = os.path.join(root, f_name)
+                st = os.stat(arcname)
+                entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+                old = old_files.get(arcname)
+                if (old is not None and old['size'] == entry['size']
+                        and old['mtime_ns'] == entry['mtime_ns']):
+                    entry['sha256'] = old['sha256']
+                else:
+                    entry['sha256'] = _sha256(arcname)
+                files[arcname] = entry
+    return dir_list, files
+
+def _sha256(fpath):
+    h = hashlib.sha256()
+    with open(fpath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _parallel_gzip(src_path, dst_path):
+    """ gzip src_path to dst_path, compressing chunks in parallel threads
+
+    Every chunk becomes one gzip member; a file made of several members
+    is still a valid gzip file, read by tarfile and gunzip as a whole.
+    """
+    workers = os.cpu_count() or 1
+    with open(src_path, 'rb') as fsrc, open(dst_path, 'wb') as fdst, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        chunks = iter(lambda: fsrc.read(_GZIP_CHUNK_SIZE), b'')
+        while True:
+            # bounded number of chunks in memory at a time
+            window = [executor.submit(gzip.compress, c)
+                      for (_, c) in zip(range(2 * workers), chunks)]
+            if not window:
+                break
+            for fut in window:
+                fdst.write(fut.result())
+
 def import_userScriptsEtc():
     '''Import user files that have been placed in xpdUser/Import for use by xpdAcq
 
     Allowed files are python user-script files (extension .py), detector-image mask files (.npy) or files containing xpdAcq objects (extension .yml).
     Files created by running export_userScriptsEtc() are also allowed.  Unallowed files (anything not in the previous list) will be ignored. 
 
+    Archives (tar, compressed tar or zip) are read member by member and
+    every allowed file is written straight to where it belongs, several
+    archives at once. When several members go to the same file, the last
+    one of the last archive (in sorted order) is kept. Archives themselves
+    are left in xpdUser/Import.
+
     After import, all files in the xpdUser/import directory will be deleted
     The user can run `export_userScriptsEtc` to revert them.
 
@@ -110,66 +495,191 @@ def import_userScriptsEtc():
         moved_list : list
         a list of file names that have been moved successfully
     '''
-    _f_ext_dst_dict = ['py', 'npy', 'yml']
     src_dir = glbl.import_dir
-    f_list = os.listdir(src_dir)
+    f_list = sorted(os.listdir(src_dir))
     if len(f_list) == 0:
         print('INFO: There is no predefined user objects in {}'.format(src_dir))
         return 
-    # unpack every archived file in Import/
-    for f in f_list:
-        try:
-            # shutil should handle all compressed cases
-            tar_full_path = os.path.join(src_dir, f)
-            shutil.unpack_archive(tar_full_path, src_dir)
-        except ReadError:
-            pass
-    f_list = os.listdir(src_dir) # new f_list, after unpack
     moved_list = []
     failure_list = []
+    archive_list = []
     for f_name in f_list:
-        if os.path.isfile(os.path.join(src_dir, f_name)):
-            src_full_path = os.path.join(src_dir, f_name)
-            (root, ext) = os.path.splitext(f_name)
-            if ext == '.yml':
-                dst_dir = glbl.yaml_dir
-                yml_dst_name = _copy_and_delete(f_name, src_full_path, dst_dir)
-                moved_list.append(yml_dst_name)
-            elif ext == '.py':
-                dst_dir = glbl.usrScript_dir
-                py_dst_name = _copy_and_delete(f_name, src_full_path, dst_dir) 
-                moved_list.append(py_dst_name)
-            elif ext == '.npy':
-                dst_dir = glbl.config_base
-                npy_dst_name = _copy_and_delete(f_name, src_full_path, dst_dir) 
-                moved_list.append(npy_dst_name)
-            elif ext in ('.tar', '.zip', '.gztar'):
-                pass
+        src_full_path = os.path.join(src_dir, f_name)
+        if os.path.isfile(src_full_path):
+            dst_dir = _import_dst_dir(f_name)
+            if dst_dir is not None:
+                dst_name = _move_to_dst(f_name, src_full_path, dst_dir)
+                if dst_name is not None:
+                    moved_list.append(dst_name)
+                else:
+                    failure_list.append(f_name)
+            elif tar.is_tarfile(src_full_path) or zipfile.is_zipfile(src_full_path):
+                archive_list.append(src_full_path)
             else:
                 print('{} is not a supported format'.format(f_name))
                 failure_list.append(f_name)
-                pass
         else:
             # don't expect user to have directory
             print('''I can only import files, not directories. Please place in the import directory either:
                 (1) all your files such as scripts, masks and xpdAcq object yaml files or 
                 (2) a tar or zipped-tar archive file containing those files.'''.format(f_name))
             failure_list.append(f_name)
-            pass
+    # archives are independent of each other, read them in parallel.
+    # Members are put in place after the loose files, as they used to
+    # overwrite them, and in archive order, so the outcome is always the same
+    if archive_list:
+        workers = min(len(archive_list), _IMPORT_WORKERS)
+        staged = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_extract_archive, el) for el in archive_list]
+        errors = [future.exception() for future in futures if future.exception()]
+        for future in futures:
+            if future.exception() is None:
+                (archive_staged, skipped) = future.result()
+                staged.extend(archive_staged)
+                failure_list.extend(skipped)
+        if errors:
+            # nothing of a partly read set of archives is put in place
+            for (_, tmp_path, _) in staged:
+                os.remove(tmp_path)
+            raise errors[0]
+        moved_list.extend(_commit_staged(staged))
     if failure_list:
         print('Finished importing. Failed to move {} but they will leave in Import/'.format(failure_list))
     return moved_list
 
-def _copy_and_delete(f_name, src_full_path, dst_dir):
-    shutil.copy(src_full_path, dst_dir)
-    dst_name = os.path.join(dst_dir, f_name) 
-    if os.path.isfile(dst_name):
-        print('{} has been successfully moved to {}'.format(f_name, dst_dir))
-        os.remove(src_full_path)
-        return dst_name
-    else:
+# archives extracted at the same time by import_userScriptsEtc
+_IMPORT_WORKERS = 4
+
+def _import_dst_dir(f_name):
+    ''' directory a file of this name is imported to, None if not supported '''
+    ext = os.path.splitext(f_name)[1]
+    return {'.yml': glbl.yaml_dir, '.py': glbl.usrScript_dir,
+            '.npy': glbl.config_base}.get(ext)
+
+def _stage_to_dst(fsrc, f_name, dst_dir):
+    ''' write content of file object fsrc to a temporary file in dst_dir
+
+    The temporary file gets the mode dst_dir/f_name has (or the default
+    one), it only has to be renamed over it. Returns its path.
+    '''
+    os.makedirs(dst_dir, exist_ok=True)
+    (fd, tmp_path) = tempfile.mkstemp(dir=dst_dir, prefix='.', suffix='.tmp')
+    try:
+        _match_mode(tmp_path, os.path.join(dst_dir, f_name))
+        with os.fdopen(fd, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path
+
+def _write_to_dst(fsrc, f_name, dst_dir):
+    ''' write content of file object fsrc to dst_dir/f_name, atomically '''
+    tmp_path = _stage_to_dst(fsrc, f_name, dst_dir)
+    os.replace(tmp_path, os.path.join(dst_dir, f_name))
+    return os.path.join(dst_dir, f_name)
+
+def _extract_archive(archive_path):
+    ''' stage the supported members of a tar or zip archive
+
+    Members are streamed to temporary files next to their destination,
+    without extracting the archive first; directories inside the archive
+    are ignored. Nothing is put in place yet, see _commit_staged.
+
+    Returns
+    -------
+        (staged, skipped) : tuple
+        list of (destination path, temporary path, member) in archive
+        order, and list of members not supported
+    '''
+    staged = []
+    skipped = []
+    a_name = os.path.basename(archive_path)
+    try:
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as zf:
+                members = [(m.filename, m) for m in zf.infolist()
+                           if not m.is_dir() and m.filename != _EXPORT_INDEX]
+                for (m_name, m) in members:
+                    f_name = os.path.basename(m_name)
+                    dst_dir = _import_dst_dir(f_name)
+                    if dst_dir is None:
+                        skipped.append('{}:{}'.format(a_name, m_name))
+                        continue
+                    with zf.open(m) as fsrc:
+                        staged.append((os.path.join(dst_dir, f_name),
+                                       _stage_to_dst(fsrc, f_name, dst_dir),
+                                       '{}:{}'.format(a_name, m_name)))
+        else:
+            # tarfile works out the compression itself; members are read in order
+            with tar.open(archive_path, 'r:*') as tf:
+                for m in tf:
+                    if not m.isfile() or m.name == _EXPORT_INDEX:
+                        continue
+                    f_name = os.path.basename(m.name)
+                    dst_dir = _import_dst_dir(f_name)
+                    if dst_dir is None:
+                        skipped.append('{}:{}'.format(a_name, m.name))
+                        continue
+                    staged.append((os.path.join(dst_dir, f_name),
+                                   _stage_to_dst(tf.extractfile(m), f_name, dst_dir),
+                                   '{}:{}'.format(a_name, m.name)))
+    except BaseException:
+        for (_, tmp_path, _) in staged:
+            os.remove(tmp_path)
+        raise
+    return staged, skipped
+
+def _commit_staged(staged):
+    ''' put staged archive members in place, resolving same-named ones
+
+    Members going to the same destination (same file name in different
+    archives, or in different directories of one archive) are resolved
+    in a fixed order: the last one of the last archive, in the sorted
+    order archives are imported in, is kept and the others are dropped.
+    Later exports come later in that order, so the newest copy wins.
+
+    Returns
+    -------
+        moved : list
+        destination paths written
+    '''
+    winners = OrderedDict()
+    for (dst_path, tmp_path, member) in staged:
+        if dst_path in winners:
+            (_, dropped_tmp, dropped_member) = winners.pop(dst_path)
+            os.remove(dropped_tmp)
+            print('INFO: {} and {} are both imported as {}, only {} is kept'
+                  .format(dropped_member, member, dst_path, member))
+        winners[dst_path] = (dst_path, tmp_path, member)
+    moved = []
+    for (dst_path, tmp_path, member) in winners.values():
+        os.replace(tmp_path, dst_path)
+        moved.append(dst_path)
+        print('{} has been successfully extracted from {} to {}'
+              .format(os.path.basename(dst_path), member.split(':', 1)[0],
+                      os.path.dirname(dst_path)))
+    return moved
+
+def _move_to_dst(f_name, src_full_path, dst_dir):
+    dst_name = os.path.join(dst_dir, f_name)
+    try:
+        os.makedirs(dst_dir, exist_ok=True)
+        try:
+            os.replace(src_full_path, dst_name)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            # different filesystems, copy then delete
+            with open(src_full_path, 'rb') as fsrc:
+                _write_to_dst(fsrc, f_name, dst_dir)
+            os.remove(src_full_path)
+    except OSError:
         print('''We had a problem moving {}.
                 Most likely it is not a supported file type (e.g., .yml, .py, .npy, .tar, .gz).
                 It will not be available for use in xpdAcq, but it will be left in the xpdUser/Import/ directory'''.            format(f_name))
         return
-
+    print('{} has been successfully moved to {}'.format(f_name, dst_dir))
+    return dst_name
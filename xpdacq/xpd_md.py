@@ -19,9 +19,92 @@ import time
 
 ## current logic: this metadata class manage data input, lib_xpd_md takes care of method
 
-class Beamtime(object):
+## every level only stores its own fields in __slots__ and keeps the chain
+## (self, parent, grandparent, ...). Which level of the chain owns an
+## inherited field is worked out once per class, so looking it up is a
+## single dict access instead of walking up the parents one by one.
+
+class _MDLevel(object):
+    ''' base class of one level of the xpd metadata hierarchy '''
+    __slots__ = ('_chain',)
+    _fields = ()          # metadata fields stored at this level
+    _parent_cls = None    # class of the level above
+    _resolution = {}      # field -> indices in _chain of levels owning it
+    _user_level = None    # index in _chain of the level with user supplied fields
+
+    def _link(self, obj):
+        self._chain = (self,) + obj._chain if obj is not None else (self,)
+
+    def _own_md(self):
+        ''' fields that are set at this level '''
+        md = {}
+        for f in self._fields:
+            try:
+                md[f] = object.__getattribute__(self, f)
+            except AttributeError:
+                pass
+        return md
+
+    def to_dict(self):
+        ''' all metadata of this level and its parents as one flat dict
+
+        Fields of lower levels take precedence, as with attribute lookup.
+        '''
+        md = {}
+        for level in reversed(self._chain):
+            md.update(level._own_md())
+        return md
+
+    def __getattr__(self, name):
+        # get attributes from all parent layer
+        if name.startswith('_'):
+            raise AttributeError(name)
+        chain = self._chain
+        user_level = self._user_level
+        for i in self._resolution.get(name, ()):
+            if user_level is not None and i > user_level:
+                # user supplied fields come right after the Experiment's own
+                user_md = chain[user_level]._user_md
+                if name in user_md:
+                    return user_md[name]
+                user_level = None
+            try:
+                return object.__getattribute__(chain[i], name)
+            except AttributeError:
+                pass # field not set at that level, try the next one up
+        if user_level is not None:
+            user_md = chain[user_level]._user_md
+            if name in user_md:
+                return user_md[name]
+        raise AttributeError("'{}' object has no attribute '{}'"
+                             .format(type(self).__name__, name))
+
+
+def _build_resolution(cls):
+    ''' precompute which level of the chain owns each field of cls '''
+    levels = []
+    c = cls
+    while c is not None:
+        levels.append(c)
+        c = c._parent_cls
+    resolution = {}
+    for i, c in enumerate(levels):
+        for f in c._fields:
+            resolution.setdefault(f, []).append(i)
+    cls._resolution = {k: tuple(v) for k, v in resolution.items()}
+    if Experiment in levels:
+        cls._user_level = levels.index(Experiment)
+    return cls
+
+
+class Beamtime(_MDLevel):
+    _fields = ('beamtime_uid', 'beamtime_start_date', 'beamtime_end_date',
+               'modified_time', 'safN', 'experimenters')
+    __slots__ = _fields
+
     def __init__(self, safN, start_date, end_date, experimenters = [], update = False ):
         import uuid
+        self._link(None)
         uid = str(uuid.uuid1())
         self.beamtime_uid = uid
         print('uid to this beamtime is %s' % uid)
@@ -29,39 +112,45 @@ class Beamtime(object):
         self.beamtime_start_date = start_date
         self.beamtime_end_date = end_date
         print('start date and end date of this beamtime: ( %s, %s )' % (start_date, end_date))
-       
-        self.modified_time = time.time() 
-        
+
+        self.modified_time = time.time()
+
         self.set_beamtime(safN, experimenters, update)
 
     def set_beamtime(self, safN_val, experimenters_val, update = False):
-
+        from xpdacq.lib_xpd_md import set_beamtime
+        out = set_beamtime(safN_val, experimenters_val, update)
+        if out is None:
+            return
+        self.safN = out[0]
+        self.experimenters = out[1]
+        self.modified_time = out[2]
 
     def show_beamtime(self):
-        full_info = self.__dict__
-        real_info = {}
-        for k in full_info.keys():
-            if k.islower():
-                real_info[k] = full_info.get(k)
-        return real_info
+        return self._own_md()
+
 
+class Experiment(_MDLevel):
+    _fields = ('experiment_uid',)
+    _parent_cls = Beamtime
+    __slots__ = _fields + ('Beamtime', '_user_md')
 
-class Experiment(object):
     def __init__(self, obj, user_dict=None, env_var=None):
         import uuid
         from xpdacq.lib_xpd_md import _get_namespace
 
         uid = str(uuid.uuid1())
         self.experiment_uid = uid
-       
-        # dump user supplied info into class 
+
+        # dump user supplied info into class
+        self._user_md = {}
         if user_dict:
-            for k,v in user_dict.items():
-                setattr(self, k, v)  
+            self._user_md.update(user_dict)
             self.set_experiment()
 
         self.Beamtime = obj
-        
+        self._link(obj)
+
         # hook to environment variable
         if env_var:
             env_dict = {}
@@ -83,19 +172,21 @@ class Experiment(object):
         from xpdacq.lib_xpd_md import set_experiment
         out = set_experiment() # remain as a method but it does nothing now
 
+    def _own_md(self):
+        md = dict(self._user_md)
+        md.update(super(Experiment, self)._own_md())
+        return md
+
     def show_experiment(self):
-        full_info = self.__dict__
-        real_info = {}
-        for k in full_info.keys():
-            if k.islower():
-                real_info[k] = full_info.get(k)
-        return real_info
-    
-    def __getattr__(self, name):
-        # get attributes from all parent layer
-        return getattr(self.Beamtime, name)
-        
-class Sample(object):
+        return self._own_md()
+
+
+class Sample(_MDLevel):
+    _fields = ('sample_uid', 'sample_name', 'composition', 'modified_time',
+               'sample_comments')
+    _parent_cls = Experiment
+    __slots__ = _fields + ('Experiment',)
+
     def __init__(self, obj, sample_name='', composition=(), comments='', time = time.time()):
         import uuid
         uid = str(uuid.uuid1())
@@ -106,11 +197,12 @@ class Sample(object):
 
         # assign Experiment to object name
         self.Experiment = obj
+        self._link(obj)
 
     def set_sample(self, sample_name_val, sample_val, time = time.time()):
-        ''' 
+        '''
         Set up data in sample object
-        
+
         Arguments:
             sample_name_val - str - sample name, like 'NaCl' or 'NADDPH'
             sample_val - tuple - tuple that represents chemical composition. For example: ('Na', 1, 'Cl', 1)
@@ -122,54 +214,51 @@ class Sample(object):
         self.modified_time = out[2]
 
     def show_sample(self):
-        full_info = self.__dict__
-        real_info = {}
-        for k in full_info.keys():
-            if k.islower():
-                real_info[k] = full_info.get(k)
-        return real_info
+        return self._own_md()
 
-    def __getattr__(self, name):
-        # get attributes from all parent layer
-        return getattr(self.Experiment, name)
 
-
-class Scan(object):
+class Scan(_MDLevel):
     # blusesky has saved most of necessary metadata
     # so I keep method in Scan and Event simple
+    _fields = ('scan_tag',)
+    _parent_cls = Sample
+    __slots__ = _fields + ('Sample',)
+
     def __init__(self, obj, production=True):
         if production:
             # default behavior is not dryrun
             self.scan_tag = 'Production'
         else:
             self.scan_tag = 'Test'
- 
+
         self.Sample = obj
+        self._link(obj)
 
     def set_scan(self, scan_tag):
         from xpdacq.lib_xpd_md import set_scan
         # dummy method
-        set_scan()    
+        set_scan()
 
     def show_scan(self):
         from xpdacq.lib_xpd_md import show_obj
-        out = show_obj(self) 
-
-    def __getattr__(self, name):
-        # get attributes from all parent layer
-        return getattr(self.Sample, name)
+        out = show_obj(self)
 
 
-class Event(object):
+class Event(_MDLevel):
     # blusesky has saved most of necessary metadata
     # so I keep method in Scan and Event simple
+    _fields = ('event_tag',)
+    _parent_cls = Scan
+    __slots__ = _fields + ('Scan',)
+
     def __init__(self, obj, production = True):
         if production:
             self.event_tag = 'Production'
         else:
             self.event_tag = 'Test'
 
-        self.Scan = obj 
+        self.Scan = obj
+        self._link(obj)
 
     def set_event(self):
         from xpdacq.lib_xpd_md import set_scan
@@ -178,6 +267,7 @@ class Event(object):
     def show_event(self):
         from xpdacq.lib_xpd_md import show_obj
         out = show_obj(self)
-    
-    def __getattr__(self, name):
-        return getattr(self.Scan, name)
+
+
+for _cls in (Beamtime, Experiment, Sample, Scan, Event):
+    _build_resolution(_cls)
@@ -26,10 +26,13 @@ import uuid
 import warnings
 import ctypes
 from configparser import ConfigParser
-from xpdacq.utils import _graceful_exit, _RE_state_wrapper
+from xpdacq.utils import _graceful_exit, _RE_state_wrapper, run_control
+from xpdacq.utils import _start_control_watcher, _check_queue_control
 from xpdacq.glbl import glbl
 from xpdacq.beamtime import ScanPlan, Scan
-from xpdacq.control import _close_shutter, _open_shutter
+from xpdacq.control import _close_shutter, _open_shutter, beamdump_suspender, beamdump_stats
+from xpdacq.yamlstore import yaml_store
+from xpdacq.callbacks import FrameStats, _frame
 
 print('Before you start, make sure the area detector IOC is in "Acquire mode"')
 
@@ -45,8 +48,7 @@ temp_controller = glbl.temp_controller
 def _read_dark_yaml():
     dark_yaml_name = glbl.dk_yaml
     try:
-        with open(dark_yaml_name, 'r') as f:
-            dark_scan_list = yaml.load(f)
+        dark_scan_list = yaml_store.load(dark_yaml_name)
         return dark_scan_list
     except FileNotFoundError:
         sys.exit(_graceful_exit('''It seems you haven't initiated your beamtime.
@@ -54,11 +56,65 @@ def _read_dark_yaml():
 
 def _yamify_dark(dark_def):
     dark_yaml_name = glbl.dk_yaml
-    with open(dark_yaml_name, 'r') as f:
-        dark_list = yaml.load(f)
-    dark_list.append(dark_def)
-    with open(dark_yaml_name, 'w') as f:
-        yaml.dump(dark_list, f)
+    yaml_store.update(dark_yaml_name, lambda dark_list: dark_list + [dark_def])
+
+def _read_overhead_yaml():
+    ''' read measured per-point overheads, keyed by ScanPlan type '''
+    try:
+        oh_dict = yaml_store.load(glbl.oh_yaml)
+    except FileNotFoundError:
+        oh_dict = None
+    return oh_dict or {}
+
+def _yamify_overhead(sp_type, overhead_list, max_len=50):
+    ''' append measured per-point overheads, keep only the most recent max_len '''
+    def _append(oh_dict):
+        oh_dict = oh_dict or {}
+        history = oh_dict.get(sp_type, [])
+        history.extend([float(el) for el in overhead_list])
+        oh_dict[sp_type] = history[-max_len:]
+        return oh_dict
+    yaml_store.update(glbl.oh_yaml, _append, missing_ok=True)
+
+def _estimate_overhead(sp_type):
+    ''' mean of measured per-point overheads of this ScanPlan type
+
+    falls back to glbl.est_writeout_ohead if nothing has been measured yet
+    '''
+    history = _read_overhead_yaml().get(sp_type)
+    if history:
+        return float(np.mean(history))
+    return glbl.est_writeout_ohead
+
+class _PlanTag(object):
+    ''' a minimal readable object that attaches plan-level values to events
+
+    Values are set by the plan with ``put`` right before it is read, so
+    they show up as extra data fields (``<name>_<field>``) of the event.
+    '''
+    def __init__(self, name, fields):
+        self.name = name
+        self._fields = list(fields)
+        self._values = dict.fromkeys(self._fields)
+        self._timestamp = time.time()
+
+    def put(self, **values):
+        self._values.update(values)
+        self._timestamp = time.time()
+
+    def read(self):
+        return {'_'.join([self.name, k]): {'value': self._values[k],
+                'timestamp': self._timestamp} for k in self._fields}
+
+    def describe(self):
+        return {'_'.join([self.name, k]): {'source': 'xpdacq',
+                'dtype': 'number', 'shape': []} for k in self._fields}
+
+    def read_configuration(self):
+        return {}
+
+    def describe_configuration(self):
+        return {}
 
 def _get_bs_plan_by_id(obj_id):
     for obj in gc.get_objects():
@@ -71,7 +127,7 @@ def _get_bs_plan_by_id(obj_id):
     Please redefine your bluesky scanplan with guide on https://nsls-ii.github.io/bluesky/plans.html
     You can then pass it to ScanPlan('bluesky',{'bluesky_plan':<your plan>}) and rerun this scan.''')
 
-def _validate_dark(light_cnt_time, expire_time, dark_scan_list = None):
+def _validate_dark(light_cnt_time, expire_time, dark_scan_list = None, now = None):
     ''' find appropriate dark frame uid stored in dark_scan_list
 
     Parameters
@@ -82,6 +138,8 @@ def _validate_dark(light_cnt_time, expire_time, dark_scan_list = None):
         expire time of dark images, expressed in minute
     dark_scan_list : list, optional
         a list of dark dictionaries
+    now : float, optional
+        time at which darks are validated. Default is current time
     Returns
     -------
     dark_field_uid : str
@@ -89,9 +147,11 @@ def _validate_dark(light_cnt_time, expire_time, dark_scan_list = None):
     '''
     if not dark_scan_list:
         dark_scan_list = _read_dark_yaml()
+    if now is None:
+        now = time.time()
     if len(dark_scan_list) > 0:
         test_list = copy.copy(dark_scan_list)
-        while time.time() - test_list[-1][2] < expire_time*60.:
+        while now - test_list[-1][2] < expire_time*60.:
             test = test_list.pop()
             if abs(test[1]-light_cnt_time) < 0.9*glbl.frame_acq_time:
                 return test[0]
@@ -134,17 +194,43 @@ def _unpack_and_run(scan, dryrun, subs, **kwargs):
         get_light_images(scan, parms['exposure'], area_det, subs, dryrun)
     elif scan.md['sp_type'] == 'tseries':
         collect_time_series(scan, parms['exposure'], parms['delay'], parms['num'], area_det, subs, dryrun)
+    elif scan.md['sp_type'] == 'ftseries':
+        collect_fast_time_series(scan, parms['exposure'], parms['num'], area_det, subs, dryrun)
     elif scan.md['sp_type'] == 'Tramp':
         collect_Temp_series(scan, parms['startingT'], parms['endingT'], parms['Tstep'], parms['exposure'], area_det, subs, dryrun)
+    elif scan.md['sp_type'] == 'Tcont':
+        collect_Temp_ramp(scan, parms['startingT'], parms['endingT'], parms['ramp_rate'], parms['exposure'], area_det, subs, dryrun)
+    elif scan.md['sp_type'] == 'Tadapt':
+        collect_Temp_adaptive(scan, parms['startingT'], parms['endingT'], parms['Tstep'], parms.get('Tstep_min'), parms['exposure'], area_det, subs, dryrun)
     elif scan.md['sp_type'] == 'bluesky':
         plan_id = parms['bluesky_plan']
         plan = _get_bs_plan_by_id(plan_id)
-        md_dict = dict(scan.md)
+        md_dict = scan.md.snapshot()
         xpdRE(plan, **md_dict)
+        if xpdRE.state == 'paused':
+            _RE_state_wrapper(xpdRE)
+        # user plans may configure the detector themselves
+        _det_state.clear()
     else:
         print('unrecognized scan type.  Please rerun with a different scan object')
         return
 
+def _auto_beamdump_suspender():
+    ''' install the beam dump suspender before the first scan, unless switched off '''
+    if not glbl.beamdump_auto or glbl.beamdump_sus is not None:
+        return
+    try:
+        current = glbl.ring_current.get()
+    except Exception as err:
+        print('WARNING: ring current can not be read ({}), beam dump '
+              'suspender is not installed'.format(err))
+        return
+    if not current > 0:
+        print('WARNING: no beam, beam dump suspender will be installed '
+              'before a scan once the beam is up')
+        return
+    beamdump_suspender()
+
 def _execute_scans(scan, auto_dark, subs, auto_calibration,
         light_frame = True, dryrun = False, **kwargs):
     '''execute this scan'
@@ -169,6 +255,11 @@ def _execute_scans(scan, auto_dark, subs, auto_calibration,
     dryrun : bool
         optional. Default is False. If option is set to True, scan won't be executed but corresponding metadata as if executing real scans will be printed
     '''
+    if not dryrun:
+        # pause or abort_all asked for in between scans
+        _check_queue_control()
+        _start_control_watcher(xpdRE)
+        _auto_beamdump_suspender()
     if auto_dark and not scan.sp._is_bs:
         auto_dark_md_dict = _auto_dark_collection(scan, subs)
         scan.md.update(auto_dark_md_dict)
@@ -202,10 +293,10 @@ See documentation at http://xpdacq.github.io for more information about controll
         # create a count plan with the same light_cnt_time
         if scan.sp.shutter:
             auto_dark_scanplan = ScanPlan('ct',{'exposure':light_cnt_time},
-                                        auto_dark_plan = True)
+                                        auto_dark_plan = True, quiet = True)
         else:
             auto_dark_scanplan = ScanPlan('ct',{'exposure':light_cnt_time},
-                                        shutter=False, auto_dark_plan = True)
+                                        shutter=False, auto_dark_plan = True, quiet = True)
         dark_field_uid = dark(scan.sa, auto_dark_scanplan, subs)
     auto_dark_md_dict = {'sc_dk_field_uid': dark_field_uid}
     return auto_dark_md_dict
@@ -233,16 +324,21 @@ def _auto_load_calibration_file():
     config_md_dict = {'sc_calibration_parameters':config_dict, 'sc_calibration_file_name': os.path.basename(config_in_use), 'sc_calibration_file_timestamp':config_time}
     return config_md_dict
 
-def _subs_dict_gen(livetable, verify_write):
+def _subs_dict_gen(livetable, verify_write, frame_stats=False):
     subs = {}
     if livetable:
         subs.update({'all':LiveTable([area_det, temp_controller])})
+    if frame_stats:
+        subs.setdefault('all', [])
+        if not isinstance(subs['all'], list):
+            subs['all'] = [subs['all']]
+        subs['all'].append(FrameStats())
     if verify_write:
         subs.update({'stop':verify_files_saved})
     return subs
 
 def prun(sample, scanplan, auto_dark = None, livetable = True,
-        verify_write = False, **kwargs):
+        verify_write = False, frame_stats = None, **kwargs):
     ''' on this sample run this scanplan
 
     Sample, ScanPlan objects inside can be assigned in following way:
@@ -250,6 +346,7 @@ def prun(sample, scanplan, auto_dark = None, livetable = True,
     1) bt.get(<object_index>), eg. prun(bt.get(2), bt.get(5))
     2) name of acquire object, eg. prun('my_experiment', 'ct1s')
     3) index to acquire object, eg. prun(2,5)
+    4) uid of acquire object, eg. prun(sa.md['sa_uid'], sp.md['sp_uid'])
 
     All of above assigning methods can be used in a mix way.
 
@@ -275,18 +372,25 @@ def prun(sample, scanplan, auto_dark = None, livetable = True,
         optional. option to turn on/off verify_files_saved subscribe on this
         scan. This functionality will introduce ~2s delay each scan. default
         is False
+
+    frame_stats : bool
+        optional. option to turn on/off per-frame statistics (mean, max,
+        saturated pixels) computed in the background during this scan.
+        Default is glbl.frame_stats
     '''
     scan = Scan(sample, scanplan)
     scan.md.update({'sc_usermd':kwargs})
     scan.md.update({'sc_isprun':True})
     if auto_dark == None:
         auto_dark = glbl.auto_dark
-    subs = _subs_dict_gen(livetable, verify_write)
+    if frame_stats == None:
+        frame_stats = glbl.frame_stats
+    subs = _subs_dict_gen(livetable, verify_write, frame_stats)
     _execute_scans(scan, auto_dark, subs, auto_calibration = True, light_frame = True, dryrun = False)
     return
 
 def calibration(sample, scanplan, auto_dark = None, livetable = True,
-        verify_write = False, **kwargs):
+        verify_write = False, frame_stats = None, **kwargs):
     ''' on this calibration sample (calibrant) run this scanplan
 
     Sample, ScanPlan objects inside can be assigned in following way:
@@ -294,6 +398,7 @@ def calibration(sample, scanplan, auto_dark = None, livetable = True,
     1) bt.get(<object_index>), eg. calibration(bt.get(2), bt.get(5))
     2) name of acquire object, eg. calibration('my_experiment', 'ct1s')
     3) index to acquire object, eg. calibration(2,5)
+    4) uid of acquire object, eg. calibration(sa.md['sa_uid'], sp.md['sp_uid'])
 
     All of above assigning methods can be used in a mix way.
 
@@ -316,6 +421,11 @@ def calibration(sample, scanplan, auto_dark = None, livetable = True,
         optional. option to turn on/off verify_files_saved subscribe on this
         scan. This functionality will introduce ~2s delay each scan. default
         is False
+
+    frame_stats : bool
+        optional. option to turn on/off per-frame statistics (mean, max,
+        saturated pixels) computed in the background during this scan.
+        Default is glbl.frame_stats
     '''
     scan = Scan(sample, scanplan)
     scan.md.update({'sc_usermd':kwargs})
@@ -323,12 +433,14 @@ def calibration(sample, scanplan, auto_dark = None, livetable = True,
     # only auto_dark is exposed to user
     if auto_dark == None:
         auto_dark = glbl.auto_dark
-    subs = _subs_dict_gen(livetable, verify_write)
+    if frame_stats == None:
+        frame_stats = glbl.frame_stats
+    subs = _subs_dict_gen(livetable, verify_write, frame_stats)
     _execute_scans(scan, auto_dark, subs, auto_calibration = False, light_frame = True, dryrun = False)
     return
 
 def background(sample, scanplan, auto_dark = None, livetable = True,
-        verify_write = False, **kwargs):
+        verify_write = False, frame_stats = None, **kwargs):
     ''' on this sample (kepton tube or other background) run this scanplan
 
     This scan will be labeled as background in metadata.
@@ -338,6 +450,7 @@ def background(sample, scanplan, auto_dark = None, livetable = True,
     1) bt.get(<object_index>), eg. background(bt.get(2), bt.get(5))
     2) name of acquire object, eg. background('my_experiment', 'ct1s')
     3) index to acquire object, eg. background(2,5)
+    4) uid of acquire object, eg. background(sa.md['sa_uid'], sp.md['sp_uid'])
 
     All of above assigning methods can be used in a mix way.
 
@@ -361,6 +474,11 @@ def background(sample, scanplan, auto_dark = None, livetable = True,
         scan. This functionality will introduce ~2s delay each scan. default
         is False
 
+    frame_stats : bool
+        optional. option to turn on/off per-frame statistics (mean, max,
+        saturated pixels) computed in the background during this scan.
+        Default is glbl.frame_stats
+
     **kwargs : dict
         dictionary that will be passed through to the run-engine metadata
     '''
@@ -370,12 +488,14 @@ def background(sample, scanplan, auto_dark = None, livetable = True,
     # only auto_dark is exposed to user
     if auto_dark == None:
         auto_dark = glbl.auto_dark
-    subs = _subs_dict_gen(livetable, verify_write)
+    if frame_stats == None:
+        frame_stats = glbl.frame_stats
+    subs = _subs_dict_gen(livetable, verify_write, frame_stats)
     _execute_scans(scan, auto_dark, subs, auto_calibration = False, light_frame = True, dryrun = False)
     return
 
 def setupscan(sample, scanplan, auto_dark = None, livetable = True,
-        verify_write = False, **kwargs):
+        verify_write = False, frame_stats = None, **kwargs):
     ''' on this sample run this scanplan as a setupscan
     
     Sample, ScanPlan objects inside can be assigned in following way:
@@ -383,6 +503,7 @@ def setupscan(sample, scanplan, auto_dark = None, livetable = True,
     1) bt.get(<object_index>), eg. setupscan(bt.get(2), bt.get(5))
     2) name of acquire object, eg. setupscan('my_experiment', 'ct1s')
     3) index to acquire object, eg. setupscan(2,5)
+    4) uid of acquire object, eg. setupscan(sa.md['sa_uid'], sp.md['sp_uid'])
     
     All of above assigning methods can be used in a mix way.
     
@@ -405,6 +526,11 @@ def setupscan(sample, scanplan, auto_dark = None, livetable = True,
         optional. option to turn on/off verify_files_saved subscribe on this
         scan. This functionality will introduce ~2s delay each scan. default
         is False
+
+    frame_stats : bool
+        optional. option to turn on/off per-frame statistics (mean, max,
+        saturated pixels) computed in the background during this scan.
+        Default is glbl.frame_stats
     
     **kwargs : dict
         dictionary that will be passed through to the run-engine metadata
@@ -415,7 +541,9 @@ def setupscan(sample, scanplan, auto_dark = None, livetable = True,
     # only auto_dark is exposed to user
     if auto_dark == None:
         auto_dark = glbl.auto_dark
-    subs = _subs_dict_gen(livetable, verify_write)
+    if frame_stats == None:
+        frame_stats = glbl.frame_stats
+    subs = _subs_dict_gen(livetable, verify_write, frame_stats)
     _execute_scans(scan, auto_dark, subs, auto_calibration = False, light_frame = True, dryrun = False)
     return
 
@@ -428,6 +556,7 @@ def dark(sample, scanplan, subs = {}, **kwargs):
     1) bt.get(<object_index>), eg. dark(bt.get(2), bt.get(5))
     2) name of acquire object, eg. dark('my_experiment', 'ct1s')
     3) index to acquire object, eg. dark(2,5)
+    4) uid of acquire object, eg. dark(sa.md['sa_uid'], sp.md['sp_uid'])
     
     All of above assigning methods can be used in a mix way.
     
@@ -471,6 +600,7 @@ def dryrun(sample, scanplan, **kwargs):
     1) bt.get(<object_index>), eg. dryrun(bt.get(2), bt.get(5))
     2) name of acquire object, eg. dryrun('my_experiment', 'ct1s')
     3) index to acquire object, eg. dryrun(2,5)
+    4) uid of acquire object, eg. dryrun(sa.md['sa_uid'], sp.md['sp_uid'])
     
     All of above assigning methods can be used in a mix way.
         
@@ -491,6 +621,298 @@ def dryrun(sample, scanplan, **kwargs):
     _execute_scans(scan, False, subs, auto_calibration = False, light_frame = False, dryrun = True)
     return
 
+def estimate_queue(queue, auto_dark = None, start_T = None, verbose = True):
+    ''' estimate how long a list of scans takes, without running anything
+
+    Every (sample, scanplan) pair goes through the same steps as in prun:
+    an auto-dark is added whenever no valid dark would be found at that
+    point of the queue (darks collected earlier in the queue count, and
+    older ones expire as the queue goes on), the shutter is opened and
+    closed, the temperature is moved and the scan is run. Per-point
+    overheads are the ones measured in earlier scans of the same type,
+    temperature moves use glbl.est_temp_ramp_rate and glbl.est_temp_settle_time.
+
+    Sample, ScanPlan objects inside can be assigned in the same ways as in prun.
+
+    Parameters
+    ----------
+    queue : list
+        list of (sample, scanplan) pairs, in the order they will be run
+
+    auto_dark : bool
+        optional. option of automated dark collection. Default is glbl.auto_dark
+
+    start_T : float
+        optional. temperature at the start of the queue. If not given, going
+        to the first setpoint only counts settle time
+
+    verbose : bool
+        optional. option to print the timeline. Default is True
+
+    Returns
+    -------
+    timeline : list
+        a dictionary per scan with sample and scanplan names, 'start' and
+        'end' in seconds from the start of the queue, 'duration' broken down
+        into 'dark', 'shutter', 'temperature' and 'acquisition' and
+        'max_duration' for scans with a variable number of points
+    total_time : float
+        estimated time of the whole queue in seconds
+    '''
+    if auto_dark == None:
+        auto_dark = glbl.auto_dark
+    dark_scan_list = list(_read_dark_yaml()) if auto_dark else []
+    # pretend the queue starts now, so darks already collected count
+    t0 = time.time()
+    elapsed = 0.
+    T_now = start_T
+    timeline = []
+    for (sample, scanplan) in queue:
+        scan = Scan(sample, scanplan)
+        parms = scan.md['sp_params']
+        entry = {'sample': scan.sa.name, 'scanplan': scan.sp.name,
+                 'start': elapsed, 'dark': 0., 'shutter': 0.,
+                 'temperature': 0., 'acquisition': 0.}
+        if scan.sp._is_bs:
+            print('WARNING: ScanPlan {} runs a bluesky plan, its duration is not estimated'.format(scan.sp.name))
+            extra = 0.
+        else:
+            if auto_dark:
+                light_cnt_time = parms['exposure']
+                expire_time = scan.md.get('sp_dk_window', 0)
+                if not dark_scan_list or not _validate_dark(light_cnt_time, expire_time,
+                                                            dark_scan_list, now = t0 + elapsed):
+                    (dark_acq, _, _, _) = _estimate_scan_time('ct', {'exposure': light_cnt_time}, T_now)
+                    entry['dark'] = dark_acq
+                    if scan.sp.shutter:
+                        entry['dark'] += glbl.shutter_latency
+                    # dark counts as collected once it is done
+                    dark_scan_list.append(('estimated', light_cnt_time,
+                                           t0 + elapsed + entry['dark']))
+            if scan.sp.shutter:
+                entry['shutter'] = 2*glbl.shutter_latency
+            (acq, T_time, extra, T_now) = _estimate_scan_time(scan.sp.scanplan, parms, T_now)
+            entry['acquisition'] = acq
+            entry['temperature'] = T_time
+        entry['duration'] = sum(entry[k] for k in ('dark', 'shutter', 'temperature', 'acquisition'))
+        entry['max_duration'] = entry['duration'] + extra
+        elapsed += entry['duration']
+        entry['end'] = elapsed
+        timeline.append(entry)
+    total_time = elapsed
+    if verbose:
+        _print_timeline(timeline, total_time)
+    return (timeline, total_time)
+
+def _estimate_scan_time(sp_type, parms, T_now):
+    ''' estimated time of a scan body
+
+    Returns
+    -------
+    acquisition : float
+        time spent exposing and writing out, in seconds
+    temperature : float
+        time spent ramping and settling temperature, in seconds
+    extra : float
+        additional time in the worst case, for scans with a variable number of points
+    T_end : float
+        temperature at the end of the scan
+    '''
+    exposure = _plan_exposure(parms.get('exposure', 0))[2]
+    ohead = _estimate_overhead(sp_type)
+    point = exposure + ohead
+    temperature = 0.
+    extra = 0.
+    T_end = T_now
+    if sp_type == 'ct':
+        acquisition = point
+    elif sp_type == 'tseries':
+        period = max(exposure, parms['delay'])
+        acquisition = (parms['num'] - 1)*max(period, point) + point
+    elif sp_type == 'ftseries':
+        acquisition = parms['num']*point
+    elif sp_type in ('Tramp', 'Tadapt', 'Tcont'):
+        Tstart = parms['startingT']
+        Tstop = parms['endingT']
+        T_span = abs(Tstop - Tstart)
+        T_end = Tstop
+        temperature = _estimate_T_move(T_now, Tstart)
+        if sp_type == 'Tcont':
+            # exposures run while ramping, last one may finish after the ramp
+            acquisition = T_span/parms['ramp_rate']*60. + point
+        else:
+            Nsteps = int(T_span/parms['Tstep']) + 1
+            acquisition = Nsteps*point
+            temperature += T_span/glbl.est_temp_ramp_rate*60. + (Nsteps - 1)*glbl.est_temp_settle_time
+            if sp_type == 'Tadapt':
+                # from all-coarse to all-fine steps
+                Tstep_min = parms.get('Tstep_min', parms['Tstep']/8.)
+                max_Nsteps = int(np.ceil(T_span/Tstep_min)) + 1
+                extra = (max_Nsteps - Nsteps)*(point + glbl.est_temp_settle_time)
+    else:
+        acquisition = 0.
+    return (acquisition, temperature, extra, T_end)
+
+def _estimate_T_move(T_from, T_to):
+    ''' estimated time to go to and settle at T_to '''
+    if T_from is None:
+        return glbl.est_temp_settle_time
+    return abs(T_to - T_from)/glbl.est_temp_ramp_rate*60. + glbl.est_temp_settle_time
+
+def _print_timeline(timeline, total_time):
+    print('{:>8} {:>8}  {:<20} {:<25} {:>6} {:>8} {:>6} {:>8}'.format(
+          'start', 'end', 'sample', 'scanplan', 'dark', 'shutter', 'temp', 'acquire'))
+    for el in timeline:
+        print('{:>8} {:>8}  {:<20} {:<25} {:>6.0f} {:>8.0f} {:>6.0f} {:>8.0f}'.format(
+              str(datetime.timedelta(seconds=int(el['start']))),
+              str(datetime.timedelta(seconds=int(el['end']))),
+              el['sample'], el['scanplan'], el['dark'], el['shutter'],
+              el['temperature'], el['acquisition']))
+    print('INFO: estimated total time = {}'.format(datetime.timedelta(seconds=int(total_time))))
+    max_total = total_time + sum(el['max_duration'] - el['duration'] for el in timeline)
+    if max_total > total_time:
+        print('INFO: up to {} if adaptive scans take their finest steps'.format(datetime.timedelta(seconds=int(max_total))))
+
+def _plan_exposure(exposure, frame_time=None):
+    ''' frame time and number of frames for a requested exposure
+
+    Frame times are integer multiples of glbl.frame_acq_time up to
+    glbl.max_frame_acq_time. Of those, the ones coming closest to the
+    requested exposure without exceeding it are kept and the longest is
+    taken, so a long exposure is summed from as few frames, and readouts,
+    as possible. At least one frame is always collected.
+
+    Parameters
+    ----------
+    exposure : float
+        requested total exposure time in seconds
+    frame_time : float
+        optional. use this frame time instead of choosing one, e.g. the
+        value read back from the detector.
+
+    Returns
+    -------
+    acq_time : float
+        time per frame in seconds
+    num_frame : int
+        number of frames summed into one exposure
+    computed_exposure : float
+        num_frame*acq_time
+    '''
+    if frame_time is not None:
+        candidates = [frame_time]
+    else:
+        base = glbl.frame_acq_time
+        max_k = max(int(glbl.max_frame_acq_time / base + 1e-9), 1)
+        candidates = [k*base for k in range(1, max_k + 1)]
+    best = None
+    for acq_time in candidates:
+        # tolerance keeps e.g. 1.0/0.1 from being floored to 9 frames
+        num_frame = max(int(exposure / acq_time + 1e-9), 1)
+        computed_exposure = num_frame*acq_time
+        key = (round(abs(exposure - computed_exposure), 9), num_frame)
+        if best is None or key < best[0]:
+            best = (key, (acq_time, num_frame, computed_exposure))
+    return best[1]
+
+class _DetectorState(object):
+    ''' area_det settings last written by xpdAcq, to skip redundant puts
+
+    Every put is a Channel Access round trip, so a setting is only put
+    when the value differs from the one last written. Once every
+    glbl.det_verify_interval seconds the cached settings are checked
+    against the detector and the ones changed behind our back are put
+    again.
+    '''
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        ''' forget all settings, the next setup puts every one of them '''
+        self._written = {} # name -> (value put, readback)
+        self._verified = 0.
+        self.puts = 0
+        self.skipped = 0
+
+    def _signal(self, name):
+        obj = area_det
+        for attr in name.split('.'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def set(self, name, value, readback=False):
+        ''' put value to area_det setting name, unless it already has it
+
+        Parameters
+        ----------
+        name : str
+            dotted name of the setting on area_det, e.g. 'cam.acquire_time'
+        value : float or int
+            value to put
+        readback : bool
+            optional. read the setting back after putting it. Default is
+            False and value is taken as the readback.
+
+        Returns
+        -------
+        readback : float or int
+            value of the setting on the detector
+        '''
+        if time.time() - self._verified > glbl.det_verify_interval:
+            self._verify()
+        cached = self._written.get(name)
+        if cached is not None and cached[0] == value:
+            self.skipped += 1
+            return cached[1]
+        signal = self._signal(name)
+        signal.put(value)
+        self.puts += 1
+        rb = signal.get() if readback else value
+        self._written[name] = (value, rb)
+        return rb
+
+    def _verify(self):
+        for name, (value, rb) in list(self._written.items()):
+            if self._signal(name).get() != rb:
+                print('INFO: area_det {} was changed outside of xpdAcq, it will be set again'
+                      .format(name))
+                del self._written[name]
+        self._verified = time.time()
+
+_det_state = _DetectorState()
+
+def _setup_exposure(scan, exposure):
+    ''' set area_det up for a requested exposure and record it in scan.md
+
+    The frame time from _plan_exposure is put to the detector and the
+    number of frames is worked out again from the value read back, which
+    is what the detector will actually use. Settings the detector already
+    has are not put again, see _DetectorState.
+
+    Returns
+    -------
+    acq_time : float
+        time per frame in seconds
+    num_frame : int
+        number of frames summed into one exposure
+    computed_exposure : float
+        num_frame*acq_time
+    '''
+    (acq_time, num_frame, computed_exposure) = _plan_exposure(exposure)
+    readback = _det_state.set('cam.acquire_time', acq_time, readback=True)
+    if readback != acq_time:
+        (acq_time, num_frame, computed_exposure) = _plan_exposure(exposure, readback)
+    _det_state.set('images_per_set', num_frame)
+    _det_state.set('number_of_sets', 1)
+    print('INFO: requested exposure time = {}s -> computed exposure time = {}s ({} frame(s) of {}s)'
+          .format(exposure, computed_exposure, num_frame, acq_time))
+    scan.md.update({'sp_requested_exposure': exposure,
+               'sp_computed_exposure': computed_exposure})
+    scan.md.update({'sp_time_per_frame': acq_time,
+               'sp_num_frames': num_frame,
+               'sp_number_of_sets': 1})
+    return (acq_time, num_frame, computed_exposure)
+
 def get_light_images(scan, exposure = 1.0, det=area_det, subs_dict={}, dryrun = False):
     '''the main xpdAcq function for getting an exposure with Count scan
 
@@ -513,22 +935,9 @@ def get_light_images(scan, exposure = 1.0, det=area_det, subs_dict={}, dryrun =
 
     '''
 
-    # setting up detector
-    area_det.number_of_sets.put(1)
-    area_det.cam.acquire_time.put(glbl.frame_acq_time)
-    acq_time = area_det.cam.acquire_time.get()
-
-    # compute number of frames and save metadata
-    num_frame = int(exposure / acq_time)
-    if num_frame == 0:
-        num_frame = 1
-    computed_exposure = num_frame*acq_time
-    print('INFO: requested exposure time = ',exposure,' -> computed exposure time:',computed_exposure)
-    scan.md.update({'sp_requested_exposure':exposure,'sp_computed_exposure':computed_exposure})
-    scan.md.update({'sp_time_per_frame':acq_time,'sp_num_frames':num_frame})
-
-    area_det.images_per_set.put(num_frame)
-    md_dict = scan.md
+    # setting up detector and save metadata
+    _setup_exposure(scan, exposure)
+    md_dict = scan.md.snapshot()
 
     plan = Count([area_det])
     if dryrun:
@@ -581,24 +990,14 @@ def collect_Temp_series(scan, Tstart, Tstop, Tstep, exposure = 1.0, det= area_de
     dryrun : bool
         optional. option to specify if a real measurement will be running or not. Default is set to False.
     '''
-    area_det.number_of_sets.put(1)
-    area_det.cam.acquire_time.put(glbl.frame_acq_time)
-    acq_time = area_det.cam.acquire_time.get()
-
-    # compute number of frames and save metadata
-    num_frame = int(exposure / acq_time)
-    if num_frame == 0: num_frame = 1
-    computed_exposure = num_frame*acq_time
-    print('INFO: requested exposure time = ',exposure,' -> computed exposure time:',computed_exposure)
-    scan.md.update({'sp_requested_exposure':exposure,'sp_computed_exposure':computed_exposure})
-    scan.md.update({'sp_time_per_frame':acq_time,'sp_num_frames':num_frame})
+    # setting up detector and save metadata
+    (acq_time, num_frame, computed_exposure) = _setup_exposure(scan, exposure)
 
     (Nsteps, computed_step_size) = _nstep(Tstart, Tstop, Tstep) # computed steps
     scan.md.update({'sp_startingT':Tstart,'sp_endingT':Tstop,'sp_requested_Tstep':Tstep})
     scan.md.update({'sp_Nsteps':Nsteps, 'sp_computed_Tstep':computed_step_size})
 
-    area_det.images_per_set.put(num_frame)
-    md_dict = scan.md
+    md_dict = scan.md.snapshot()
 
     plan = AbsScanPlan([area_det], temp_controller, Tstart, Tstop, Nsteps)
     if dryrun:
@@ -630,6 +1029,374 @@ def _collect_Temp_series_dryrun(md_dict, Tstep, computed_step_size):
     print(md_dict) # make it pretty print later
     return md_dict
 
+def collect_Temp_ramp(scan, Tstart, Tstop, ramp_rate, exposure = 1.0, det= area_det, subs_dict={}, dryrun = False):
+    '''the xpdAcq function for getting a continuous temperature ramp scan
+
+    The temperature controller settles once at Tstart, then ramps to Tstop
+    at ramp_rate while exposures are taken back-to-back, so total time is
+    set by the ramp rate rather than by settling at every step. Temperature
+    read right before and right after every exposure is saved in the event
+    as ``Tcont_T_start`` and ``Tcont_T_end``.
+
+    Parameters
+    ----------
+    scan : xpdacq.beamtime.Scan object
+        an object carries all metadata of your experiment
+
+    Tstart : float
+        starting point of temperature ramp
+
+    Tstop : float
+        ending point of temperature ramp
+
+    ramp_rate : float
+        ramp rate in K/min, written once to the temperature controller
+
+    exposure : float
+        optional. total exposure time in seconds
+
+    det : Ophyd object
+        optional. the instance of the detector you are using. by default area_det defined when xpdacq is loaded.
+    
+    subs_dict : dict
+        optional. dictionary specifies live feedback options during scans
+    
+    dryrun : bool
+        optional. option to specify if a real measurement will be running or not. Default is set to False.
+    '''
+    _check_ramp_rate(temp_controller)
+    # setting up detector and save metadata
+    (acq_time, num_frame, computed_exposure) = _setup_exposure(scan, exposure)
+
+    ramp_time = abs(Tstop - Tstart)/ramp_rate*60.
+    est_ohead = _estimate_overhead('Tcont')
+    est_Nframes = max(int(ramp_time/(computed_exposure + est_ohead)), 1)
+    est_Tspan = ramp_rate/60.*computed_exposure
+    print('INFO: ramp takes {:.0f}s, about {} exposures each spanning {:.3g}K'.format(ramp_time, est_Nframes, est_Tspan))
+    scan.md.update({'sp_startingT':Tstart,'sp_endingT':Tstop,'sp_ramp_rate':ramp_rate})
+    scan.md.update({'sp_ramp_time':ramp_time, 'sp_estimated_Nframes':est_Nframes})
+
+    md_dict = scan.md.snapshot()
+
+    frame_log = []
+    plan = _continuous_ramp_plan(area_det, temp_controller, Tstart, Tstop,
+                                 ramp_rate, computed_exposure, frame_log)
+    if dryrun:
+        _collect_Temp_ramp_dryrun(md_dict)
+    else:
+        xpdRE(plan,subs_dict, **md_dict)
+        if xpdRE.state == 'paused':
+            _RE_state_wrapper(xpdRE)
+        if frame_log:
+            overheads = [el[1] for el in frame_log]
+            _yamify_overhead('Tcont', overheads)
+            print('INFO: {} exposures collected between {} and {}'
+                  .format(len(frame_log), frame_log[0][0], frame_log[-1][0]))
+
+def _read_value(obj, reading):
+    ''' value of obj in a reading the run engine handed back, eg. temperature '''
+    if obj.name in reading:
+        return reading[obj.name]['value']
+    return list(reading.values())[0]['value']
+
+def _check_ramp_rate(temp_controller):
+    ''' exit if temp_controller has no ramp_rate signal to write the ramp rate to '''
+    if not hasattr(temp_controller, 'ramp_rate'):
+        sys.exit(_graceful_exit('''temperature controller {} has no ramp_rate signal,
+        so a continuous ramp can not be run on it.
+        Please use a Tramp ScanPlan, which steps the temperature instead'''
+        .format(getattr(temp_controller, 'name', temp_controller))))
+
+def _continuous_ramp_plan(det, temp_controller, Tstart, Tstop, ramp_rate, exposure, frame_log):
+    ''' plan that keeps exposing while temp_controller ramps to Tstop
+
+    Parameters
+    ----------
+    det : Ophyd object
+        detector to trigger and read during the ramp
+    temp_controller : Ophyd object
+        temperature controller, with a ramp_rate signal
+    Tstart, Tstop : float
+        temperature range of the ramp
+    ramp_rate : float
+        ramp rate in K/min
+    exposure : float
+        computed exposure per event, used to extract the overhead
+    frame_log : list
+        filled with a ((T_start, T_end), overhead) tuple per exposure
+    '''
+    _check_ramp_rate(temp_controller)
+    tag = _PlanTag('Tcont', ['T_start', 'T_end'])
+    # guard against a controller that never reports the ramp as done
+    timeout = 1.5*abs(Tstop - Tstart)/ramp_rate*60. + 2*exposure
+    yield Msg('open_run')
+    try:
+        # go to the starting point and settle once
+        yield Msg('set', temp_controller, Tstart, block_group='T')
+        yield Msg('wait', None, 'T')
+        yield Msg('set', temp_controller.ramp_rate, ramp_rate, block_group='T')
+        yield Msg('wait', None, 'T')
+        yield Msg('checkpoint')
+        ramp_status = yield Msg('set', temp_controller, Tstop, block_group='ramp')
+        t0 = time.time()
+        while True:
+            # through the run engine, the temperature at the end of the
+            # exposure goes into the event along with the image
+            T_start = _read_value(temp_controller, (yield Msg('read', temp_controller)))
+            t_frame = time.time()
+            yield Msg('create')
+            yield Msg('trigger', det, block_group='det')
+            yield Msg('wait', None, 'det')
+            yield Msg('read', det)
+            T_end = _read_value(temp_controller, (yield Msg('read', temp_controller)))
+            tag.put(T_start=T_start, T_end=T_end)
+            yield Msg('read', tag)
+            yield Msg('save')
+            frame_log.append(((T_start, T_end), max(0., time.time() - t_frame - exposure)))
+            if getattr(ramp_status, 'done', False):
+                yield Msg('wait', None, 'ramp')
+                break
+            if time.time() - t0 > timeout:
+                # don't wait on a ramp that never finishes, hold where it is
+                print('WARNING: temperature ramp of {} to {} did not finish within {:.0f}s, '
+                      'holding at {}'.format(temp_controller.name, Tstop, timeout, T_end))
+                yield Msg('set', temp_controller, T_end, block_group='T')
+                yield Msg('wait', None, 'T')
+                break
+    finally:
+        yield Msg('close_run')
+
+def _collect_Temp_ramp_dryrun(md_dict):
+    num_frame = md_dict['sp_num_frames']
+    acq_time = md_dict['sp_time_per_frame']
+    Tstart = md_dict['sp_startingT']
+    Tstop = md_dict['sp_endingT']
+    ramp_rate = md_dict['sp_ramp_rate']
+    ramp_time = md_dict['sp_ramp_time']
+    m, s = divmod(ramp_time, 60)
+    h, m = divmod(m, 60)
+    scan_length = str("%d:%02d:%02d" % (h, m, s))
+    print(' === dryrun mode ===')
+    print('this will execute a continuous temperature ramp on temperature controller {}'.format(temp_controller.name))
+    print('Sample metadata: Sample name = {}'.format(md_dict['sa_name'])) # enrich it later
+    print('using the "pe1c" detector (Perkin-Elmer in continuous acquisition mode)')
+    print('in the form of {} frames of {} s summed into a single event'.format(num_frame, acq_time))
+    print('(i.e. accessible as a single tiff file)')
+    print('')
+    print('temperature settles once at {} and then ramps to {} at {} K/min'.format(Tstart, Tstop, ramp_rate))
+    print('exposures are taken back-to-back during the ramp, about {} of them'.format(md_dict['sp_estimated_Nframes']))
+    print('Estimated total scan length (after settling at starting temperature) = {}'.format(scan_length))
+    print('')
+    print('The metadata saved with the scan will be:')
+    print(md_dict) # make it pretty print later
+    return md_dict
+
+def collect_Temp_adaptive(scan, Tstart, Tstop, Tstep, Tstep_min=None, exposure = 1.0, det= area_det, subs_dict={}, dryrun = False):
+    '''the xpdAcq function for getting a temperature scan with adaptive step size
+
+    After every exposure a cheap figure of merit, the relative change of
+    the frame with respect to the previous one, decides the next step.
+    Step is halved (down to Tstep_min) when the change is larger than
+    glbl.Tadapt_fom_threshold and doubled (up to Tstep) when it is well
+    below, so time is spent near transitions rather than in featureless
+    regions. The change is taken on glbl.Tadapt_fom_field of the detector
+    reading when it is set (eg. the total of a stats plugin), on the image
+    otherwise. Setpoint, step and figure of merit are saved in every event
+    as ``Tadapt_setpoint``, ``Tadapt_step`` and ``Tadapt_fom``.
+
+    Parameters
+    ----------
+    scan : xpdacq.beamtime.Scan object
+        an object carries all metadata of your experiment
+
+    Tstart : float
+        starting point of temperature scan
+
+    Tstop : float
+        ending point of temperature scan
+
+    Tstep : float
+        largest temperature step
+
+    Tstep_min : float
+        optional. smallest temperature step. Default is Tstep/8
+
+    exposure : float
+        optional. total exposure time in seconds
+
+    det : Ophyd object
+        optional. the instance of the detector you are using. by default area_det defined when xpdacq is loaded.
+    
+    subs_dict : dict
+        optional. dictionary specifies live feedback options during scans
+    
+    dryrun : bool
+        optional. option to specify if a real measurement will be running or not. Default is set to False.
+    '''
+    if Tstep_min is None:
+        Tstep_min = Tstep/8.
+    # setting up detector and save metadata
+    (acq_time, num_frame, computed_exposure) = _setup_exposure(scan, exposure)
+
+    # bounds on number of steps, from all-coarse to all-fine
+    min_Nsteps = int(np.ceil(abs(Tstop - Tstart)/Tstep)) + 1
+    max_Nsteps = int(np.ceil(abs(Tstop - Tstart)/Tstep_min)) + 1
+    scan.md.update({'sp_startingT':Tstart,'sp_endingT':Tstop,'sp_Tstep_max':Tstep, 'sp_Tstep_min':Tstep_min})
+    scan.md.update({'sp_fom_threshold':glbl.Tadapt_fom_threshold,
+                    'sp_fom_field':glbl.Tadapt_fom_field,
+                    'sp_min_Nsteps':min_Nsteps, 'sp_max_Nsteps':max_Nsteps})
+
+    md_dict = scan.md.snapshot()
+
+    setpoint_log = []
+    plan = _adaptive_Temp_plan(area_det, temp_controller, Tstart, Tstop,
+                               Tstep, Tstep_min, glbl.Tadapt_fom_threshold,
+                               setpoint_log)
+    if dryrun:
+        _collect_Temp_adaptive_dryrun(md_dict)
+    else:
+        xpdRE(plan,subs_dict, **md_dict)
+        if xpdRE.state == 'paused':
+            _RE_state_wrapper(xpdRE)
+        if setpoint_log:
+            print('INFO: {} setpoints were collected (between {} and {} for fixed steps)'
+                  .format(len(setpoint_log), min_Nsteps, max_Nsteps))
+            print('INFO: setpoints = {}'.format([round(el[0], 3) for el in setpoint_log]))
+
+def _fom_signal(reading, field=None):
+    ''' pick the quantity used as figure of merit out of a detector reading
+
+    `field` (eg. the total of a stats plugin) is used when given, otherwise
+    the image, retrieved from filestore when the reading only carries its
+    datum id. Returns None when neither is available.
+    '''
+    if not reading:
+        return None
+    if field is not None:
+        if field not in reading:
+            return None
+        value = reading[field]['value']
+        if isinstance(value, np.ndarray):
+            return value
+        return float(value)
+    img_fields = [k for k in reading if k.endswith('_image')]
+    if not img_fields:
+        return None
+    img = _frame(reading[img_fields[0]]['value'])
+    if img is None or img.size < 2:
+        return None
+    return img
+
+def _frame_fom(previous, current, max_size=64):
+    ''' relative change between two frames (or two scalars)
+
+    Arrays are decimated to at most max_size points along each axis before
+    taking the mean absolute difference, so it stays cheap for full frames.
+    '''
+    if previous is None or current is None:
+        return None
+    if isinstance(current, np.ndarray):
+        stride = tuple(slice(None, None, max(1, n//max_size)) for n in current.shape)
+        prev = np.asarray(previous, dtype=float)[stride]
+        cur = np.asarray(current, dtype=float)[stride]
+        norm = np.mean(np.abs(prev))
+        diff = np.mean(np.abs(cur - prev))
+    else:
+        norm = abs(previous)
+        diff = abs(current - previous)
+    if norm == 0:
+        return 0. if diff == 0 else np.inf
+    return float(diff/norm)
+
+def _adapt_Tstep(step, fom, Tstep_min, Tstep_max, threshold):
+    ''' next step size given the figure of merit of the last step '''
+    if fom is None:
+        return Tstep_max
+    if fom > threshold:
+        return max(step/2., Tstep_min)
+    if fom < threshold/4.:
+        return min(step*2., Tstep_max)
+    return step
+
+def _adaptive_Temp_plan(det, temp_controller, Tstart, Tstop, Tstep_max, Tstep_min, threshold, setpoint_log):
+    ''' step scan of temp_controller whose step adapts to how much frames change
+
+    Parameters
+    ----------
+    det : Ophyd object
+        detector to trigger and read at every setpoint
+    temp_controller : Ophyd object
+        temperature controller
+    Tstart, Tstop : float
+        temperature range of the scan
+    Tstep_max, Tstep_min : float
+        bounds on the temperature step
+    threshold : float
+        relative frame change above which the step is refined
+    setpoint_log : list
+        filled with a (setpoint, step, fom) tuple per setpoint
+    '''
+    tag = _PlanTag('Tadapt', ['setpoint', 'step', 'fom'])
+    fom_field = glbl.Tadapt_fom_field
+    direction = 1 if Tstop >= Tstart else -1
+    setpoint = Tstart
+    step = Tstep_max
+    fom = None
+    previous = None
+    yield Msg('open_run')
+    while True:
+        yield Msg('checkpoint')
+        yield Msg('set', temp_controller, setpoint, block_group='T')
+        yield Msg('wait', None, 'T')
+        yield Msg('create')
+        yield Msg('read', temp_controller)
+        yield Msg('trigger', det, block_group='det')
+        yield Msg('wait', None, 'det')
+        reading = yield Msg('read', det)
+        if not isinstance(reading, dict):
+            reading = det.read()
+        current = _fom_signal(reading, fom_field)
+        if current is None and not setpoint_log:
+            print('WARNING: no figure of merit in the readings of {} ({}), '
+                  'temperature steps will not adapt and stay at {}'
+                  .format(getattr(det, 'name', det),
+                          fom_field or 'no image could be retrieved', Tstep_max))
+        fom = _frame_fom(previous, current)
+        # nan, not None, where there is nothing to compare
+        tag.put(setpoint=setpoint, step=step,
+                fom=np.nan if fom is None else fom)
+        yield Msg('read', tag)
+        yield Msg('save')
+        setpoint_log.append((setpoint, step, fom))
+        previous = current
+        if direction*(Tstop - setpoint) <= 0:
+            break
+        step = _adapt_Tstep(step, fom, Tstep_min, Tstep_max, threshold)
+        # don't overshoot, always finish at Tstop
+        setpoint = setpoint + direction*min(step, abs(Tstop - setpoint))
+    yield Msg('close_run')
+
+def _collect_Temp_adaptive_dryrun(md_dict):
+    num_frame = md_dict['sp_num_frames']
+    acq_time = md_dict['sp_time_per_frame']
+    Tstart = md_dict['sp_startingT']
+    Tstop = md_dict['sp_endingT']
+    print(' === dryrun mode ===')
+    print('this will execute an adaptive temperature scan on temperature controller {}'.format(temp_controller.name))
+    print('Sample metadata: Sample name = {}'.format(md_dict['sa_name'])) # enrich it later
+    print('using the "pe1c" detector (Perkin-Elmer in continuous acquisition mode)')
+    print('in the form of {} frames of {} s summed into a single event'.format(num_frame, acq_time))
+    print('(i.e. accessible as a single tiff file)')
+    print('')
+    print('starting temperature is {} and ending temperature is {}'.format(Tstart, Tstop))
+    print('step size adapts between {} and {}, which takes between {} and {} steps'
+          .format(md_dict['sp_Tstep_min'], md_dict['sp_Tstep_max'],
+                  md_dict['sp_min_Nsteps'], md_dict['sp_max_Nsteps']))
+    print('')
+    print('The metadata saved with the scan will be:')
+    print(md_dict) # make it pretty print later
+    return md_dict
+
 def _nstep(start, stop, step_size):
     ''' return (start, stop, nsteps)'''
     requested_nsteps = abs((start - stop) / step_size)
@@ -643,6 +1410,13 @@ def _nstep(start, stop, step_size):
 def collect_time_series(scan, exposure=1.0, delay=0., num=1, det= area_det, subs_dict={}, dryrun = False):
     '''the main xpdAcq function for getting a time series scan
 
+    The time series keeps track of the requested period. Readout and
+    write-out overhead of every point is measured during the run and the
+    wait before the next point is shortened accordingly, so points are
+    taken on a regular grid of ``period`` seconds whenever the overhead
+    allows it. Nominal and actual start time of each point, together with
+    the measured overhead, are saved as ``tseries_*`` fields in the events.
+
     Parameters
     ----------
     scan : xpdacq.beamtime.Scan object
@@ -666,53 +1440,104 @@ def collect_time_series(scan, exposure=1.0, delay=0., num=1, det= area_det, subs
     dryrun : bool
         optional. option to specify if a real measurement will be running or not. Default is set to False.
     '''
-    # get a local copy of md to update
-    md = dict(scan.md)
-    area_det.cam.acquire_time.put(glbl.frame_acq_time)
-    acq_time = area_det.cam.acquire_time.get()
-    # compute how many frames to collect
-    num_frame = max(int(exposure / acq_time), 1)
-    computed_exposure = num_frame * acq_time
-    num_sets = 1
-    print('INFO: requested exposure time = {}s -> computed exposure time = {}s '.format(exposure,computed_exposure))
+    # set how many frames to average
+    (acq_time, num_frame, computed_exposure) = _setup_exposure(scan, exposure)
     real_delay = max(0, delay - computed_exposure)
     
     period = max(computed_exposure, real_delay + computed_exposure)
+    est_ohead = _estimate_overhead('tseries')
     print('INFO: requested delay = {}s  -> computed delay = {}s'.format(delay, real_delay))
-    print('INFO: nominal period (neglecting readout overheads) of {} s'.format(period))
+    print('INFO: nominal period of {} s, readout overheads will be taken out of the delay'.format(period))
+    if computed_exposure + est_ohead > period:
+        print('INFO: with an estimated overhead of {:.3g}s per point, achievable period is about {:.3g}s'
+              .format(est_ohead, computed_exposure + est_ohead))
 
-    # set how many frames to average
-    area_det.images_per_set.put(num_frame)
-    area_det.number_of_sets.put(num_sets)
-
-    scan.md.update({'sp_requested_exposure': exposure,
-               'sp_computed_exposure': computed_exposure,
-               'sp_period': period})
-    scan.md.update({'sp_time_per_frame': acq_time,
-               'sp_num_frames': num_frame,
-               'sp_number_of_sets': num_sets})
+    scan.md.update({'sp_period': period,
+               'sp_estimated_overhead': est_ohead})
 
-    md_dict = scan.md
-    plan = Count([area_det], num=num, delay=real_delay)
+    md_dict = scan.md.snapshot()
+    point_log = []
+    plan = _period_tracking_plan(area_det, num, period, computed_exposure, point_log)
     if dryrun:
         _collect_time_series_dryrun(md_dict, real_delay, delay, num)
     else:
         xpdRE(plan, subs_dict, **md_dict)
         if xpdRE.state == 'paused':
-            _RE_state_wrapper(RE_obj)
+            _RE_state_wrapper(xpdRE)
+        _summarize_time_series(point_log, period)
+
+def _period_tracking_plan(det, num, period, exposure, point_log):
+    ''' time series plan that keeps points on a grid of ``period`` seconds
+
+    Parameters
+    ----------
+    det : Ophyd object
+        detector to trigger and read at each point
+    num : int
+        number of points
+    period : float
+        requested time between the start of consecutive points
+    exposure : float
+        computed exposure per point, used to extract the overhead
+    point_log : list
+        filled with a (nominal_time, actual_time, overhead) tuple per point
+    '''
+    tag = _PlanTag('tseries', ['nominal_time', 'actual_time', 'overhead'])
+    yield Msg('open_run')
+    t0 = time.time()
+    for i in range(num):
+        yield Msg('checkpoint')
+        nominal_time = t0 + i*period
+        wait_time = nominal_time - time.time()
+        if wait_time < -period:
+            # fell behind by more than a period (eg. after a pause), restart the grid here
+            t0 = time.time() - i*period
+            nominal_time = t0 + i*period
+        elif wait_time > 0:
+            yield Msg('sleep', None, wait_time)
+        actual_time = time.time()
+        yield Msg('create')
+        yield Msg('trigger', det, block_group='det')
+        yield Msg('wait', None, 'det')
+        yield Msg('read', det)
+        readout_ohead = max(0., time.time() - actual_time - exposure)
+        tag.put(nominal_time=nominal_time, actual_time=actual_time,
+                overhead=readout_ohead)
+        yield Msg('read', tag)
+        yield Msg('save')
+        # full overhead of this point, including write-out
+        point_ohead = max(0., time.time() - actual_time - exposure)
+        point_log.append((nominal_time, actual_time, point_ohead))
+    yield Msg('close_run')
+
+def _summarize_time_series(point_log, period):
+    ''' report achieved cadence and save measured overheads for later estimates '''
+    if not point_log:
+        return
+    overheads = [el[2] for el in point_log]
+    _yamify_overhead('tseries', overheads)
+    if len(point_log) > 1:
+        actual_times = [el[1] for el in point_log]
+        achieved_period = np.mean(np.diff(actual_times))
+        lag = max(el[1] - el[0] for el in point_log)
+        print('INFO: requested period = {}s -> achieved period = {:.3f}s, largest lag behind schedule = {:.3f}s'
+              .format(period, achieved_period, lag))
+    print('INFO: measured overhead per point = {:.3f}s'.format(np.mean(overheads)))
 
 def _collect_time_series_dryrun(md_dict, real_delay, delay, num):
     print(' === dryrun mode ===')
     num_frame = md_dict['sp_num_frames']
     acq_time = md_dict['sp_time_per_frame']
     period = md_dict['sp_period']
+    computed_exposure = md_dict['sp_computed_exposure']
     #num_sets = md_dict['sp_number_of_sets']
-    est_writeout_ohead = 2 # this might vary
+    est_writeout_ohead = md_dict['sp_estimated_overhead']
     scan_length_s = period*num
     m, s = divmod(scan_length_s, 60)
     h, m = divmod(m, 60)
     scan_length = str("%d:%02d:%02d" % (h, m, s))
-    est_real_scan_length_s = (period+est_writeout_ohead)*num
+    # overhead is taken out of the delay, it only adds up when it doesn't fit in
+    est_real_scan_length_s = max(period, computed_exposure+est_writeout_ohead)*num
     m, s = divmod(est_real_scan_length_s, 60)
     h, m = divmod(m, 60)
     est_real_scan_length = str("%d:%02d:%02d" % (h, m, s))
@@ -724,8 +1549,8 @@ def _collect_time_series_dryrun(md_dict, real_delay, delay, num):
     print('(i.e. accessible as a single tiff file)')
     print('')
     print('There will be a delay of {}s between scans (compared to the requested delay of {} s)'.format(real_delay, delay))
-    print('This will result in a nominal period (neglecting readout overheads) of {} s'.format(period))
-    print('Using an estimated write-out overhead of {}s'.format(est_writeout_ohead))
+    print('This will result in a nominal period of {} s'.format(period))
+    print('Using an estimated write-out overhead of {:.3g}s'.format(est_writeout_ohead))
     print('Which results in a total scan time of {}s'.format(est_real_scan_length_s))
     print('Estimated total scan length = {}'.format(est_real_scan_length))
     print('Real outcomes may vary!')
@@ -735,6 +1560,113 @@ def _collect_time_series_dryrun(md_dict, real_delay, delay, num):
     print(md_dict)
     return md_dict
 
+def collect_fast_time_series(scan, exposure=1.0, num=1, det=area_det, subs_dict={}, dryrun=False):
+    '''the xpdAcq function for getting a fast time series scan
+
+    ``num`` sets of summed frames are collected back-to-back, every set
+    triggered and read as its own event right after the previous one,
+    with no delay and no checkpoint in between. Events are labeled by
+    ``ftseries_set_index`` and ``ftseries_set_time``.
+
+    Parameters
+    ----------
+    scan : xpdacq.beamtime.Scan object
+        an object carries all metadata of your experiment
+
+    exposure : float
+        optional. exposure time of each set in seconds
+
+    num : int
+        total number of sets wanted in this fast time series scan
+
+    det : Ophyd object
+        optional. the instance of the detector you are using. by default area_det defined when xpdacq is loaded.
+
+    subs_dict : dict
+        optional. dictionary specifies live feedback options during scans
+
+    dryrun : bool
+        optional. option to specify if a real measurement will be running or not. Default is set to False.
+    '''
+    # every set sums num_frame frames
+    (acq_time, num_frame, computed_exposure) = _setup_exposure(scan, exposure)
+    print('INFO: nominal frame rate of {:.3g} frames/s, {} sets back-to-back'.format(1./acq_time, num))
+    scan.md.update({'sp_period': computed_exposure})
+
+    md_dict = scan.md.snapshot()
+    rate_log = []
+    plan = _multi_set_plan(area_det, num, num_frame, rate_log)
+    if dryrun:
+        _collect_fast_time_series_dryrun(md_dict, num)
+    else:
+        xpdRE(plan, subs_dict, **md_dict)
+        if xpdRE.state == 'paused':
+            _RE_state_wrapper(xpdRE)
+        if rate_log:
+            (elapsed, frame_rate) = rate_log[-1]
+            _yamify_overhead('ftseries', [max(0., elapsed/num - computed_exposure)])
+            print('INFO: {} sets collected in {:.3f}s -> achieved frame rate = {:.3g} frames/s (nominal {:.3g})'
+                  .format(num, elapsed, frame_rate, 1./acq_time))
+
+def _multi_set_plan(det, num_sets, num_frame, rate_log):
+    ''' trigger and read det once per set, back-to-back
+
+    Every set is a trigger, read and save of its own, so the detector
+    hands out the datum of each set itself. There is a single checkpoint
+    before the first set, nothing slows the sets down in between.
+
+    Parameters
+    ----------
+    det : Ophyd object
+        detector to trigger and read for every set
+    num_sets : int
+        number of sets to collect
+    num_frame : int
+        number of frames summed into each set
+    rate_log : list
+        filled with (elapsed_time, achieved_frame_rate) of the acquisition
+    '''
+    tag = _PlanTag('ftseries', ['set_index', 'set_time', 'frame_rate'])
+    yield Msg('open_run')
+    yield Msg('checkpoint')
+    t0 = time.time()
+    for i in range(num_sets):
+        yield Msg('create')
+        yield Msg('trigger', det, block_group='det')
+        yield Msg('wait', None, 'det')
+        # time stamp at the end of the set, rate achieved so far
+        set_time = time.time()
+        frame_rate = (i+1)*num_frame/max(set_time - t0, 1e-6)
+        yield Msg('read', det)
+        tag.put(set_index=i, set_time=set_time, frame_rate=frame_rate)
+        yield Msg('read', tag)
+        yield Msg('save')
+    elapsed = max(time.time() - t0, 1e-6)
+    rate_log.append((elapsed, num_sets*num_frame/elapsed))
+    yield Msg('close_run')
+
+def _collect_fast_time_series_dryrun(md_dict, num):
+    print(' === dryrun mode ===')
+    num_frame = md_dict['sp_num_frames']
+    acq_time = md_dict['sp_time_per_frame']
+    computed_exposure = md_dict['sp_computed_exposure']
+    scan_length_s = computed_exposure*num
+    m, s = divmod(scan_length_s, 60)
+    h, m = divmod(m, 60)
+    scan_length = str("%d:%02d:%02d" % (h, m, s))
+    print('this will execute {} back-to-back sets, one trigger each'.format(num))
+    print('Sample metadata will be: Sample name = {}'.format(md_dict['sa_name'])) # enrich it later
+    print('using the "pe1c" detector (Perkin-Elmer in continuous acquisition mode)')
+    print('in the form of {} frames of {} s summed into each set'.format(num_frame, acq_time))
+    print('and every set saved as its own event (i.e. accessible as a single tiff file)')
+    print('')
+    print('Estimated total scan length = {}, plus the readout of every set'.format(scan_length))
+    print('Real outcomes may vary!')
+    print('')
+    print('The metadata saved with the scan will be:')
+    print(md_dict)
+    return md_dict
+
 # FIXME - not finished yet
 def _get_bluesky_run(mdo, plan, det = area_det, subs_dict={}, **kwargs):
     '''An xpdAcq function for executing a custom (user defined) bluesky plan
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# xpdacq            by Billinge Group
+#                   Simon J. L. Billinge sb2896@columbia.edu
+#                   (c) 2016 trustees of Columbia University in the City of
+#                        New York.
+#                   All rights reserved
+#
+# File coded by:    Timothy Liu, Simon Billinge
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+'''Read/write layer for the yaml files in config_base/yml
+
+Every write goes to a temporary file next to the target which is then
+renamed over it, so a crash never leaves a partially written yaml file.
+Inside ``yaml_store.batch()`` writes are kept in memory and coalesced:
+each file is written once when the outermost batch exits, or earlier if
+the batch stays open longer than glbl.yaml_flush_interval. Reads through
+the store always see pending writes.
+
+Several processes (eg. a second ipython session or an export job) can
+share the same files: every read-modify-write and flush holds an advisory
+fcntl lock on the directory, and updates are replayed on the content read
+under that lock, so concurrent appends to the object, hidden or dark list
+are merged instead of lost. Reads are versioned by inode, mtime and size
+of the file, so an unchanged file is parsed only once. Time spent waiting
+for the lock is reported by ``yaml_store.stats()``.
+
+Content is loaded with the libyaml based safe loader when available
+(pure python safe loader otherwise), which only builds plain python
+types; tuples are kept as ``!!python/tuple``. Files written by older
+versions as pickled python objects can be read with ``load_legacy``,
+which only builds the classes it is given and refuses any other tag.
+'''
+import os
+import copy
+import stat
+import time
+import atexit
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import yaml
+import numpy as np
+from xpdacq.glbl import glbl
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locking on this platform, single process use only
+    fcntl = None
+
+class _Loader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    ''' safe loader that also knows about tuples '''
+
+class _Dumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+    ''' safe dumper that also knows about tuples and numpy scalars '''
+
+_Loader.add_constructor('tag:yaml.org,2002:python/tuple',
+        lambda loader, node: tuple(loader.construct_sequence(node)))
+_Dumper.add_representer(tuple,
+        lambda dumper, data: dumper.represent_sequence('tag:yaml.org,2002:python/tuple', data))
+_Dumper.add_multi_representer(np.generic,
+        lambda dumper, data: dumper.represent_data(data.item()))
+
+class _LegacyLoader(yaml.SafeLoader):
+    ''' safe loader that also builds !!python/object of allowed classes '''
+    def __init__(self, stream, classes):
+        super(_LegacyLoader, self).__init__(stream)
+        self.classes = {'{}.{}'.format(cls.__module__, cls.__name__): cls
+                        for cls in classes}
+
+def _construct_legacy_object(loader, suffix, node):
+    cls = loader.classes.get(suffix)
+    if cls is None:
+        raise yaml.constructor.ConstructorError(None, None,
+                'refusing to construct python object {}'.format(suffix),
+                node.start_mark)
+    obj = cls.__new__(cls)
+    yield obj
+    # filled in afterwards, objects may refer to each other
+    obj.__dict__.update(loader.construct_mapping(node, deep=True))
+
+_LegacyLoader.add_constructor('tag:yaml.org,2002:python/tuple',
+        lambda loader, node: tuple(loader.construct_sequence(node)))
+_LegacyLoader.add_multi_constructor('tag:yaml.org,2002:python/object:',
+        _construct_legacy_object)
+
+def safe_load(stream):
+    ''' load yaml content made of plain python types '''
+    return yaml.load(stream, Loader=_Loader)
+
+def safe_dump(data, stream=None):
+    ''' dump plain python types, readable by safe_load '''
+    return yaml.dump(data, stream, Dumper=_Dumper)
+
+# mkstemp creates files readable by their owner only, files it writes
+# are given the mode a plain open() would give them instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _match_mode(tmp_path, fpath):
+    ''' give tmp_path the mode of fpath, or the default one if fpath is missing '''
+    try:
+        mode = stat.S_IMODE(os.stat(fpath).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+def _atomic_write(fpath, text):
+    ''' write text to fpath through a temporary file and a rename
+
+    Returns the version of the written file, as used for versioned reads.
+    '''
+    fdir = os.path.dirname(os.path.abspath(fpath))
+    (fd, tmp_path) = tempfile.mkstemp(dir=fdir, prefix='.', suffix='.tmp')
+    try:
+        _match_mode(tmp_path, fpath)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+            version = _version(os.fstat(f.fileno()))
+        os.replace(tmp_path, fpath)
+        return version
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _version(st):
+    # a rename keeps inode and mtime, any other writer changes one of them
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class YamlStore(object):
+    ''' yaml files with atomic writes and optional write coalescing
+
+    Content is serialized as soon as it is handed to ``dump``, so objects
+    changed afterwards (eg. a md dict shared between acquire objects) are
+    stored as they were at that moment, as with an immediate write.
+    '''
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        # fpath -> [serialized content or None, list of pending updates]
+        self._pending = OrderedDict()
+        self._timer = None
+        # fpath -> (version, content) of the last read
+        self._cache = {}
+        self._stats = {'reads': 0, 'cache_hits': 0, 'lock_acquisitions': 0,
+                       'lock_wait_time': 0., 'max_lock_wait': 0.}
+
+    def _read(self, fpath):
+        with open(fpath, 'r') as f:
+            version = _version(os.fstat(f.fileno()))
+            self._stats['reads'] += 1
+            cached = self._cache.get(fpath)
+            if cached is not None and cached[0] == version:
+                self._stats['cache_hits'] += 1
+            else:
+                cached = (version, safe_load(f))
+                self._cache[fpath] = cached
+        # callers are free to modify what they get
+        return copy.deepcopy(cached[1])
+
+    @contextmanager
+    def _locked(self, fpath):
+        ''' hold the advisory lock of the directory fpath lives in '''
+        if fcntl is None:
+            yield
+            return
+        lock_path = os.path.join(os.path.dirname(os.path.abspath(fpath)), '.lock')
+        with open(lock_path, 'a') as f:
+            t0 = time.time()
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            wait = time.time() - t0
+            self._stats['lock_acquisitions'] += 1
+            self._stats['lock_wait_time'] += wait
+            self._stats['max_lock_wait'] = max(self._stats['max_lock_wait'], wait)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def load_legacy(self, fpath, classes):
+        ''' load a file pickled by older versions, python objects included
+
+        Only meant for migrating files of the acquire object store, never
+        cached. Only ``!!python/object`` tags of the given classes are
+        built, any other python tag raises a ConstructorError, so loading
+        a file never runs code.
+
+        Parameters
+        ----------
+        fpath : str
+            full path to the yaml file
+        classes : list
+            classes the file may contain
+        '''
+        with self._lock, open(fpath, 'r') as f:
+            loader = _LegacyLoader(f, classes)
+            try:
+                return loader.get_single_data()
+            finally:
+                loader.dispose()
+
+    def stats(self):
+        ''' counters of reads, versioned-read cache hits and lock waits (in s) '''
+        with self._lock:
+            return dict(self._stats)
+
+    def version(self, fpath):
+        ''' current version of fpath, None if missing or not flushed yet '''
+        with self._lock:
+            if fpath in self._pending:
+                return None
+            try:
+                return _version(os.stat(fpath))
+            except FileNotFoundError:
+                return None
+
+    def exists(self, fpath):
+        with self._lock:
+            return fpath in self._pending or os.path.isfile(fpath)
+
+    def _replay(self, fpath, text, ops):
+        ''' content of fpath after the pending dump (text) and updates (ops) '''
+        if text is not None:
+            data = safe_load(text)
+        elif ops and ops[0][1] and not os.path.isfile(fpath):
+            data = None
+        else:
+            data = self._read(fpath)
+        for (op, _) in ops:
+            data = op(data)
+        return data
+
+    def load(self, fpath):
+        ''' content of fpath, including writes that are not flushed yet '''
+        with self._lock:
+            if fpath not in self._pending:
+                return self._read(fpath)
+            (text, ops) = self._pending[fpath]
+            return self._replay(fpath, text, ops)
+
+    def dump(self, data, fpath):
+        ''' replace content of fpath with data '''
+        text = safe_dump(data)
+        with self._lock:
+            if self._depth:
+                self._pending[fpath] = [text, []]
+                self._schedule_flush()
+            else:
+                with self._locked(fpath):
+                    _atomic_write(fpath, text)
+
+    def update(self, fpath, func, missing_ok=False):
+        ''' read-modify-write of fpath
+
+        Parameters
+        ----------
+        fpath : str
+            full path to the yaml file
+        func : callable
+            takes current content and returns the new one
+        missing_ok : bool
+            optional. create fpath if it doesn't exist, func then gets
+            None. Checked under the lock, so two processes creating the
+            same file don't overwrite each other. Default is False
+        '''
+        with self._lock:
+            if self._depth:
+                self._pending.setdefault(fpath, [None, []])[1].append((func, missing_ok))
+                self._schedule_flush()
+            else:
+                with self._locked(fpath):
+                    if missing_ok and not os.path.isfile(fpath):
+                        data = func(None)
+                    else:
+                        data = func(self._read(fpath))
+                    version = _atomic_write(fpath, safe_dump(data))
+                    self._cache[fpath] = (version, copy.deepcopy(data))
+
+    def flush(self):
+        ''' write all pending content to disk '''
+        with self._lock:
+            self._cancel_timer()
+            while self._pending:
+                (fpath, (text, ops)) = self._pending.popitem(last=False)
+                with self._locked(fpath):
+                    if ops:
+                        # replay on what is on disk now, to merge with other processes
+                        text = safe_dump(self._replay(fpath, text, ops))
+                    _atomic_write(fpath, text)
+
+    @contextmanager
+    def batch(self):
+        ''' coalesce writes until the outermost batch exits '''
+        with self._lock:
+            self._depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if not self._depth:
+                    self.flush()
+
+    def _schedule_flush(self):
+        if self._timer is None and glbl.yaml_flush_interval:
+            self._timer = threading.Timer(glbl.yaml_flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+yaml_store = YamlStore()
+atexit.register(yaml_store.flush)